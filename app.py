@@ -5,17 +5,32 @@
 認証機能なし、CSV/JSONファイル管理
 """
 
+import os
 import streamlit as st
 from pathlib import Path
 from utils.data_manager import *
 from utils.file_processor import *
 from utils.ai_scoring import *
 from utils.visualization import *
-from utils.award_manager import determine_awards, format_awards_display
+from utils.award_manager import format_awards_display
 from utils.data_persistence_helper import ensure_data_directory, show_data_persistence_info, check_data_persistence
-from utils.rescoring import rescore_submission
-from utils.certificate_generator import generate_certificate_for_result
-from utils.backup_restore import create_backup, restore_backup, get_backup_info
+from utils.rescoring import rescore_submission, score_and_save, ScoringError
+from utils.certificate_generator import generate_certificate_for_result, export_all_certificates
+from utils.analytics import (
+    get_score_frame, criterion_statistics, score_distribution, prefecture_breakdown, criterion_correlations
+)
+from utils.blob_store import store_uploaded_file, collect_garbage
+from utils.backup_restore import write_backup, restore_backup, get_backup_info, get_backup_dir
+from utils.response_cache import get_response_cache
+from utils.rate_limiter import get_rate_limiter, describe_limits, get_interactive_max_wait
+from utils.retry_policy import get_retry_metrics
+from utils.telemetry import get_telemetry, get_summary_days, get_summary_since
+from utils.leaderboard import get_leaderboard
+from utils.job_queue import (
+    enqueue_submissions, get_unscored_submission_ids, list_jobs, get_queue_summary,
+    cancel_job, retry_failed_jobs, clear_finished_jobs, start_worker, stop_worker,
+    get_worker_status
+)
 import pandas as pd
 
 # 環境変数からAPIキーを初期化（Streamlit Cloud用）
@@ -24,6 +39,34 @@ initialize_from_env()
 # データディレクトリの初期化（永続化のため）
 ensure_data_directory()
 
+# 一括採点キューに未完了のジョブがあれば、ワーカーを起動して再開
+if is_api_configured() and not get_worker_status()["running"]:
+    queue_summary = get_queue_summary()
+    if queue_summary["queued"] or queue_summary["running"]:
+        start_worker()
+
+# デバッグ情報の表示（環境変数 APP_DEBUG=1 で有効）
+DEBUG_UI = os.getenv("APP_DEBUG", "0").strip().lower() in ("1", "true", "yes")
+
+# 一覧の1ページあたりの表示件数の選択肢
+RANKING_PAGE_SIZES = [10, 25, 50, 100]
+
+def render_pagination(total: int, page_size: int, key: str) -> int:
+    """ページ送りを表示し、表示するページの先頭の位置（offset）を返す"""
+    page_count = max(1, -(-total // page_size))
+    # 検索条件の変更で件数が減った場合は、範囲内のページに戻す
+    if st.session_state.get(key, 1) > page_count:
+        st.session_state[key] = page_count
+    if page_count == 1:
+        return 0
+    col1, col2 = st.columns([1, 5])
+    with col1:
+        page_number = st.number_input("ページ", min_value=1, max_value=page_count, step=1, key=key)
+    with col2:
+        start = (page_number - 1) * page_size
+        st.caption(f"{total}件中 {start + 1}-{min(total, start + page_size)}件目（全{page_count}ページ）")
+    return (page_number - 1) * page_size
+
 # ページ設定
 st.set_page_config(
     page_title="ピッチコンテストAI採点システム",
@@ -51,6 +94,7 @@ pages = [
     "⚙️ API設定",
     "📝 採点ワークフロー",
     "🏫 参加校管理",
+    "📦 一括採点",
     "💾 データ管理"
 ]
 
@@ -177,10 +221,57 @@ if page == "⚙️ API設定":
         - セキュアに暗号化されて保存されます
         """)
     
+    # 採点モードの設定
+    st.markdown("---")
+    st.markdown("### 採点モード")
+    scoring_mode_labels = {
+        "per_criterion": "評価項目ごとに採点（6回呼び出し）",
+        "combined": "一括採点（提出資料を1回だけ送信）",
+    }
+    selected_mode = st.radio(
+        "採点モードを選択",
+        list(scoring_mode_labels.keys()),
+        index=list(scoring_mode_labels.keys()).index(get_scoring_mode()),
+        format_func=lambda mode: scoring_mode_labels[mode],
+        help="一括採点は入力トークンと待ち時間を大幅に削減できます。形式が正しくない項目は自動的に評価項目ごとの採点でやり直します。"
+    )
+    if selected_mode != get_scoring_mode():
+        set_scoring_mode(selected_mode)
+        st.success(f"✅ 採点モードを「{scoring_mode_labels[selected_mode]}」に変更しました")
+    
     # APIキーの状態確認
     st.markdown("---")
-    if is_api_configured():
+    ai_client = get_client()
+    if ai_client is not None:
         st.success("✅ APIキーが設定されています")
+        current_provider = ai_client.provider
+        usage = get_rate_limiter().usage(current_provider)
+        st.caption(
+            f"レート制限（{current_provider}、このホストの全セッションで共有）: "
+            f"直近1分 {usage['minute_requests']}/{usage['rpm'] or '無制限'}リクエスト・"
+            f"{usage['minute_tokens']:,}/{usage['tpm'] or '無制限'}トークン、"
+            f"直近24時間 {usage['day_requests']}/{usage['rpd'] or '無制限'}リクエスト"
+        )
+        if current_provider == "gemini":
+            model_name = get_gemini_model_name(ai_client)
+            if model_name:
+                st.caption(f"使用中のGeminiモデル: {model_name}")
+            if st.button("🔍 Geminiモデルを再確認"):
+                try:
+                    health = check_gemini_health(ai_client)
+                    st.success(f"✅ 使用するモデル: {health['model']}")
+                except Exception as e:
+                    st.error(f"エラー: {str(e)}")
+        
+        retry_stats = get_retry_metrics()["providers"].get(current_provider)
+        if retry_stats:
+            circuit_labels = {"closed": "正常", "open": "一時停止中", "half_open": "再開を確認中"}
+            st.caption(
+                f"API呼び出し（このプロセスの起動後）: 試行 {retry_stats['attempts']}回、"
+                f"成功 {retry_stats['success']}回、リトライ {retry_stats['retry']}回、"
+                f"失敗 {retry_stats['failed']}回、待機 {retry_stats['wait_seconds']:.0f}秒 / "
+                f"状態: {circuit_labels.get(retry_stats['circuit_state'], retry_stats['circuit_state'])}"
+            )
     else:
         st.warning("⚠️ APIキーが設定されていません。上記で設定してください。")
 
@@ -193,18 +284,18 @@ if page == "🏠 ダッシュボード":
     
     schools = get_all_schools()
     submissions = get_all_submissions()
-    results = get_all_evaluation_results()
-    completed_results = [r for r in results if r["evaluation_status"] == "completed"]
+    # 採点完了結果の順位・賞は差分更新されるランキングから取得
+    leaderboard = get_leaderboard()
+    completed_count = leaderboard.count()
     
     with col1:
         st.metric("参加校数", len(schools))
     with col2:
         st.metric("提出資料数", len(submissions))
     with col3:
-        st.metric("採点完了数", len(completed_results))
+        st.metric("採点完了数", completed_count)
     with col4:
-        avg_score = sum(r["total_score"] for r in completed_results) / len(completed_results) if completed_results else 0
-        st.metric("平均スコア", f"{avg_score:.1f}/60")
+        st.metric("平均スコア", f"{leaderboard.average_score():.1f}/60")
     
     # データ変更の通知とバックアップ推奨
     if st.session_state.get('data_changed', False):
@@ -225,40 +316,54 @@ if page == "🏠 ダッシュボード":
     # ランキング表示（総合スコア順）
     st.subheader("🏆 採点結果ランキング")
     
-    # デバッグ情報を表示
-    with st.expander("🔍 デバッグ情報", expanded=True):
-        st.write(f"completed_results数: {len(completed_results)}")
-        if completed_results:
-            st.write("最初のcompleted_resultの内容:")
-            st.json(completed_results[0])
-    
-    if completed_results:
-        # 総合スコアでソート（高い順）
-        sorted_results = sorted(completed_results, 
-                               key=lambda x: x.get('total_score', 0), 
-                               reverse=True)
+    # デバッグ情報を表示（環境変数 APP_DEBUG=1 の場合のみ）
+    if DEBUG_UI:
+        with st.expander("🔍 デバッグ情報", expanded=False):
+            st.write(f"completed_results数: {completed_count}")
+            if completed_count:
+                st.write("最初のcompleted_resultの内容:")
+                st.json(leaderboard.page(0, 1)[0])
+    
+    if completed_count:
+        # 賞を判定
+        awards_dict = leaderboard.awards()
         
-        # デバッグ情報
-        with st.expander("🔍 デバッグ情報（ソート後）", expanded=True):
-            st.write(f"sorted_results数: {len(sorted_results)}")
-            if sorted_results:
-                st.write("最初のsorted_resultの内容:")
-                st.json(sorted_results[0])
+        # 検索・絞り込み（表示するページの分だけを取得するため、件数が増えても描画量は一定）
+        award_filter_labels = {"all": "すべて", "awarded": "受賞のみ", "special": "特別審査員賞のみ"}
+        col1, col2, col3 = st.columns([3, 2, 1])
+        with col1:
+            search_text = st.text_input("参加校名・テーマで検索", key="ranking_search")
+        with col2:
+            award_filter = st.selectbox("絞り込み", list(award_filter_labels.keys()),
+                                        format_func=lambda key: award_filter_labels[key],
+                                        key="ranking_award_filter")
+        with col3:
+            page_size = st.selectbox("表示件数", RANKING_PAGE_SIZES, index=1, key="ranking_page_size")
         
-        # 賞を判定
-        awards_dict = determine_awards(completed_results)
+        _, matched_count = leaderboard.search(search_text, award_filter, 0, 0)
+        offset = render_pagination(matched_count, page_size, "ranking_page")
+        sorted_results, _ = leaderboard.search(search_text, award_filter, offset, page_size)
+        
+        if DEBUG_UI:
+            with st.expander("🔍 デバッグ情報（ソート後）", expanded=False):
+                st.write(f"sorted_results数: {len(sorted_results)} / 一致: {matched_count}")
+                if sorted_results:
+                    st.write("最初のsorted_resultの内容:")
+                    st.json(sorted_results[0])
+        
+        if not sorted_results:
+            st.info("条件に一致する採点結果がありません")
         
         # ランキングデータを作成
         ranking_data = []
-        for rank, result in enumerate(sorted_results, 1):
+        for result in sorted_results:
             result_id = result.get('id')
             school_name = result.get('school_name', '不明')
             theme_title = result.get('theme_title', '不明')
             total_score = result.get('total_score', 0)
             
             # 賞を取得
-            awards = awards_dict.get(result_id, [])
-            awards_text = format_awards_display(awards)
+            awards_text = format_awards_display(result.get('awards', []))
             
             # 校名と賞を結合
             school_with_award = school_name
@@ -266,7 +371,7 @@ if page == "🏠 ダッシュボード":
                 school_with_award = f"{school_name} {awards_text}"
             
             ranking_data.append({
-                "順位": rank,
+                "順位": result['rank'],
                 "参加校": school_with_award,
                 "テーマ": theme_title,
                 "総合スコア": f"{total_score}/60",
@@ -274,40 +379,26 @@ if page == "🏠 ダッシュボード":
             })
         
         # ランキングテーブルを表示（result_idは非表示）
-        df_ranking = pd.DataFrame(ranking_data)
-        df_display = df_ranking[["順位", "参加校", "テーマ", "総合スコア"]].copy()
-        st.dataframe(df_display, width='stretch', use_container_width=True, hide_index=True)
+        if ranking_data:
+            df_ranking = pd.DataFrame(ranking_data)
+            df_display = df_ranking[["順位", "参加校", "テーマ", "総合スコア"]].copy()
+            st.dataframe(df_display, width='stretch', use_container_width=True, hide_index=True)
         
-        # 削除ボタンを各行に追加
+        # 削除ボタン（上のランキングと同じページ・条件の結果だけを表示）
         st.markdown("---")
         st.markdown("### 🗑️ 採点結果の削除")
         
-        # デバッグ情報
-        st.write(f"**削除ボタン表示前の確認**: sorted_results数={len(sorted_results)}")
-        
-        # 各行に削除ボタンを追加（sorted_resultsを直接使用）
         if len(sorted_results) == 0:
             st.info("削除対象の採点結果がありません")
         else:
-            st.write(f"**削除ボタンのループ開始**: {len(sorted_results)}件の結果に対してループを実行します")
-            # テーブル形式で削除ボタンを表示
-            for rank_idx, result in enumerate(sorted_results, 1):
+            st.caption(f"上のランキングに表示中の{len(sorted_results)}件（全{matched_count}件）")
+            for result in sorted_results:
+                rank_idx = result['rank']
                 result_id = result.get('id')
                 school_name = result.get('school_name', '不明')
                 theme_title = result.get('theme_title', '不明')
-                total_score = result.get('total_score', 0)
-                
-                # result_idがNoneの場合はスキップ
-                if result_id is None:
-                    st.warning(f"⚠️ {rank_idx}位: result_idがNoneです（スキップします）")
-                    continue
-                
-                # デバッグ情報
-                st.write(f"**処理中**: {rank_idx}位 - {school_name} (result_id={result_id})")
                 
-                # 賞を取得
-                awards = awards_dict.get(result_id, [])
-                awards_text = format_awards_display(awards)
+                awards_text = format_awards_display(result.get('awards', []))
                 school_with_award = school_name
                 if awards_text:
                     school_with_award = f"{school_name} {awards_text}"
@@ -326,7 +417,8 @@ if page == "🏠 ダッシュボード":
                     st.markdown(theme_title)
                 with col4:
                     delete_key = f"delete_ranking_{result_id}_{rank_idx}"
-                    st.write(f"削除ボタンキー: {delete_key}")
+                    if DEBUG_UI:
+                        st.caption(f"削除ボタンキー: {delete_key}")
                     
                     if st.session_state[f"pending_delete_{result_id}"]:
                         # 確認モード
@@ -342,19 +434,8 @@ if page == "🏠 ダッシュボード":
                                     
                                     # 採点結果を削除（評価詳細も自動削除される）
                                     if delete_evaluation_result(result_id):
-                                        # 関連するファイルも削除（物理ファイルも削除）
+                                        # 関連するファイル情報も削除（他の提出資料から参照されていないファイルは自動で削除される）
                                         if submission_id:
-                                            # ファイルの物理削除も実行
-                                            files = get_files_by_submission(submission_id)
-                                            for file_info in files:
-                                                file_path = Path(file_info.get('file_path', ''))
-                                                if file_path.exists():
-                                                    try:
-                                                        file_path.unlink()
-                                                    except Exception as e:
-                                                        st.warning(f"ファイル削除エラー: {e}")
-                                            
-                                            # ファイルメタデータを削除
                                             delete_files_by_submission(submission_id)
                                         
                                         st.success(f"✅ 「{school_name}」の採点結果を削除しました")
@@ -393,33 +474,129 @@ if page == "🏠 ダッシュボード":
         st.markdown("---")
         st.subheader("📜 表彰状")
         
-        # 賞を獲得した学校の表彰状を表示
+        # 賞を獲得した学校の表彰状を表示（検索・ページに関係なくすべての受賞校）
         award_winners = []
         for result_id, awards in awards_dict.items():
             if awards:
-                result = next((r for r in sorted_results if r.get('id') == result_id), None)
+                result = leaderboard.get_entry(result_id)
                 if result:
                     award_winners.append((result, awards))
         
         if award_winners:
+            # すべての表彰状をまとめてダウンロード（データが変わるまでは前回のZIPファイルを使う）
+            if st.button("📦 すべての表彰状をZIPで出力", key="export_certificates"):
+                try:
+                    with st.spinner("表彰状を出力しています..."):
+                        st.session_state.certificate_archive = str(export_all_certificates()[0])
+                except Exception as e:
+                    st.error(f"表彰状の出力に失敗しました: {str(e)}")
+            archive_path = Path(st.session_state.get("certificate_archive", ""))
+            if archive_path.is_file():
+                st.download_button(
+                    label="📥 表彰状（ZIP）をダウンロード",
+                    data=archive_path.read_bytes(),
+                    file_name=f"certificates_{datetime.now().strftime('%Y%m%d')}.zip",
+                    mime="application/zip",
+                    key="download_certificates"
+                )
+            
             for result, awards in award_winners:
                 school_name = result.get('school_name', '不明')
                 theme_title = result.get('theme_title', '不明')
                 
                 with st.expander(f"🏆 {school_name} - {theme_title}", expanded=False):
-                    certificates = generate_certificate_for_result(
-                        result,
-                        awards,
-                        completed_results
-                    )
-                    
-                    for award_type, certificate_text in certificates.items():
-                        st.markdown(certificate_text)
-                        st.markdown("---")
+                    # 表彰状は表示するときにだけ生成する（生成した文章はキャッシュされる）
+                    if st.toggle("表彰状を表示", key=f"show_certificate_{result.get('id')}"):
+                        certificates = generate_certificate_for_result(result, awards)
+                        
+                        for award_type, certificate_text in certificates.items():
+                            st.markdown(certificate_text)
+                            st.markdown("---")
         else:
             st.info("まだ賞を獲得した学校がありません。")
     else:
         st.info("まだ採点結果がありません")
+    
+    # 採点の統計（スコア行列はデータが変わったときだけ作り直す）
+    if completed_count:
+        st.markdown("---")
+        st.subheader("📈 採点の統計")
+        score_frame = get_score_frame()
+        
+        st.markdown("**評価項目ごとの統計**")
+        st.dataframe(criterion_statistics(score_frame).round(2), use_container_width=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**総合スコアの分布**")
+            st.bar_chart(score_distribution(score_frame).set_index("総合スコア"))
+        with col2:
+            st.markdown("**都道府県ごとの平均**")
+            st.dataframe(prefecture_breakdown(score_frame).round(1), use_container_width=True)
+        
+        if completed_count >= 2:
+            st.plotly_chart(create_correlation_heatmap(criterion_correlations(score_frame)),
+                            use_container_width=True)
+    
+    # API呼び出しの統計（クォータの見積もり・遅い評価項目の確認用）
+    st.markdown("---")
+    st.subheader("⏱️ API呼び出しの統計")
+    summary_days = get_summary_days()
+    telemetry = get_telemetry().summary(since=get_summary_since(summary_days))
+    if summary_days > 0:
+        st.caption(f"直近{summary_days}日間の呼び出しを集計しています")
+    if telemetry["calls"]:
+        def format_ms(value):
+            return f"{value / 1000:.1f}秒" if value is not None else "-"
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("呼び出し数", f"{telemetry['calls']:,}",
+                      help=f"エラー {telemetry['errors']}件、リトライ {telemetry['retries']}回")
+        with col2:
+            st.metric("応答時間 p50 / p95",
+                      f"{format_ms(telemetry['p50_ms'])} / {format_ms(telemetry['p95_ms'])}")
+        with col3:
+            tokens_per_submission = telemetry["tokens_per_submission"]
+            st.metric("1校あたりのトークン数",
+                      f"{tokens_per_submission:,.0f}" if tokens_per_submission is not None else "-")
+        with col4:
+            st.metric("推定コスト", f"${telemetry['cost_usd']:.2f}",
+                      help="モデルごとの公開料金からの推定値です（実際の請求額とは異なる場合があります）")
+        
+        criteria_names = {c['id']: c['criterion_name'] for c in get_all_criteria()}
+        criterion_rows = [
+            {
+                "評価項目": "一括採点" if key == "combined" else criteria_names.get(int(key), f"項目{key}"),
+                "呼び出し数": stats["calls"],
+                "p50（秒）": round(stats["p50_ms"] / 1000, 2) if stats["p50_ms"] is not None else None,
+                "p95（秒）": round(stats["p95_ms"] / 1000, 2) if stats["p95_ms"] is not None else None,
+                "平均トークン数": round(stats["avg_tokens"]),
+            }
+            for key, stats in sorted(telemetry["by_criterion"].items(),
+                                     key=lambda item: (item[0] == "combined", item[0]))
+            if key != "None"
+        ]
+        if criterion_rows:
+            st.markdown("**評価項目ごとの応答時間**")
+            st.dataframe(pd.DataFrame(criterion_rows), use_container_width=True, hide_index=True)
+        
+        # テーマ（コンテスト）ごとの推定コスト
+        themes = {s['id']: s.get('theme_title') or '（テーマなし）' for s in submissions}
+        spend = {}
+        for submission_id, usage in telemetry["by_submission"].items():
+            theme = themes.get(submission_id, '（削除済み）')
+            entry = spend.setdefault(theme, {"テーマ": theme, "提出資料数": 0, "トークン数": 0, "推定コスト（USD）": 0.0})
+            entry["提出資料数"] += 1
+            entry["トークン数"] += usage["tokens"]
+            entry["推定コスト（USD）"] += usage["cost_usd"]
+        if spend:
+            st.markdown("**テーマごとの推定コスト**")
+            spend_df = pd.DataFrame(list(spend.values()))
+            spend_df["推定コスト（USD）"] = spend_df["推定コスト（USD）"].round(3)
+            st.dataframe(spend_df, use_container_width=True, hide_index=True)
+    else:
+        st.info("まだAPI呼び出しの記録がありません")
 
 # 採点ワークフロー（1ページに統合）
 elif page == "📝 採点ワークフロー":
@@ -511,6 +688,16 @@ elif page == "📝 採点ワークフロー":
     if not is_api_configured():
         st.warning("⚠️ APIキーが設定されていません。「⚙️ API設定」ページでAPIキーを設定してください。")
     
+    # 再採点時はキャッシュを使わずに採点し直すこともできる
+    force_rescore = False
+    if is_rescore_mode:
+        force_rescore = st.checkbox(
+            "キャッシュを使わずに採点し直す",
+            value=False,
+            key="workflow_force_rescore",
+            help="同じ資料・同じモデルで採点済みの項目は、通常は保存済みの採点結果を再利用します。"
+        )
+    
     # 実行ボタン
     execute_disabled = not (theme_title and uploaded_files and is_api_configured())
     if st.button("🚀 AI採点を実行", type="primary", disabled=execute_disabled, key="workflow_execute"):
@@ -530,56 +717,35 @@ elif page == "📝 採点ワークフロー":
                         # 提出資料を更新
                         update_submission(submission_id, theme_title, theme_description)
                         
-                        # 既存のファイルを削除（物理ファイルも削除）
-                        existing_files = get_files_by_submission(submission_id)
-                        for file_info in existing_files:
-                            file_path = Path(file_info['file_path'])
-                            if file_path.exists():
-                                try:
-                                    file_path.unlink()
-                                except Exception as e:
-                                    pass  # ファイル削除に失敗しても続行
-                        
-                        # ファイル情報を削除
+                        # 既存のファイル情報を削除（参照されなくなったファイルは自動で削除される）
                         delete_files_by_submission(submission_id)
-                        
-                        # 新しいファイルを保存
-                        upload_dir = Path("uploads") / str(submission_id)
-                        upload_dir.mkdir(parents=True, exist_ok=True)
                     else:
                         # 新規提出資料を作成
                         submission_id = create_submission(school_id, theme_title, theme_description)
-                        
-                        # ファイルを保存
-                        upload_dir = Path("uploads") / str(submission_id)
-                        upload_dir.mkdir(parents=True, exist_ok=True)
                     
-                    # ファイルをアップロードして保存
+                    # ファイルを保存（内容のハッシュごとに1つだけ保存し、同じ資料の再アップロードでは複製しない）
                     files = []
                     for uploaded_file in uploaded_files:
-                        file_path = save_uploaded_file(uploaded_file, upload_dir)
-                        file_size = get_file_size(file_path)
+                        file_path, content_sha256, file_size = store_uploaded_file(uploaded_file)
                         file_type = get_file_type(file_path)
                         
-                        create_file(submission_id, uploaded_file.name, str(file_path),
-                                   file_type, file_size)
+                        file_id = create_file(submission_id, uploaded_file.name, str(file_path),
+                                             file_type, file_size, content_sha256=content_sha256)
                         files.append({
+                            'id': file_id,
                             'file_name': uploaded_file.name,
-                            'file_path': str(file_path)
+                            'file_path': str(file_path),
+                            'content_sha256': content_sha256
                         })
                     
                     update_submission_status(submission_id, "completed")
                     
-                    # ファイルからテキストを抽出
-                    all_text = ""
-                    for file_info in files:
-                        file_path = Path(file_info['file_path'])
-                        if file_path.exists():
-                            try:
-                                text = extract_text_from_file(file_path)
-                                all_text += f"\n\n=== {file_info['file_name']} ===\n\n{text}"
-                            except Exception as e:
-                                st.warning(f"{file_info['file_name']}のテキスト抽出に失敗: {str(e)}")
+                    # ファイルからテキストを抽出（抽出済みのテキストは再採点時に再利用される）
+                    all_text = extract_submission_text(
+                        files,
+                        on_error=lambda file_info, e: st.warning(
+                            f"{file_info['file_name']}のテキスト抽出に失敗: {str(e)}")
+                    )
                     
                     if not all_text.strip():
                         st.error("テキストを抽出できませんでした")
@@ -601,9 +767,6 @@ elif page == "📝 採点ワークフロー":
                                     key=lambda x: x.get('evaluated_at', '') or ''
                                 )
                                 result_id = latest_result.get('id')
-                                
-                                # 既存の評価詳細を削除
-                                delete_evaluation_details(result_id)
                             else:
                                 # 既存の結果がない場合は新規作成
                                 result_id = create_evaluation_result(submission_id,
@@ -615,50 +778,52 @@ elif page == "📝 採点ワークフロー":
                                                                 evaluated_by=None,
                                                                 ai_model="gpt-4")
                         
-                        # 各評価項目について採点
+                        # 各評価項目について採点（並列実行、完了した項目から進捗を表示）
                         criteria = get_all_criteria()
-                        total_score = 0
                         
                         progress_bar = st.progress(0)
                         status_text = st.empty()
+                        status_text.text(f"{len(criteria)}項目を並列で採点中...")
+                        scoring_provider = get_client().provider
                         
-                        for idx, criterion in enumerate(criteria):
-                            status_text.text(f"評価項目 {idx+1}/{len(criteria)}: {criterion['criterion_name']} を採点中...")
-                            progress_bar.progress((idx + 1) / len(criteria))
+                        def show_criterion_progress(result, completed, total):
+                            criterion_name = result['criterion_name']
+                            status_text.text(f"評価項目 {completed}/{total}: {criterion_name} の採点が完了しました")
+                            progress_bar.progress(completed / total)
                             
-                            try:
-                                result = evaluate_criterion(all_text, criterion['id'])
-                                score = result.get('score', 0)
-                                reason = result.get('reason', '')
-                                
-                                create_evaluation_detail(result_id, criterion['id'],
-                                                       score, reason)
-                                total_score += score
-                            except Exception as e:
-                                error_msg = str(e)
-                                # レート制限エラーの場合は詳細なメッセージを表示
-                                if "429" in error_msg or "rate limit" in error_msg.lower() or "quota" in error_msg.lower():
-                                    st.error(f"⚠️ 評価項目 {criterion['criterion_name']} の採点でレート制限エラーが発生しました")
-                                    st.error(error_msg)
-                                    st.warning("💡 Google Gemini APIのレート制限に達しました。無料プランの場合、1分あたり5リクエスト、1日あたり25リクエストに制限されています。")
-                                    st.info("📌 対処方法：\n1. 1-2分待ってから再度お試しください\n2. 有料プランにアップグレードすると制限が緩和されます\n3. Google Cloud ConsoleでAPIの利用状況を確認してください")
-                                # 403エラーの場合は詳細なメッセージを表示
-                                elif "403" in error_msg or "Forbidden" in error_msg:
-                                    st.error(f"❌ 評価項目 {criterion['criterion_name']} の採点でエラーが発生しました")
-                                    st.error(error_msg)
-                                    st.warning("💡 APIキーの設定を確認してください。「⚙️ API設定」ページで再設定できます。")
-                                else:
-                                    st.error(f"❌ 評価項目 {criterion['criterion_name']} の採点でエラーが発生しました")
-                                    st.error(error_msg)
-                                
-                                create_evaluation_detail(result_id, criterion['id'], 0,
-                                                       f"採点エラー: {error_msg}")
+                            error_msg = result.get('error')
+                            if error_msg is None:
+                                return
+                            # レート制限エラーの場合は詳細なメッセージを表示
+                            if "429" in error_msg or "rate limit" in error_msg.lower() or "quota" in error_msg.lower():
+                                st.error(f"⚠️ 評価項目 {criterion_name} の採点でレート制限エラーが発生しました")
+                                st.error(error_msg)
+                                st.warning(f"💡 APIのレート制限に達しました。このアプリの上限（{scoring_provider}）: {describe_limits(scoring_provider)}")
+                                st.info("📌 対処方法：\n1. 1-2分待ってから再度お試しください\n2. 有料プランにアップグレードすると制限が緩和されます\n3. Google Cloud ConsoleでAPIの利用状況を確認してください")
+                            # 403エラーの場合は詳細なメッセージを表示
+                            elif "403" in error_msg or "Forbidden" in error_msg:
+                                st.error(f"❌ 評価項目 {criterion_name} の採点でエラーが発生しました")
+                                st.error(error_msg)
+                                st.warning("💡 APIキーの設定を確認してください。「⚙️ API設定」ページで再設定できます。")
+                            else:
+                                st.error(f"❌ 評価項目 {criterion_name} の採点でエラーが発生しました")
+                                st.error(error_msg)
                         
-                        # 採点結果を更新
-                        update_evaluation_result(result_id, total_score, "completed")
+                        def show_rate_limit_wait(seconds):
+                            status_text.text(f"⏳ レート制限のため、約{int(seconds) + 1}秒待ってから送信します...")
                         
-                        progress_bar.empty()
-                        status_text.empty()
+                        # 詳細の削除・作成と結果の更新は1つのトランザクションでまとめて書き込む
+                        # （画面からの採点は、レート制限の待ち時間が長すぎる場合は待たずにエラーにする）
+                        try:
+                            total_score = score_and_save(result_id, all_text,
+                                                         replace_existing=is_rescore_mode,
+                                                         on_criterion_done=show_criterion_progress,
+                                                         use_cache=not force_rescore,
+                                                         max_wait=get_interactive_max_wait(),
+                                                         on_rate_limit_wait=show_rate_limit_wait)
+                        finally:
+                            progress_bar.empty()
+                            status_text.empty()
                         
                         if is_rescore_mode:
                             st.success(f"再採点が完了しました！総合スコア: {total_score}/60")
@@ -674,21 +839,13 @@ elif page == "📝 採点ワークフロー":
                             # 採点結果を取得
                             final_result = get_evaluation_result(result_id)
                             if final_result:
-                                # すべての採点結果を取得して賞を判定
-                                all_results = get_all_evaluation_results()
-                                completed_results = [r for r in all_results if r.get("evaluation_status") == "completed"]
-                                awards_dict = determine_awards(completed_results)
-                                
-                                # この採点結果に付与された賞を取得
-                                awards = awards_dict.get(result_id, [])
+                                # この採点結果に付与された賞を取得（ランキングから判定）
+                                leaderboard = get_leaderboard()
+                                awards = leaderboard.get_awards(result_id)
                                 
                                 if awards:
                                     # 表彰状を生成して表示
-                                    certificates = generate_certificate_for_result(
-                                        final_result,
-                                        awards,
-                                        completed_results
-                                    )
+                                    certificates = generate_certificate_for_result(final_result, awards)
                                     
                                     for award_type, certificate_text in certificates.items():
                                         st.markdown(certificate_text)
@@ -716,6 +873,11 @@ elif page == "📝 採点ワークフロー":
                             del st.session_state.workflow_upload_files
                         
                         st.rerun()
+                except ScoringError as e:
+                    # 評価項目ごとのエラーは進捗の表示で詳しく表示済み
+                    st.error(f"❌ {str(e)}")
+                    st.info("採点結果は保存していません（再採点の場合は前回の採点結果が残っています）。"
+                            "時間をおいて再度実行してください。")
                 except Exception as e:
                     st.error(f"エラーが発生しました: {str(e)}")
                     import traceback
@@ -748,33 +910,17 @@ elif page == "🏫 参加校管理":
         # データ一覧
         st.subheader("データ一覧")
         
-        # 採点結果を取得して参加校に紐付ける
-        submissions = get_all_submissions()
-        results = get_all_evaluation_results()
-        completed_results = [r for r in results if r["evaluation_status"] == "completed"]
+        # 参加校 × 評価項目のスコア・採点理由を一括で取得
         criteria = get_all_criteria()
+        score_matrix = get_school_score_matrix()
         
         # 参加校ごとの最新の採点結果と提出資料IDを取得
         school_results = {}
         school_submissions = {}  # 参加校ID -> 提出資料IDのマッピング
-        for result in completed_results:
-            submission_id = result.get('submission_id')
-            if submission_id:
-                submission = next((s for s in submissions if s['id'] == submission_id), None)
-                if submission:
-                    school_id = submission.get('school_id')
-                    if school_id:
-                        # 最新の結果を保持（日付順）
-                        if school_id not in school_results:
-                            school_results[school_id] = result
-                            school_submissions[school_id] = submission_id
-                        else:
-                            # より新しい結果があれば更新
-                            current_date = school_results[school_id].get('evaluated_at', '')
-                            new_date = result.get('evaluated_at', '')
-                            if new_date > current_date:
-                                school_results[school_id] = result
-                                school_submissions[school_id] = submission_id
+        for entry in score_matrix:
+            if entry['result'] is not None:
+                school_results[entry['school']['id']] = entry['result']
+                school_submissions[entry['school']['id']] = entry['submission_id']
         
         # データフレームに採点結果の列を追加
         df = pd.DataFrame(schools)
@@ -790,34 +936,31 @@ elif page == "🏫 参加校管理":
         # 評価理由をまとめる列を追加（総合スコアの後）
         df['採点根拠'] = None
         
-        # 各参加校の採点結果を設定
-        for idx, school in enumerate(schools):
-            school_id = school.get('id')
-            if school_id in school_results:
-                result = school_results[school_id]
-                details = get_evaluation_details(result.get('id'))
-                
-                # 各評価項目のスコアを設定
-                evaluation_reasons = []
-                for detail in details:
-                    criterion_id = detail.get('criterion_id')
-                    criterion = next((c for c in criteria if c['id'] == criterion_id), None)
-                    if criterion:
-                        criterion_name = criterion['criterion_name']
-                        score = detail.get('score', 0)
-                        reason = detail.get('evaluation_reason', '')
-                        df.at[idx, criterion_name] = f"{score}/10"
-                        
-                        # 評価理由を収集（採点根拠列用）
-                        if reason:
-                            evaluation_reasons.append(f"**{criterion_name}**: {reason}")
-                
-                # 総合スコアを設定
-                df.at[idx, '総合スコア'] = f"{result.get('total_score', 0)}/60"
+        # 各参加校の採点結果を設定（score_matrix は schools と同じ順序）
+        for idx, entry in enumerate(score_matrix):
+            result = entry['result']
+            if result is None:
+                continue
+            
+            # 各評価項目のスコアを設定（評価項目の表示順）
+            evaluation_reasons = []
+            for criterion in criteria:
+                if criterion['id'] not in entry['scores']:
+                    continue
+                criterion_name = criterion['criterion_name']
+                df.at[idx, criterion_name] = f"{entry['scores'][criterion['id']]}/10"
                 
-                # 採点根拠を設定（すべての評価理由をまとめる）
-                if evaluation_reasons:
-                    df.at[idx, '採点根拠'] = "\n\n".join(evaluation_reasons)
+                # 評価理由を収集（採点根拠列用）
+                reason = entry['reasons'].get(criterion['id'])
+                if reason:
+                    evaluation_reasons.append(f"**{criterion_name}**: {reason}")
+            
+            # 総合スコアを設定
+            df.at[idx, '総合スコア'] = f"{result.get('total_score', 0)}/60"
+            
+            # 採点根拠を設定（すべての評価理由をまとめる）
+            if evaluation_reasons:
+                df.at[idx, '採点根拠'] = "\n\n".join(evaluation_reasons)
         
         # テーブル表示（列数が多い場合はst.dataframeを使用）
         if not df.empty:
@@ -882,17 +1025,11 @@ elif page == "🏫 参加校管理":
                             certificate_key = f"certificate_{school_id}_{row_idx}"
                             if st.button("📜 表彰状を表示", key=certificate_key):
                                 # 表彰状を表示
-                                all_results = get_all_evaluation_results()
-                                completed_results = [r for r in all_results if r.get("evaluation_status") == "completed"]
-                                awards_dict = determine_awards(completed_results)
-                                awards = awards_dict.get(result_id, [])
+                                leaderboard = get_leaderboard()
+                                awards = leaderboard.get_awards(result_id)
                                 
                                 if awards:
-                                    certificates = generate_certificate_for_result(
-                                        result,
-                                        awards,
-                                        completed_results
-                                    )
+                                    certificates = generate_certificate_for_result(result, awards)
                                     
                                     st.markdown("---")
                                     st.subheader("🏆 表彰状")
@@ -926,6 +1063,164 @@ elif page == "🏫 参加校管理":
     else:
         st.info("参加校が登録されていません")
 
+# 一括採点
+elif page == "📦 一括採点":
+    st.title("📦 一括採点")
+    st.info("複数の提出資料を採点キューに追加し、バックグラウンドで順に採点します。ページを離れても採点は続き、アプリを再起動した場合は中断したジョブから再開します。")
+    
+    if not is_api_configured():
+        st.warning("⚠️ APIキーが設定されていません。「⚙️ API設定」ページでAPIキーを設定してください。")
+    
+    # キューの状態
+    summary = get_queue_summary()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("待機中", summary["queued"])
+    with col2:
+        st.metric("採点中", summary["running"])
+    with col3:
+        st.metric("完了", summary["completed"])
+    with col4:
+        st.metric("失敗", summary["failed"])
+    
+    # ワーカーの状態
+    worker_status = get_worker_status()
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        if worker_status["active"]:
+            current = f"（ジョブ #{worker_status['current_job_id']} を採点中）" if worker_status["current_job_id"] else ""
+            st.success(f"✅ ワーカーが動作しています{current}")
+        elif worker_status["running"]:
+            st.info("⏳ 別のプロセスのワーカーが動作中です。停止すると引き継ぎます。")
+        else:
+            st.warning("⏸️ ワーカーは停止しています")
+    with col2:
+        if st.button("▶️ ワーカーを起動", key="start_scoring_worker",
+                     disabled=worker_status["running"] or not is_api_configured()):
+            start_worker()
+            st.rerun()
+    with col3:
+        if st.button("⏹️ ワーカーを停止", key="stop_scoring_worker", disabled=not worker_status["running"]):
+            stop_worker()
+            st.info("実行中のジョブが終わった時点で停止します")
+    
+    st.divider()
+    
+    # キューへの追加
+    st.subheader("キューに追加")
+    submissions = get_all_submissions()
+    if submissions:
+        unscored_ids = get_unscored_submission_ids()
+        target = st.radio(
+            "対象",
+            ["unscored", "all", "selected"],
+            format_func=lambda value: {
+                "unscored": f"未採点の提出資料（{len(unscored_ids)}件）",
+                "all": f"すべての提出資料（{len(submissions)}件、採点済みは再採点）",
+                "selected": "提出資料を選択",
+            }[value],
+            key="batch_target"
+        )
+        selected_ids = []
+        if target == "selected":
+            submission_labels = {s['id']: f"{s.get('school_name', '不明')} - {s['theme_title']}" for s in submissions}
+            selected_ids = st.multiselect(
+                "提出資料",
+                list(submission_labels.keys()),
+                format_func=lambda submission_id: submission_labels[submission_id],
+                key="batch_selected_submissions"
+            )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            priority = st.number_input("優先度（大きいほど先に採点）", value=0, step=1, key="batch_priority")
+        with col2:
+            force_rescore = st.checkbox("キャッシュを使わずに採点し直す", value=False, key="batch_force_rescore")
+        
+        if st.button("📥 キューに追加", type="primary", key="batch_enqueue"):
+            if target == "unscored":
+                submission_ids = unscored_ids
+            elif target == "all":
+                submission_ids = [s['id'] for s in submissions]
+            else:
+                submission_ids = selected_ids
+            
+            if not submission_ids:
+                st.warning("追加する提出資料がありません")
+            else:
+                job_ids = enqueue_submissions(submission_ids, priority=int(priority),
+                                              use_cache=not force_rescore)
+                if is_api_configured():
+                    start_worker()
+                st.success(f"✅ {len(job_ids)}件の採点ジョブをキューに追加しました")
+                st.rerun()
+    else:
+        st.info("提出資料がありません。「📝 採点ワークフロー」ページから提出資料を登録してください。")
+    
+    st.divider()
+    
+    # ジョブ一覧
+    st.subheader("ジョブ一覧")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("🔄 最新の状態に更新", key="refresh_jobs"):
+            st.rerun()
+    with col2:
+        if st.button("🔁 失敗したジョブを再実行", key="retry_failed_jobs", disabled=summary["failed"] == 0):
+            retried = retry_failed_jobs()
+            if is_api_configured():
+                start_worker()
+            st.success(f"{retried}件のジョブをキューに戻しました")
+            st.rerun()
+    with col3:
+        if st.button("🧹 終了したジョブを削除", key="clear_finished_jobs"):
+            cleared = clear_finished_jobs()
+            st.success(f"{cleared}件のジョブを削除しました")
+            st.rerun()
+    
+    jobs = list_jobs()
+    if jobs:
+        status_labels = {
+            "queued": "⏳ 待機中",
+            "running": "🤖 採点中",
+            "completed": "✅ 完了",
+            "failed": "❌ 失敗",
+            "cancelled": "🚫 取消",
+        }
+        df_jobs = pd.DataFrame([{
+            "ジョブID": job['id'],
+            "状態": status_labels.get(job['status'], job['status']),
+            "学校名": job['school_name'],
+            "テーマ": job['theme_title'],
+            "優先度": job.get('priority', 0),
+            "進捗": f"{job.get('completed_criteria', 0)}/{job.get('total_criteria') or 6}" if job['status'] == "running" else "",
+            "総合スコア": job.get('total_score') if job.get('total_score') is not None else "",
+            "試行回数": job.get('attempts', 0),
+            "エラー": job.get('error') or "",
+        } for job in jobs])
+        st.dataframe(df_jobs, width='stretch', hide_index=True)
+        
+        queued_jobs = [job for job in jobs if job['status'] == "queued"]
+        if queued_jobs:
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                cancel_id = st.selectbox(
+                    "取り消すジョブ",
+                    [job['id'] for job in queued_jobs],
+                    format_func=lambda job_id: next(f"#{j['id']} {j['school_name']}" for j in queued_jobs if j['id'] == job_id),
+                    key="cancel_job_id"
+                )
+            with col2:
+                st.write("")
+                if st.button("🚫 取り消す", key="cancel_job"):
+                    if cancel_job(cancel_id):
+                        st.success(f"ジョブ #{cancel_id} を取り消しました")
+                        st.rerun()
+                    else:
+                        st.error("ジョブを取り消せませんでした（既に採点が始まっている可能性があります）")
+    else:
+        st.info("採点ジョブはありません")
+
 # データ管理
 elif page == "💾 データ管理":
     st.title("💾 データ管理")
@@ -965,6 +1260,29 @@ elif page == "💾 データ管理":
     
     st.divider()
     
+    # 採点応答キャッシュの状態
+    st.subheader("🧠 採点キャッシュ")
+    cache_stats = get_response_cache().stats()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("ヒット数", cache_stats["hits"])
+    with col2:
+        st.metric("ミス数", cache_stats["misses"])
+    with col3:
+        st.metric("保存件数", f"{cache_stats['entries']}/{cache_stats['max_entries']}")
+    st.caption(f"ヒット率: {cache_stats['hit_rate']:.1%}　同じ資料・プロンプト・モデルでの再採点では、保存済みの採点結果を再利用します。")
+    if st.button("キャッシュを削除", key="clear_response_cache"):
+        get_response_cache().clear()
+        st.success("✅ 採点キャッシュを削除しました")
+        st.rerun()
+    
+    # アップロードファイルの整理（どの提出資料からも参照されていないファイルを削除）
+    if st.button("🧹 未使用のアップロードファイルを削除", key="collect_garbage"):
+        gc_stats = collect_garbage()
+        st.success(f"✅ {gc_stats['removed']}件（{gc_stats['freed_bytes']:,} bytes）のファイルを削除しました")
+    
+    st.divider()
+    
     # バックアップと復元
     col1, col2 = st.columns(2)
     
@@ -974,17 +1292,25 @@ elif page == "💾 データ管理":
         
         if st.button("バックアップを作成", key="create_backup", type="primary"):
             try:
-                backup_data = create_backup()
+                # ZIPファイルはディスクに書き出し、変更のないデータは前回のスナップショットを再利用する
+                backup_path = get_backup_dir() / "download" / "backup.zip"
+                with st.spinner("バックアップを作成しています..."):
+                    manifest = write_backup(backup_path)
                 backup_filename = f"pitch_contest_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
                 
-                st.download_button(
-                    label="📥 バックアップをダウンロード",
-                    data=backup_data,
-                    file_name=backup_filename,
-                    mime="application/zip",
-                    key="download_backup"
-                )
+                with open(backup_path, "rb") as backup_data:
+                    st.download_button(
+                        label="📥 バックアップをダウンロード",
+                        data=backup_data,
+                        file_name=backup_filename,
+                        mime="application/zip",
+                        key="download_backup"
+                    )
+                stats = manifest["stats"]
                 st.success("✅ バックアップファイルを作成しました。上記のボタンからダウンロードしてください。")
+                st.caption(f"アップロードファイル: {len(manifest['files'])}件　"
+                           f"新たに保存: {stats['new_objects']}件（{stats['written_bytes']:,} bytes）　"
+                           f"前回から変更なし: {stats['reused_objects']}件")
             except Exception as e:
                 st.error(f"バックアップの作成に失敗しました: {str(e)}")
                 import traceback
@@ -1002,14 +1328,35 @@ elif page == "💾 データ管理":
         )
         
         if uploaded_file is not None:
+            # 書き込まずに検証だけを行う（件数・参照先のない行・処理時間を確認）
+            if st.button("🔍 検証のみ（ドライラン）", key="dry_run_restore"):
+                uploaded_file.seek(0)
+                result = restore_backup(uploaded_file, dry_run=True)
+                if result["success"]:
+                    st.success("✅ 検証に成功しました。このバックアップは復元できます。")
+                else:
+                    st.error("❌ 検証でエラーが見つかりました。")
+                for error in result["errors"]:
+                    st.error(f"- {error}")
+                for warning in result["warnings"]:
+                    st.warning(f"- {warning}")
+                if result["counts"]:
+                    st.dataframe(pd.DataFrame([{"テーブル": key, "件数": count}
+                                               for key, count in result["counts"].items()]),
+                                 use_container_width=True, hide_index=True)
+                st.caption(f"読み込み: {result['timings'].get('read', 0):.2f}秒　"
+                           f"検証: {result['timings'].get('validate', 0):.2f}秒")
+            
             if st.button("復元を実行", key="execute_restore", type="primary"):
                 try:
-                    backup_bytes = uploaded_file.read()
-                    result = restore_backup(backup_bytes)
+                    uploaded_file.seek(0)
+                    result = restore_backup(uploaded_file)
                     
                     if result["success"]:
                         st.success("✅ データの復元が完了しました！")
                         st.info(f"復元されたファイル: {', '.join(result['restored_files'])}")
+                        if result["restored_uploads"]:
+                            st.info(f"復元されたアップロードファイル: {result['restored_uploads']}件")
                         if result["backup_date"]:
                             st.info(f"バックアップ日時: {result['backup_date']}")
                         st.rerun()
@@ -1018,6 +1365,8 @@ elif page == "💾 データ管理":
                         if result["errors"]:
                             for error in result["errors"]:
                                 st.error(f"- {error}")
+                        for warning in result["warnings"]:
+                            st.warning(f"- {warning}")
                 except Exception as e:
                     st.error(f"復元処理中にエラーが発生しました: {str(e)}")
                     import traceback
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""テストの共通設定"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# data_manager は読み込み時にカレントディレクトリへ data/ を作成するため、リポジトリの外で実行する
+os.chdir(tempfile.mkdtemp(prefix="pitch_contest_tests_"))
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """一時ディレクトリの data/・uploads/ を使う（data_manager のストアを作り直す）"""
+    from utils import data_manager
+    from utils.storage import create_store
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("DATA_BACKEND", raising=False)
+    monkeypatch.delenv("BACKUP_DIR", raising=False)
+    data_manager.DATA_DIR.mkdir(exist_ok=True)
+    store = create_store(data_manager.DATA_DIR)
+    store.ensure_tables()
+    monkeypatch.setattr(data_manager, "_store", store)
+    return tmp_path / "data"
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""utils.ai_scoring のクライアント（プロバイダー・APIキー）の扱いのテスト"""
+
+import threading
+
+import pytest
+
+from utils import ai_scoring
+from utils.ai_scoring import create_client, set_api_key, get_client, iter_evaluate_criteria
+
+
+class _NoCache:
+    def get(self, key):
+        return None
+
+    def put(self, key, criterion_id, value):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_env_keys(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setattr(ai_scoring, "get_response_cache", lambda: _NoCache())
+    monkeypatch.setenv("SCORING_MODE", "per_criterion")
+
+
+def test_clients_are_shared_per_provider_and_key():
+    first = create_client("sk-test-a")
+    assert first.provider == "openai"
+    assert create_client("sk-test-a") is first
+    assert create_client("sk-test-b") is not first
+
+
+def test_set_api_key_outside_streamlit_does_not_change_process_state():
+    set_api_key("sk-test-a")
+    assert get_client() is None
+    assert not ai_scoring.is_api_configured()
+
+
+def test_env_key_is_the_fallback(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-env")
+    assert get_client().api_key == "sk-env"
+    explicit = create_client("sk-test-a")
+    assert get_client(explicit) is explicit
+
+
+def test_mismatched_key_and_provider_is_rejected():
+    with pytest.raises(ValueError):
+        create_client("AIzaSy-test", "openai")
+
+
+def test_each_call_uses_the_client_it_was_given(monkeypatch):
+    seen = []
+    lock = threading.Lock()
+
+    def fake_openai(content, criterion_id, client=None):
+        with lock:
+            seen.append(client.api_key)
+        return {"score": 7, "reason": client.api_key}
+
+    monkeypatch.setattr(ai_scoring, "evaluate_with_openai", fake_openai)
+    client_a = create_client("sk-test-a")
+    client_b = create_client("sk-test-b")
+
+    results_a = list(iter_evaluate_criteria("資料A", [1, 2, 3], client=client_a))
+    results_b = list(iter_evaluate_criteria("資料B", [1, 2, 3], client=client_b))
+
+    assert {r["reason"] for r in results_a} == {"sk-test-a"}
+    assert {r["reason"] for r in results_b} == {"sk-test-b"}
+    assert sorted(seen) == ["sk-test-a"] * 3 + ["sk-test-b"] * 3
+
+
+def test_scoring_without_client_fails_clearly():
+    with pytest.raises(ValueError):
+        list(iter_evaluate_criteria("資料", [1]))
+
+
+def test_scoring_mode_is_not_process_state(monkeypatch):
+    assert ai_scoring.set_scoring_mode("Combined") == "combined"
+    assert ai_scoring.get_scoring_mode() == "per_criterion"
+    monkeypatch.setenv("SCORING_MODE", "combined")
+    assert ai_scoring.get_scoring_mode() == "combined"
+    assert ai_scoring.get_scoring_mode("per_criterion") == "per_criterion"
+    with pytest.raises(ValueError):
+        ai_scoring.get_scoring_mode("fast")
+
+
+def test_mode_is_part_of_the_cache_key():
+    assert ai_scoring.prompt_template_hash(1, "combined") != ai_scoring.prompt_template_hash(1, "per_criterion")
+
+
+def _fake_generate(monkeypatch, combined_response):
+    """一括採点の呼び出しには combined_response を、項目ごとの呼び出しには固定の結果を返す"""
+    calls = []
+
+    def generate(prompt, client=None):
+        if "■ 評価項目ID" in prompt:
+            calls.append("combined")
+            return combined_response
+        calls.append("criterion")
+        return '{"score": 4, "reason": "項目ごと"}'
+
+    monkeypatch.setattr(ai_scoring, "_generate_with_openai", generate)
+    return calls
+
+
+def test_combined_mode_scores_all_criteria_in_one_call(monkeypatch):
+    calls = _fake_generate(monkeypatch, """```json
+[{"criterion_id": 1, "score": 8, "reason": "良い"},
+ {"criterion_id": 2, "score": 6.0, "reason": "普通"}]
+```""")
+    results = list(iter_evaluate_criteria("資料", [1, 2], client=create_client("sk-test-a"), mode="combined"))
+    assert calls == ["combined"]
+    assert {r["criterion_id"]: r["score"] for r in results} == {1: 8, 2: 6}
+
+
+def test_combined_mode_falls_back_for_items_that_fail_validation(monkeypatch):
+    calls = _fake_generate(monkeypatch, """[
+ {"criterion_id": 1, "score": 8, "reason": "良い"},
+ {"criterion_id": 2, "score": 15, "reason": "範囲外"},
+ {"criterion_id": 3, "score": 5, "reason": ""}
+]""")
+    results = list(iter_evaluate_criteria("資料", [1, 2, 3], client=create_client("sk-test-a"), mode="combined"))
+    by_id = {r["criterion_id"]: r for r in results}
+    assert by_id[1]["score"] == 8
+    assert by_id[2]["reason"] == by_id[3]["reason"] == "項目ごと"
+    assert calls.count("combined") == 1 and calls.count("criterion") == 2
+
+
+def test_combined_mode_falls_back_entirely_when_the_response_is_not_json(monkeypatch):
+    calls = _fake_generate(monkeypatch, "採点できませんでした")
+    results = list(iter_evaluate_criteria("資料", [1, 2], client=create_client("sk-test-a"), mode="combined"))
+    assert all(r["score"] == 4 for r in results)
+    assert calls.count("criterion") == 2
+
+
+def test_per_criterion_mode_never_makes_a_combined_call(monkeypatch):
+    calls = _fake_generate(monkeypatch, "[]")
+    list(iter_evaluate_criteria("資料", [1, 2], client=create_client("sk-test-a")))
+    assert calls == ["criterion", "criterion"]
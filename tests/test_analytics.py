@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""utils.analytics のスコア行列のキャッシュのテスト"""
+
+import pytest
+
+from utils import analytics
+from utils.data_manager import (
+    create_school, create_submission, create_evaluation_result, create_evaluation_detail,
+    update_evaluation_result, get_all_criteria
+)
+
+
+@pytest.fixture
+def scored(data_dir, monkeypatch):
+    monkeypatch.setattr(analytics, "_cache", None)
+    result_id = create_evaluation_result(create_submission(create_school("テスト高校", "東京都"), "テーマ"))
+    create_evaluation_detail(result_id, 1, 8, "理由")
+    update_evaluation_result(result_id, 8, "completed")
+    return result_id
+
+
+def test_frame_is_reused_until_data_changes(scored):
+    first = analytics.get_score_frame()
+    assert analytics.get_score_frame() is first
+    create_school("別の高校")
+    assert analytics.get_score_frame() is not first
+
+
+def test_frame_is_rebuilt_when_criteria_change(scored, monkeypatch):
+    first = analytics.get_score_frame()
+    renamed = [dict(c, criterion_name=f"{c['criterion_name']}（改）") if c['id'] == 1 else c
+               for c in get_all_criteria()]
+    monkeypatch.setattr(analytics, "get_all_criteria", lambda: renamed)
+    frame = analytics.get_score_frame()
+    assert frame is not first
+    assert frame.loc[scored, "着眼点の独創性（改）"] == 8
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""utils.backup_restore のバックアップ・復元のテスト"""
+
+import io
+import json
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from utils import data_manager as dm
+from utils import backup_restore, blob_store, storage
+from utils.backup_restore import write_backup, restore_backup, create_snapshot, BACKUP_TABLES
+
+
+def _create_sample_data(tmp_path):
+    school_id = dm.create_school("テスト高校", "東京都")
+    submission_id = dm.create_submission(school_id, "テーマ")
+    source = tmp_path / "slides.pdf"
+    source.write_bytes(b"%PDF-1.4 sample")
+    path, sha256, size = blob_store.store_file(source)
+    dm.create_file(submission_id, "slides.pdf", str(path), "pdf", size, sha256)
+    with dm.transaction():
+        result_id = dm.create_evaluation_result(submission_id)
+        for criterion_id in (1, 2):
+            dm.create_evaluation_detail(result_id, criterion_id, 8, "理由")
+        dm.update_evaluation_result(result_id, 16, "completed")
+    return path
+
+
+def _snapshot_tables():
+    return {key: dm.load_json(file_path) for key, file_path in BACKUP_TABLES.items()}
+
+
+def _clear_data(blob):
+    store = dm.get_store()
+    with dm.transaction():
+        for key in BACKUP_TABLES:
+            store.replace_all(key, [])
+    blob.unlink()
+
+
+def test_backup_restore_round_trip(data_dir, tmp_path):
+    blob = _create_sample_data(tmp_path)
+    before = _snapshot_tables()
+    backup_path = tmp_path / "backup.zip"
+    write_backup(backup_path)
+
+    _clear_data(blob)
+    result = restore_backup(backup_path)
+
+    assert result["success"], result["errors"]
+    assert result["warnings"] == []
+    assert result["restored_uploads"] == 1
+    assert _snapshot_tables() == before
+    assert blob.read_bytes() == b"%PDF-1.4 sample"
+
+
+def test_scoring_jobs_are_backed_up_and_running_jobs_requeued(data_dir, tmp_path):
+    blob = _create_sample_data(tmp_path)
+    submission_id = dm.get_all_submissions()[0]['id']
+    queued = dm.create_scoring_job(submission_id, priority=2, use_cache=False)
+    running = dm.create_scoring_job(submission_id)
+    dm.update_scoring_job(running, status="running", completed_criteria=3)
+    backup_path = tmp_path / "backup.zip"
+    write_backup(backup_path)
+
+    _clear_data(blob)
+    result = restore_backup(backup_path)
+    assert result["success"], result["errors"]
+    assert "scoring_jobs" in result["restored_files"]
+    restored = dm.get_scoring_job(queued)
+    assert restored['status'] == "queued" and restored['priority'] == 2 and restored['use_cache'] is False
+    # 実行中だったジョブは再実行の対象に戻る
+    requeued = dm.get_scoring_job(running)
+    assert requeued['status'] == "queued" and requeued['completed_criteria'] == 0
+
+
+def test_restore_from_bytes_and_dry_run(data_dir, tmp_path):
+    _create_sample_data(tmp_path)
+    backup_path = tmp_path / "backup.zip"
+    write_backup(backup_path)
+    dm.create_school("追加の高校")
+
+    result = restore_backup(backup_path.read_bytes(), dry_run=True)
+    assert result["success"] and result["dry_run"]
+    assert result["counts"]["evaluation_details"] == 2
+    assert len(dm.get_all_schools()) == 2
+
+
+def test_restore_version_1_0_backup(data_dir):
+    tables = {
+        "schools": [{"id": 1, "name": "A高校", "prefecture": "大阪府"}],
+        "submissions": [{"id": 1, "school_id": 1, "theme_title": "テーマ"}],
+        "evaluation_results": [{"id": 1, "submission_id": 1, "total_score": 9,
+                                "evaluation_status": "completed"}],
+        "evaluation_details": [{"id": 1, "evaluation_result_id": 1, "criterion_id": 1, "score": 9}],
+        "files": [],
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        zip_file.writestr("backup_metadata.json", json.dumps(
+            {"backup_date": "2024-01-01T00:00:00", "version": "1.0", "data": tables}, ensure_ascii=False))
+        for key, rows in tables.items():
+            zip_file.writestr(f"{key}.json", json.dumps(rows, ensure_ascii=False, indent=2))
+
+    result = restore_backup(buffer.getvalue())
+
+    assert result["success"], result["errors"]
+    assert result["backup_date"] == "2024-01-01T00:00:00"
+    # 1.0形式には採点ジョブが含まれないため、現在のキュー（空）のまま
+    assert _snapshot_tables() == {**tables, "scoring_jobs": []}
+    # 復元後に追加した行は既存のIDと重ならない
+    assert dm.create_school("B高校") == 2
+
+
+def test_restore_rejects_corrupted_table(data_dir, tmp_path):
+    _create_sample_data(tmp_path)
+    backup_path = tmp_path / "backup.zip"
+    write_backup(backup_path)
+
+    corrupted = tmp_path / "corrupted.zip"
+    with zipfile.ZipFile(backup_path) as source, zipfile.ZipFile(corrupted, "w") as target:
+        for item in source.infolist():
+            data = source.read(item)
+            if item.filename == "schools.json":
+                data = json.dumps([{"id": 1, "name": "改ざん"}]).encode("utf-8")
+            target.writestr(item, data)
+    dm.create_school("追加の高校")
+    before = _snapshot_tables()
+
+    result = restore_backup(corrupted)
+    assert not result["success"]
+    assert any("ハッシュ" in error for error in result["errors"])
+    assert _snapshot_tables() == before
+
+
+def test_restore_strict_rejects_orphans(data_dir):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        zip_file.writestr("schools.json", "[]")
+        zip_file.writestr("submissions.json", json.dumps([{"id": 1, "school_id": 99}]))
+
+    assert restore_backup(buffer.getvalue())["warnings"]
+    result = restore_backup(buffer.getvalue(), strict=True, dry_run=True)
+    assert not result["success"]
+
+
+def test_restore_interrupted_after_journal_is_completed_on_next_access(data_dir, tmp_path, monkeypatch):
+    _create_sample_data(tmp_path)
+    backup_path = tmp_path / "backup.zip"
+    write_backup(backup_path)
+    restored = _snapshot_tables()
+    store = dm.get_store()
+    with dm.transaction():
+        for key in BACKUP_TABLES:
+            store.replace_all(key, [])
+
+    # 2つ目のテーブルのリネームでプロセスが停止した状態を再現
+    original_replace = Path.replace
+    calls = []
+
+    def crash_on_second_table(self, target):
+        if self.name.endswith(".json.tmp") and not self.name.startswith("."):
+            calls.append(self.name)
+            if len(calls) == 2:
+                raise OSError("中断")
+        return original_replace(self, target)
+
+    monkeypatch.setattr(Path, "replace", crash_on_second_table)
+    result = restore_backup(backup_path)
+    monkeypatch.setattr(Path, "replace", original_replace)
+    assert not result["success"]
+
+    reopened = storage.JsonStore(data_dir)
+    assert {key: reopened.all(key) for key in BACKUP_TABLES} == restored
+
+
+def test_incremental_snapshot_reuses_unchanged_objects(data_dir, tmp_path):
+    _create_sample_data(tmp_path)
+    first = create_snapshot()
+    second = create_snapshot()
+    assert first["stats"]["new_objects"] > 0
+    assert second["stats"]["new_objects"] == 0
+    assert second["parent"] == first["snapshot_id"]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""utils.blob_store の重複排除・参照数による削除・ガベージコレクションのテスト"""
+
+import io
+import os
+import time
+
+import pytest
+
+from utils import blob_store
+from utils.blob_store import store_stream, release, collect_garbage, reference_counts
+from utils.data_manager import (
+    create_school, create_submission, create_file, delete_files_by_submission, transaction
+)
+
+
+@pytest.fixture(autouse=True)
+def no_release_grace(data_dir, monkeypatch):
+    monkeypatch.setattr(blob_store, "RELEASE_GRACE_SECONDS", 0)
+
+
+def _age(path, seconds):
+    """ブロブの更新日時を過去にずらす"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def _submission_with(content: bytes, name: str = "資料.pdf"):
+    """ブロブを保存し、それを参照するファイル情報を持つ提出資料を作成"""
+    path, digest, size = store_stream(io.BytesIO(content), name)
+    submission_id = create_submission(create_school("テスト高校"), "テーマ")
+    create_file(submission_id, name, path.as_posix(), "PDF", size, content_sha256=digest)
+    return submission_id, path
+
+
+def test_same_content_is_stored_once():
+    first, digest, size = store_stream(io.BytesIO(b"slides"), "a.PDF")
+    second, _, _ = store_stream(io.BytesIO(b"slides"), "b.pdf")
+    assert first == second
+    assert first.name == f"{digest}.pdf" and size == 6
+    assert len(list(blob_store.BLOB_DIR.glob("*/*"))) == 1
+    assert not list(blob_store.BLOB_DIR.glob("*.tmp"))
+
+
+def test_blob_is_released_only_when_the_last_reference_goes():
+    first, path = _submission_with(b"shared")
+    second, same_path = _submission_with(b"shared")
+    assert path == same_path
+    assert reference_counts()[path.as_posix()] == 2
+
+    delete_files_by_submission(first)
+    assert path.exists()
+    delete_files_by_submission(second)
+    assert not path.exists()
+
+
+def test_recently_reused_blob_survives_release(monkeypatch):
+    monkeypatch.setattr(blob_store, "RELEASE_GRACE_SECONDS", 60)
+    submission_id, path = _submission_with(b"reused")
+    delete_files_by_submission(submission_id)
+    assert path.exists()
+    _age(path, 120)
+    assert release([path.as_posix()]) == 1
+    assert not path.exists()
+
+
+def test_delete_inside_transaction_releases_after_commit():
+    submission_id, path = _submission_with(b"in transaction")
+    with transaction():
+        delete_files_by_submission(submission_id)
+        # コミット前はまだ参照が残っているため削除しない
+        assert path.exists()
+    assert not path.exists()
+
+
+def test_rolled_back_delete_keeps_the_blob():
+    submission_id, path = _submission_with(b"rolled back")
+    with pytest.raises(RuntimeError):
+        with transaction():
+            delete_files_by_submission(submission_id)
+            raise RuntimeError("中断")
+    assert path.exists()
+    assert reference_counts()[path.as_posix()] == 1
+
+
+def test_collect_garbage_respects_grace_period():
+    _, referenced = _submission_with(b"referenced")
+    orphan, _, orphan_size = store_stream(io.BytesIO(b"orphan"), "orphan.pdf")
+    fresh, _, _ = store_stream(io.BytesIO(b"fresh orphan"), "fresh.pdf")
+    _age(referenced, 3600)
+    _age(orphan, 3600)
+
+    stats = collect_garbage(grace_seconds=600)
+    assert stats == {"blobs": 3, "removed": 1, "freed_bytes": orphan_size}
+    assert referenced.exists() and fresh.exists()
+    assert not orphan.exists()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""utils.cli のコマンド（取り込み・採点・エクスポート）のテスト"""
+
+import csv
+import json
+
+import pytest
+
+from utils import rescoring
+from utils.cli import main, build_ranking
+from utils.data_manager import (
+    create_school, create_submission, create_evaluation_result, update_evaluation_result,
+    set_special_judge_award, get_store, get_all_submissions, get_all_scoring_jobs,
+    get_all_evaluation_results, get_all_criteria
+)
+from utils.leaderboard import Leaderboard
+
+
+@pytest.fixture
+def scorer(data_dir, monkeypatch):
+    """テキスト抽出とAPI呼び出しの代わりに、すべての評価項目に5点を返す"""
+    monkeypatch.setattr(rescoring, "extract_submission_text", lambda files: "提出資料")
+
+    def fake_iter(content, criterion_ids, use_cache=True, client=None, mode=None, **kwargs):
+        for criterion_id in criterion_ids:
+            yield {"criterion_id": criterion_id, "criterion_name": f"項目{criterion_id}",
+                   "score": 5, "reason": "理由"}
+
+    monkeypatch.setattr(rescoring, "iter_evaluate_criteria", fake_iter)
+
+
+@pytest.fixture
+def submissions_dir(data_dir):
+    source = data_dir.parent / "submissions"
+    for school, files in {"A高校": ["slides.txt", "memo.txt"], "B高校": ["slides.txt"], "空の高校": []}.items():
+        (source / school).mkdir(parents=True)
+        for name in files:
+            (source / school / name).write_text(f"{school}の{name}", encoding="utf-8")
+    (source / "B高校" / "画像.png").write_bytes(b"png")
+    return source
+
+
+def _result(school, score):
+    result_id = create_evaluation_result(create_submission(create_school(school), "テーマ"))
+    update_evaluation_result(result_id, score, "completed")
+    return result_id
+
+
+def test_import_and_score(submissions_dir, scorer, capsys):
+    assert main(["import", str(submissions_dir), "--theme", "探究", "--enqueue", "--mode", "combined"]) == 0
+    submissions = get_all_submissions()
+    assert [(s['school_name'], s['theme_title']) for s in submissions] == [("A高校", "探究"), ("B高校", "探究")]
+    jobs = get_all_scoring_jobs()
+    assert len(jobs) == 2 and all(job['scoring_mode'] == "combined" for job in jobs)
+    assert "空の高校" in capsys.readouterr().err
+
+    assert main(["score", "--api-key", "sk-test-cli", "--jobs", "2"]) == 0
+    output = capsys.readouterr().out
+    assert "2件のジョブを実行しました" in output
+    assert {job['status'] for job in get_all_scoring_jobs()} == {"completed"}
+    assert [r['total_score'] for r in get_all_evaluation_results()] == [5 * len(get_all_criteria())] * 2
+
+
+def test_score_without_api_key(data_dir, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    assert main(["score"]) == 2
+
+
+def test_export_uses_the_leaderboard_order(data_dir, tmp_path):
+    low = _result("A高校", 30)
+    tied_first = _result("B高校", 40)
+    tied_second = _result("C高校", 40)
+    special = _result("D高校", 20)
+    set_special_judge_award(special)
+    # 保存順がIDの順でなくても（復元・移行後など）、同点はIDの小さい順に並ぶ
+    store = get_store()
+    store.replace_all("evaluation_results", list(reversed(store.all("evaluation_results"))))
+
+    ranking = build_ranking()
+    assert [row['result_id'] for row in ranking] == [row['id'] for row in Leaderboard().page()]
+    assert [row['result_id'] for row in ranking] == [tied_first, tied_second, low, special]
+    assert [row['賞'] for row in ranking] == ["🏆 最優秀賞", "🥇 優秀賞", "🥇 優秀賞", "⭐ 特別審査員賞"]
+
+    csv_path = tmp_path / "ranking.csv"
+    assert main(["export", "--output", str(csv_path)]) == 0
+    with open(csv_path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row['参加校'] for row in rows] == ["B高校", "C高校", "A高校", "D高校"]
+    assert [row['順位'] for row in rows] == ["1", "2", "3", "4"]
+
+    json_path = tmp_path / "ranking.json"
+    assert main(["export", "--format", "json", "--output", str(json_path)]) == 0
+    exported = json.loads(json_path.read_text(encoding="utf-8"))
+    assert [row['result_id'] for row in exported] == [tied_first, tied_second, low, special]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""utils.data_manager の削除処理のテスト"""
+
+import pytest
+
+from utils import data_manager
+from utils.data_manager import (
+    create_school, create_submission, create_evaluation_result, create_evaluation_detail,
+    delete_evaluation_result, get_evaluation_result, get_evaluation_details
+)
+
+
+def _result_with_details():
+    result_id = create_evaluation_result(create_submission(create_school("テスト高校"), "テーマ"))
+    create_evaluation_detail(result_id, 1, 8, "理由")
+    create_evaluation_detail(result_id, 2, 6, "理由")
+    return result_id
+
+
+def test_delete_evaluation_result_removes_details(data_dir):
+    result_id = _result_with_details()
+    assert delete_evaluation_result(result_id)
+    assert get_evaluation_result(result_id) is None
+    assert get_evaluation_details(result_id) == []
+    assert not delete_evaluation_result(result_id)
+
+
+def test_failed_detail_delete_keeps_the_result(data_dir, monkeypatch):
+    result_id = _result_with_details()
+
+    def fail(result_id):
+        raise OSError("中断")
+
+    monkeypatch.setattr(data_manager, "delete_evaluation_details", fail)
+    with pytest.raises(OSError):
+        delete_evaluation_result(result_id)
+    # 採点結果だけが削除された状態にはならない
+    assert get_evaluation_result(result_id) is not None
+    assert len(get_evaluation_details(result_id)) == 2
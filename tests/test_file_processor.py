@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""utils.file_processor のファイル情報からのテキスト抽出のテスト"""
+
+import pytest
+
+from utils import file_processor
+from utils.file_processor import extract_texts_for_file_records, file_sha256
+
+
+@pytest.fixture
+def text_file(data_dir, monkeypatch):
+    monkeypatch.setenv("EXTRACTION_WORKERS", "0")
+    path = data_dir.parent / "uploads" / "資料.txt"
+    path.parent.mkdir()
+    path.write_text("ピッチ資料の本文", encoding="utf-8")
+    return path
+
+
+def test_recorded_hash_is_used_without_reading_the_file(text_file, monkeypatch):
+    recorded = file_sha256(text_file)
+
+    def fail(path):
+        raise AssertionError("記録済みのハッシュがあるファイルを読み直した")
+
+    monkeypatch.setattr(file_processor, "file_sha256", fail)
+    records = [{"id": None, "file_path": str(text_file), "content_sha256": recorded}]
+    assert extract_texts_for_file_records(records) == [("ピッチ資料の本文", None)]
+    # 2回目は抽出済みのテキストを使う
+    text_file.unlink()
+    assert extract_texts_for_file_records(records) == [("ピッチ資料の本文", None)]
+
+
+def test_hash_is_computed_when_not_recorded(text_file, monkeypatch):
+    computed = []
+    monkeypatch.setattr(file_processor, "file_sha256",
+                        lambda path: computed.append(path) or file_sha256(path))
+    records = [{"id": None, "file_path": str(text_file)}]
+    assert extract_texts_for_file_records(records) == [("ピッチ資料の本文", None)]
+    assert computed == [text_file]
+
+
+def test_submission_budget_is_carried_across_files(data_dir, monkeypatch):
+    monkeypatch.setenv("EXTRACTION_WORKERS", "0")
+    monkeypatch.setenv("EXTRACTION_MAX_CHARS", "100")
+    uploads = data_dir.parent / "uploads"
+    uploads.mkdir()
+    records = []
+    for name in ("a.txt", "b.txt", "c.txt"):
+        (uploads / name).write_text(name[0] * 50, encoding="utf-8")
+        records.append({"id": None, "file_name": name, "file_path": str(uploads / name)})
+
+    read = []
+    original = file_processor.extract_text_from_file
+    monkeypatch.setattr(file_processor, "extract_text_from_file",
+                        lambda path, max_chars=None: read.append((path.name, max_chars))
+                        or original(path, max_chars))
+
+    text = file_processor.extract_submission_text(records)
+    assert len(text) == 100
+    header = len("\n\n=== a.txt ===\n\n")
+    # 1つ目のファイルは全体の上限まで、2つ目は残りの文字数まで読み、3つ目は読まない
+    assert read == [("a.txt", 100 - header), ("b.txt", 100 - header - 50 - header)]
+    assert text.endswith("\n\n" + "b" * (100 - 2 * header - 50))
+
+
+def test_unlimited_budget_reads_every_file_in_full(data_dir, monkeypatch):
+    monkeypatch.setenv("EXTRACTION_WORKERS", "0")
+    monkeypatch.setenv("EXTRACTION_MAX_CHARS", "0")
+    uploads = data_dir.parent / "uploads"
+    uploads.mkdir()
+    records = []
+    for name in ("a.txt", "b.txt"):
+        (uploads / name).write_text(name[0] * 500, encoding="utf-8")
+        records.append({"id": None, "file_name": name, "file_path": str(uploads / name)})
+    text = file_processor.extract_submission_text(records)
+    assert text.count("a") >= 500 and text.count("b") >= 500
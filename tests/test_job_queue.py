@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""utils.job_queue の一括採点キューのテスト"""
+
+import pytest
+
+from utils import rescoring
+from utils.ai_scoring import create_client
+from utils.job_queue import (
+    enqueue_submission, claim_next_job, recover_interrupted_jobs, run_job, run_pending_jobs,
+    retry_failed_jobs
+)
+from utils.data_manager import (
+    create_school, create_submission, create_file, get_scoring_job, get_all_evaluation_results,
+    get_evaluation_details, get_all_criteria
+)
+
+
+@pytest.fixture
+def client():
+    return create_client("sk-test-queue")
+
+
+@pytest.fixture
+def scorer(data_dir, monkeypatch):
+    """テキスト抽出とAPI呼び出しの代わりに、設定した点数（None は採点エラー）を返す"""
+    scores = {criterion['id']: 5 for criterion in get_all_criteria()}
+    calls = []
+    monkeypatch.setattr(rescoring, "extract_submission_text", lambda files: "提出資料")
+
+    def fake_iter(content, criterion_ids, use_cache=True, client=None, mode=None, **kwargs):
+        calls.append((use_cache, mode))
+        for criterion_id in criterion_ids:
+            result = {"criterion_id": criterion_id, "criterion_name": f"項目{criterion_id}"}
+            if scores[criterion_id] is None:
+                yield {**result, "score": 0, "reason": "採点エラー", "error": "429 rate limit"}
+            else:
+                yield {**result, "score": scores[criterion_id], "reason": "理由"}
+
+    monkeypatch.setattr(rescoring, "iter_evaluate_criteria", fake_iter)
+    return scores, calls
+
+
+def _submission(name="テスト高校"):
+    submission_id = create_submission(create_school(name), "テーマ")
+    create_file(submission_id, "資料.txt", "uploads/資料.txt", "Text", 10)
+    return submission_id
+
+
+def test_jobs_are_claimed_by_priority_then_age(data_dir):
+    low = enqueue_submission(_submission("A"))
+    high = enqueue_submission(_submission("B"), priority=5)
+    later_low = enqueue_submission(_submission("C"))
+    assert [claim_next_job()['id'] for _ in range(3)] == [high, low, later_low]
+    assert claim_next_job() is None
+    assert get_scoring_job(high)['status'] == "running"
+    assert get_scoring_job(high)['attempts'] == 1
+
+
+def test_enqueue_reuses_the_queued_job_and_keeps_a_forced_rescore(data_dir):
+    submission_id = _submission()
+    job_id = enqueue_submission(submission_id)
+    assert enqueue_submission(submission_id, priority=3, use_cache=False) == job_id
+    job = get_scoring_job(job_id)
+    assert job['priority'] == 3 and job['use_cache'] is False
+    # 優先度を下げたり、キャッシュありで追加し直しても強制の指定は消えない
+    assert enqueue_submission(submission_id, priority=1) == job_id
+    job = get_scoring_job(job_id)
+    assert job['priority'] == 3 and job['use_cache'] is False
+
+
+def test_forced_enqueue_while_running_adds_a_job(data_dir):
+    submission_id = _submission()
+    running = enqueue_submission(submission_id)
+    claim_next_job()
+    assert enqueue_submission(submission_id) == running
+    forced = enqueue_submission(submission_id, use_cache=False)
+    assert forced != running
+    assert get_scoring_job(forced)['use_cache'] is False
+
+
+def test_interrupted_jobs_are_requeued_on_restart(data_dir):
+    job_id = enqueue_submission(_submission())
+    claim_next_job()
+    assert recover_interrupted_jobs() == 1
+    job = get_scoring_job(job_id)
+    assert job['status'] == "queued" and job['completed_criteria'] == 0
+    assert claim_next_job()['attempts'] == 2
+
+
+def test_successful_job_records_the_result(scorer, client):
+    _, calls = scorer
+    job_id = enqueue_submission(_submission(), use_cache=False)
+    assert run_pending_jobs(client=client) == 1
+    job = get_scoring_job(job_id)
+    assert job['status'] == "completed" and job['total_score'] == 30
+    assert job['completed_criteria'] == job['total_criteria'] == 6
+    assert calls == [(False, "per_criterion")]
+
+
+def test_job_is_scored_with_the_mode_it_was_queued_with(scorer, client, monkeypatch):
+    _, calls = scorer
+    monkeypatch.setenv("SCORING_MODE", "per_criterion")
+    submission_id = _submission()
+    job_id = enqueue_submission(submission_id, scoring_mode="combined")
+    assert get_scoring_job(job_id)['scoring_mode'] == "combined"
+    # 待機中のジョブは新しく指定したモードに更新される
+    assert enqueue_submission(submission_id) == job_id
+    assert get_scoring_job(job_id)['scoring_mode'] == "per_criterion"
+    enqueue_submission(submission_id, scoring_mode="combined")
+    monkeypatch.setenv("SCORING_MODE", "per_criterion")
+    run_pending_jobs(client=client)
+    assert calls == [(True, "combined")]
+
+
+def test_failed_criterion_fails_the_job_and_keeps_the_previous_result(scorer, client):
+    scores, _ = scorer
+    submission_id = _submission()
+    enqueue_submission(submission_id)
+    run_pending_jobs(client=client)
+    previous = get_all_evaluation_results()[0]
+
+    scores[3] = None
+    job_id = enqueue_submission(submission_id)
+    result = run_job(claim_next_job(), client)
+    assert not result['success'] and "429" in result['error']
+    job = get_scoring_job(job_id)
+    assert job['status'] == "failed"
+    results = get_all_evaluation_results()
+    assert len(results) == 1
+    assert results[0]['total_score'] == previous['total_score'] == 30
+    assert len(get_evaluation_details(previous['id'])) == 6
+
+    # 失敗したジョブは再実行の対象になる
+    scores[3] = 9
+    assert retry_failed_jobs() == 1
+    run_pending_jobs(client=client)
+    assert get_scoring_job(job_id)['status'] == "completed"
+    assert get_all_evaluation_results()[0]['total_score'] == 34
+
+
+def test_failed_first_scoring_is_not_completed_and_is_reused_on_retry(scorer, client):
+    scores, _ = scorer
+    scores[1] = None
+    job_id = enqueue_submission(_submission())
+    run_pending_jobs(client=client)
+    assert get_scoring_job(job_id)['status'] == "failed"
+    [failed] = get_all_evaluation_results()
+    assert failed['evaluation_status'] == "failed"
+
+    scores[1] = 5
+    retry_failed_jobs()
+    run_pending_jobs(client=client)
+    [result] = get_all_evaluation_results()
+    assert result['id'] == failed['id'] and result['evaluation_status'] == "completed"
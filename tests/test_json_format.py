@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""utils.storage のJSONの保存形式（通常・カラムナ形式）の読み書きのテスト"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from utils import storage, data_manager
+from utils.cli import main
+from utils.storage import JsonStore, load_table_file, dump_table_file
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ROWS = [
+    {"id": 1, "evaluation_result_id": 1, "score": 8, "evaluation_reason": "良い", "note": None},
+    # 行にないキーは読み込み後もないまま（None の値とは区別する）
+    {"id": 2, "evaluation_result_id": 1, "score": 6, "evaluation_reason": "普通"},
+    {"id": 3, "evaluation_result_id": 2, "evaluation_reason": "日本語の理由", "extra": [1, 2]},
+]
+
+SERIALIZERS = [
+    pytest.param(False, id="json"),
+    pytest.param(True, id="orjson",
+                 marks=pytest.mark.skipif(storage.orjson is None, reason="orjson がない")),
+]
+
+
+@pytest.mark.parametrize("use_orjson", SERIALIZERS)
+@pytest.mark.parametrize("compact", [False, True])
+def test_round_trip_keeps_absent_keys(tmp_path, compact, use_orjson):
+    path = tmp_path / "evaluation_details.json"
+    dump_table_file(path, ROWS, compact, use_orjson)
+    loaded = load_table_file(path, use_orjson)
+    assert loaded == ROWS
+    assert "score" not in loaded[2] and "note" not in loaded[1]
+    assert isinstance(json.loads(path.read_text(encoding="utf-8")), dict) == compact
+
+
+@pytest.mark.parametrize("use_orjson", SERIALIZERS)
+def test_either_format_is_read_by_either_serializer(tmp_path, use_orjson):
+    writers = [False] if storage.orjson is None else [False, True]
+    for compact in (False, True):
+        for writer in writers:
+            path = tmp_path / f"{compact}-{writer}.json"
+            dump_table_file(path, ROWS, compact, writer)
+            assert load_table_file(path, use_orjson) == ROWS
+
+
+def test_without_orjson_installed(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "orjson", None)
+    path = tmp_path / "evaluation_details.json"
+    dump_table_file(path, ROWS, compact=True)
+    assert load_table_file(path) == ROWS
+    with pytest.raises(ImportError):
+        load_table_file(path, use_orjson=True)
+
+
+@pytest.mark.parametrize("without_orjson", [False, True])
+def test_store_reads_files_written_in_the_other_format(tmp_path, monkeypatch, without_orjson):
+    if without_orjson:
+        monkeypatch.setattr(storage, "orjson", None)
+    data_dir = tmp_path / "data"
+    pretty = JsonStore(data_dir, json_format="pretty")
+    pretty.ensure_tables()
+    pretty.replace_all("evaluation_details", ROWS)
+
+    compact = JsonStore(data_dir, json_format="compact")
+    assert compact.all("evaluation_details") == ROWS
+    compact.insert("evaluation_details", {"evaluation_result_id": 3, "score": 9})
+    assert isinstance(json.loads((data_dir / "evaluation_details.json").read_text(encoding="utf-8")), dict)
+
+    # カラムナ形式で書いたファイルを通常の形式の設定で読み込み、書き戻す
+    reread = JsonStore(data_dir, json_format="pretty")
+    assert reread.all("evaluation_details")[:3] == ROWS
+    reread.update("evaluation_details", 1, {"score": 10})
+    assert isinstance(json.loads((data_dir / "evaluation_details.json").read_text(encoding="utf-8")), list)
+    assert JsonStore(data_dir, json_format="compact").get("evaluation_details", 2) == ROWS[1]
+
+
+def test_format_command_rewrites_tables(data_dir, monkeypatch, capsys):
+    data_manager._store.replace_all("evaluation_details", ROWS)
+    monkeypatch.setattr(data_manager, "_store", JsonStore(data_dir, json_format="compact"))
+    assert main(["format"]) == 0
+    assert "compact" in capsys.readouterr().out
+    document = json.loads((data_dir / "evaluation_details.json").read_text(encoding="utf-8"))
+    assert document["format"] == storage.COLUMNAR_FORMAT
+    assert load_table_file(data_dir / "evaluation_details.json") == ROWS
+
+
+def test_python_m_utils_format(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    dump_table_file(data_dir / "evaluation_details.json", ROWS)
+    env = dict(os.environ, DATA_JSON_FORMAT="compact", PYTHONPATH=str(ROOT))
+    env.pop("DATA_BACKEND", None)
+    completed = subprocess.run([sys.executable, "-m", "utils", "format"], cwd=tmp_path, env=env,
+                               capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    assert isinstance(json.loads((data_dir / "evaluation_details.json").read_text(encoding="utf-8")), dict)
+    assert load_table_file(data_dir / "evaluation_details.json") == ROWS
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""utils.leaderboard の差分更新が全件からの賞判定と一致することのテスト"""
+
+import pytest
+
+from utils import data_manager
+from utils.award_manager import determine_awards
+from utils.leaderboard import Leaderboard
+from utils.storage import create_store
+from utils.data_manager import (
+    create_school, create_submission, create_evaluation_result, create_evaluation_detail,
+    update_evaluation_result, set_special_judge_award, delete_evaluation_result,
+    get_all_evaluation_results, get_evaluation_details, transaction
+)
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def board(data_dir, request, monkeypatch):
+    """差分更新だけで追従するランキング（作り直しが起きたらテストを失敗させる）"""
+    store = create_store(data_dir, request.param)
+    store.ensure_tables()
+    monkeypatch.setattr(data_manager, "_store", store)
+    leaderboard = Leaderboard(store)
+    leaderboard.count()
+
+    def fail(versions):
+        raise AssertionError("差分で反映できずに全件から作り直した")
+
+    monkeypatch.setattr(leaderboard, "_rebuild", fail)
+    return leaderboard
+
+
+def _result(score, name="テスト高校"):
+    result_id = create_evaluation_result(create_submission(create_school(name), "テーマ"))
+    update_evaluation_result(result_id, score, "completed")
+    return result_id
+
+
+def _assert_matches_full_recomputation(board):
+    results = get_all_evaluation_results()
+    completed = [r for r in results if r.get("evaluation_status") == "completed"]
+    # determine_awards と同じ並び（総合スコアの高い順、同点は入力順＝ID順）
+    expected_order = [r['id'] for r in sorted(completed, key=lambda r: r.get('total_score', 0), reverse=True)]
+    assert [row['id'] for row in board.page()] == expected_order
+    assert [row['rank'] for row in board.page()] == list(range(1, len(expected_order) + 1))
+    assert board.awards() == determine_awards(results)
+    for rank, result_id in enumerate(expected_order, start=1):
+        assert board.rank_of(result_id) == rank
+    assert board.count() == len(completed)
+
+
+def test_score_updates_match_full_recomputation(board):
+    first = _result(20, "A高校")
+    second = _result(30, "B高校")
+    third = _result(25, "C高校")
+    fourth = _result(10, "D高校")
+    _assert_matches_full_recomputation(board)
+
+    update_evaluation_result(fourth, 40, "completed")
+    _assert_matches_full_recomputation(board)
+    assert board.get_awards(fourth) == ["🏆 最優秀賞"]
+
+    # 採点中に戻した結果は順位から外れる
+    update_evaluation_result(second, 30, "processing")
+    _assert_matches_full_recomputation(board)
+    assert board.rank_of(second) is None
+    assert board.rank_of(third) == 2 and board.rank_of(first) == 3
+
+
+def test_ties_are_ranked_by_result_id(board):
+    ids = [_result(score, f"{index}高校") for index, score in enumerate([20, 30, 30, 20, 30])]
+    _assert_matches_full_recomputation(board)
+    assert [row['id'] for row in board.page()] == [ids[1], ids[2], ids[4], ids[0], ids[3]]
+
+    # 同点の上位を下げると、同点の次の結果が繰り上がる
+    update_evaluation_result(ids[1], 20, "completed")
+    _assert_matches_full_recomputation(board)
+    update_evaluation_result(ids[3], 30, "completed")
+    _assert_matches_full_recomputation(board)
+    assert board.awards()[ids[2]] == ["🏆 最優秀賞"]
+
+
+def test_special_judge_award_matches_full_recomputation(board):
+    ids = [_result(score, f"{index}高校") for index, score in enumerate([50, 40, 30, 20, 20])]
+    set_special_judge_award(ids[4])
+    _assert_matches_full_recomputation(board)
+    assert board.get_awards(ids[4]) == ["⭐ 特別審査員賞"]
+
+    # 上位の結果への特別審査員賞は順位の賞と併記される
+    set_special_judge_award(ids[0])
+    _assert_matches_full_recomputation(board)
+    assert board.get_awards(ids[0]) == ["🏆 最優秀賞", "⭐ 特別審査員賞"]
+
+    set_special_judge_award(ids[4], False)
+    _assert_matches_full_recomputation(board)
+    assert ids[4] not in board.awards()
+    _, count = board.search(award_filter="special")
+    assert count == 1
+
+
+def test_delete_matches_full_recomputation(board):
+    ids = [_result(score, f"{index}高校") for index, score in enumerate([30, 30, 20, 10])]
+    set_special_judge_award(ids[3])
+    create_evaluation_detail(ids[0], 1, 8, "理由")
+
+    assert delete_evaluation_result(ids[0])
+    _assert_matches_full_recomputation(board)
+    assert board.get_awards(ids[1]) == ["🏆 最優秀賞"]
+    assert board.get_awards(ids[3]) == ["🥇 優秀賞", "⭐ 特別審査員賞"]
+    assert get_evaluation_details(ids[0]) == []
+
+    delete_evaluation_result(ids[3])
+    _assert_matches_full_recomputation(board)
+    assert board.search(award_filter="special") == ([], 0)
+
+
+def test_changes_in_one_transaction_match_full_recomputation(board):
+    ids = [_result(score, f"{index}高校") for index, score in enumerate([10, 20, 30])]
+    with transaction():
+        update_evaluation_result(ids[0], 35, "completed")
+        set_special_judge_award(ids[1])
+        delete_evaluation_result(ids[2])
+        _result(35, "追加高校")
+    _assert_matches_full_recomputation(board)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""utils.rate_limiter の送信時刻の予約と待ち方のテスト"""
+
+import threading
+
+import pytest
+
+from utils import ai_scoring, rate_limiter
+from utils.ai_scoring import create_client, iter_evaluate_criteria
+from utils.rate_limiter import RateLimiter, RateLimitExceeded, MINUTE
+
+
+class _NoCache:
+    def get(self, key):
+        return None
+
+    def put(self, key, criterion_id, value):
+        pass
+
+
+@pytest.fixture
+def limiter(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_RPM", "2")
+    monkeypatch.setenv("OPENAI_TPM", "0")
+    monkeypatch.setenv("OPENAI_RPD", "0")
+    return RateLimiter(tmp_path / "rate_limits.sqlite3", max_wait=600)
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """待たずに、待とうとした秒数を記録する"""
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_reservations_are_spaced_by_rpm(limiter):
+    first = limiter.reserve("openai")
+    second = limiter.reserve("openai")
+    third = limiter.reserve("openai")
+    assert first["wait"] == 0 and second["wait"] == 0
+    assert third["at"] == pytest.approx(first["at"] + MINUTE)
+    assert third["wait"] == pytest.approx(MINUTE, abs=1)
+
+
+def test_reservation_beyond_max_wait_is_rejected_without_booking(limiter):
+    limiter.reserve("openai")
+    limiter.reserve("openai")
+    with pytest.raises(RateLimitExceeded):
+        limiter.reserve("openai", max_wait=10)
+    assert limiter.usage("openai")["minute_requests"] == 2
+    # 呼び出しごとの上限を指定しなければ既定の max_wait で予約できる
+    assert limiter.reserve("openai")["wait"] > 10
+
+
+def test_tpm_delays_until_tokens_leave_the_window(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_RPM", "0")
+    monkeypatch.setenv("OPENAI_TPM", "1000")
+    limiter = RateLimiter(tmp_path / "rate_limits.sqlite3")
+    first = limiter.reserve("openai", 800)
+    second = limiter.reserve("openai", 300)
+    assert second["at"] == pytest.approx(first["at"] + MINUTE)
+
+
+def test_settle_records_actual_tokens(limiter):
+    reservation = limiter.reserve("openai", 900)
+    limiter.settle(reservation["id"], 120)
+    usage = limiter.usage("openai")
+    assert usage["minute_tokens"] == 120
+    assert usage["rpm"] == 2
+
+
+def test_acquire_reports_wait_and_releases_the_slot_while_sleeping(limiter, monkeypatch):
+    slot = threading.BoundedSemaphore(1)
+    free_while_sleeping = []
+    waits = []
+
+    def fake_sleep(seconds):
+        got = slot.acquire(blocking=False)
+        free_while_sleeping.append(got)
+        if got:
+            slot.release()
+
+    monkeypatch.setattr(rate_limiter.time, "sleep", fake_sleep)
+    limiter.reserve("openai")
+    limiter.reserve("openai")
+    with slot:
+        limiter.acquire("openai", on_wait=waits.append, release_while_waiting=slot)
+        # 待った後は枠を持った状態に戻っている
+        assert not slot.acquire(blocking=False)
+    assert free_while_sleeping == [True]
+    assert waits == [pytest.approx(MINUTE, abs=1)]
+
+
+def test_scoring_reports_waits_in_the_calling_thread(limiter, no_sleep, monkeypatch):
+    monkeypatch.setattr(ai_scoring, "get_rate_limiter", lambda: limiter)
+    monkeypatch.setattr(ai_scoring, "get_response_cache", lambda: _NoCache())
+    monkeypatch.setenv("SCORING_MODE", "per_criterion")
+
+    def fake_evaluate(content, criterion_id, client=None):
+        ai_scoring._wait_for_send_slot("openai", content)
+        return {"score": 5, "reason": "ok"}
+
+    monkeypatch.setattr(ai_scoring, "evaluate_criterion", fake_evaluate)
+    reported = []
+    results = list(iter_evaluate_criteria("資料", [1, 2, 3], client=create_client("sk-test-wait"),
+                                          on_wait=lambda s: reported.append(threading.current_thread())))
+    assert all("error" not in r for r in results)
+    # rpm=2 のため3項目目は待つ（待ち時間はスクリプトのスレッドで通知される）
+    assert len(no_sleep) == 1
+    assert reported == [threading.current_thread()]
+
+
+def test_scoring_fails_the_criterion_when_wait_exceeds_max_wait(limiter, no_sleep, monkeypatch):
+    monkeypatch.setattr(ai_scoring, "get_rate_limiter", lambda: limiter)
+    monkeypatch.setattr(ai_scoring, "get_response_cache", lambda: _NoCache())
+    monkeypatch.setenv("SCORING_MODE", "per_criterion")
+
+    def fake_evaluate(content, criterion_id, client=None):
+        ai_scoring._wait_for_send_slot("openai", content)
+        return {"score": 5, "reason": "ok"}
+
+    monkeypatch.setattr(ai_scoring, "evaluate_criterion", fake_evaluate)
+    results = list(iter_evaluate_criteria("資料", [1, 2, 3], client=create_client("sk-test-wait"),
+                                          max_wait=5))
+    assert sum("error" in r for r in results) == 1
+    assert no_sleep == []
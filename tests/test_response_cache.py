@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""utils.response_cache と採点応答のキャッシュの使い方のテスト"""
+
+import pytest
+
+from utils import ai_scoring, response_cache
+from utils.ai_scoring import create_client, iter_evaluate_criteria
+from utils.response_cache import ResponseCache, make_cache_key
+
+KEY_ARGS = ("content-hash", 1, "prompt-hash", "openai", "gpt-4o-mini", 0.2)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(tmp_path / "response_cache.sqlite3", max_entries=2)
+
+
+@pytest.fixture
+def fake_model(cache, monkeypatch):
+    """キャッシュを一時ファイルにし、モデルの応答を順に返す"""
+    monkeypatch.setattr(ai_scoring, "get_response_cache", lambda: cache)
+    monkeypatch.setenv("SCORING_MODE", "per_criterion")
+    responses = []
+    prompts = []
+
+    def generate(prompt, client=None):
+        prompts.append(prompt)
+        return responses.pop(0)
+
+    monkeypatch.setattr(ai_scoring, "_generate_with_openai", generate)
+    return responses, prompts
+
+
+def _score(use_cache=True):
+    return list(iter_evaluate_criteria("提出資料", [1], use_cache=use_cache,
+                                       client=create_client("sk-test-cache")))[0]
+
+
+@pytest.mark.parametrize("index, value", [(0, "other-content"), (1, 2), (2, "other-prompt"),
+                                          (3, "gemini"), (4, "gpt-4o"), (5, 0.3)])
+def test_every_key_part_changes_the_key(index, value):
+    changed = list(KEY_ARGS)
+    changed[index] = value
+    assert make_cache_key(*changed) != make_cache_key(*KEY_ARGS)
+    assert make_cache_key(*KEY_ARGS) == make_cache_key(*KEY_ARGS)
+
+
+def test_least_recently_used_entry_is_evicted(cache, monkeypatch):
+    clock = iter(range(100, 200))
+    monkeypatch.setattr(response_cache.time, "time", lambda: float(next(clock)))
+    cache.put("a", 1, {"score": 1, "reason": "a"})
+    cache.put("b", 2, {"score": 2, "reason": "b"})
+    assert cache.get("a")["score"] == 1  # a を使ったので b が最も古くなる
+    cache.put("c", 3, {"score": 3, "reason": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_cached_result_is_reused(fake_model):
+    responses, prompts = fake_model
+    responses.append('{"score": 7, "reason": "良い"}')
+    assert _score()["score"] == 7
+    again = _score()
+    assert again["score"] == 7 and again["cached"]
+    assert len(prompts) == 1
+
+
+def test_bypass_calls_the_model_and_refreshes_the_cache(fake_model):
+    responses, prompts = fake_model
+    responses.extend(['{"score": 7, "reason": "良い"}', '{"score": 4, "reason": "再採点"}'])
+    _score()
+    forced = _score(use_cache=False)
+    assert forced["score"] == 4 and "cached" not in forced
+    assert _score()["score"] == 4
+    assert len(prompts) == 2
+
+
+def test_response_without_json_is_an_error_and_not_cached(fake_model, cache):
+    responses, prompts = fake_model
+    responses.extend(["申し訳ありませんが採点できません。", '{"score": 8, "reason": "採点できた"}'])
+    failed = _score()
+    assert "error" in failed and failed["score"] == 0
+    assert cache.stats()["entries"] == 0
+    # 次の実行では呼び出し直す
+    retried = _score()
+    assert retried["score"] == 8 and "cached" not in retried
+    assert len(prompts) == 2
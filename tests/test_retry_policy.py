@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""utils.retry_policy のバックオフ・待ち時間の指定・サーキットブレーカーのテスト"""
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+from utils import retry_policy
+from utils.rate_limiter import RateLimitExceeded
+from utils.retry_policy import (
+    RetryPolicy, CircuitBreaker, CircuitOpenError, RATE_LIMITED, UNAVAILABLE, FATAL,
+    classify_error, get_retry_after, get_retry_metrics, call_with_retry
+)
+
+
+class ApiError(Exception):
+    """ステータスコードとヘッダーを持つAPIの例外"""
+
+    def __init__(self, status_code=None, headers=None, message="error"):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+class RateLimitError(Exception):
+    """ステータスコードを持たないSDKの例外（型名で判定する）"""
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """時計と待機を置き換え、ジッターは上限の値にする（プロバイダーごとの状態も初期化）"""
+    fake = FakeClock()
+    monkeypatch.setattr(retry_policy.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(retry_policy.time, "sleep", fake.sleep)
+    monkeypatch.setattr(retry_policy.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(retry_policy, "_breakers", {})
+    monkeypatch.setattr(retry_policy, "_policy", None)
+    monkeypatch.setenv("CIRCUIT_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("CIRCUIT_RESET_TIMEOUT", "60")
+    retry_policy.reset_retry_metrics()
+    yield fake
+    retry_policy.reset_retry_metrics()
+
+
+def _failing(*errors, result="ok"):
+    """順にエラーを送出し、尽きたら result を返す関数"""
+    remaining = list(errors)
+    calls = []
+
+    def func():
+        calls.append(True)
+        if remaining:
+            raise remaining.pop(0)
+        return result
+
+    return func, calls
+
+
+def test_backoff_doubles_up_to_the_cap(clock):
+    policy = RetryPolicy(base_delay=2, max_delay=30)
+    assert [policy.backoff(attempt) for attempt in range(1, 6)] == [2, 4, 8, 16, 30]
+    # 指定された待ち時間は下回らない（少しずらして待つ）
+    assert policy.backoff(1, retry_after=10) == 11
+    assert policy.backoff(4, retry_after=1) == 16
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"retry-after": "7"}, 7),
+    ({"retry-after": "6m0s"}, 360),
+    ({"x-ratelimit-reset-requests": "20ms"}, 0.02),
+    ({"x-ratelimit-reset-tokens": "1m30s"}, 90),
+    ({}, None),
+])
+def test_retry_after_from_headers(headers, expected):
+    seconds = get_retry_after(ApiError(429, headers))
+    if expected is None:
+        assert seconds is None
+    else:
+        assert seconds == pytest.approx(expected)
+
+
+def test_retry_after_http_date():
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    seconds = get_retry_after(ApiError(429, {"retry-after": format_datetime(when, usegmt=True)}))
+    assert 25 < seconds <= 30
+
+
+def test_retry_after_from_gemini_details_and_message():
+    error = Exception("429 Resource has been exhausted")
+    error.details = [SimpleNamespace(retry_delay=SimpleNamespace(seconds=3, nanos=500_000_000))]
+    assert get_retry_after(error) == 3.5
+    assert get_retry_after(Exception("Quota exceeded. Please retry in 12.3s.")) == 12.3
+    assert get_retry_after(Exception("Please retry in 250ms")) == 0.25
+    assert get_retry_after(Exception("429 quota\nretry_delay {\n  seconds: 4\n}")) == 4
+
+
+@pytest.mark.parametrize("error, kind", [
+    (ApiError(429), RATE_LIMITED),
+    (ApiError(503), UNAVAILABLE),
+    (ApiError(408), UNAVAILABLE),
+    (ApiError(401, message="429 in the text is ignored"), FATAL),
+    (RateLimitError("slow down"), RATE_LIMITED),
+    (TimeoutError("timed out"), UNAVAILABLE),
+    (ConnectionError("reset"), UNAVAILABLE),
+    (Exception("RESOURCE_EXHAUSTED: quota"), RATE_LIMITED),
+    (Exception("503 UNAVAILABLE"), UNAVAILABLE),
+    (ValueError("invalid prompt"), FATAL),
+    (RateLimitExceeded("1日の上限に達しました"), FATAL),
+    (CircuitOpenError("停止中"), FATAL),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+def test_rate_limited_call_waits_as_instructed_and_succeeds(clock):
+    func, calls = _failing(ApiError(429, {"retry-after": "5"}), ApiError(429))
+    assert RetryPolicy(base_delay=2, deadline=60).call("openai", func) == "ok"
+    assert len(calls) == 3
+    assert clock.sleeps == [6, 4]
+    stats = get_retry_metrics()["providers"]["openai"]
+    assert (stats["attempts"], stats["retry"], stats["success"], stats["rate_limited"]) == (3, 2, 1, 2)
+    assert stats["wait_seconds"] == 10
+
+
+def test_fatal_error_is_not_retried(clock):
+    func, calls = _failing(ApiError(401))
+    with pytest.raises(ApiError):
+        RetryPolicy().call("openai", func)
+    assert len(calls) == 1 and clock.sleeps == []
+
+
+def test_gives_up_after_max_attempts(clock):
+    func, calls = _failing(*[ApiError(429) for _ in range(5)])
+    with pytest.raises(ApiError):
+        RetryPolicy(max_attempts=3, deadline=600).call("openai", func)
+    assert len(calls) == 3 and len(clock.sleeps) == 2
+
+
+def test_does_not_wait_past_the_deadline(clock):
+    func, calls = _failing(ApiError(429, {"retry-after": "120"}))
+    with pytest.raises(ApiError):
+        RetryPolicy(deadline=60).call("openai", func)
+    assert len(calls) == 1 and clock.sleeps == []
+    assert get_retry_metrics()["recent"][-1]["outcome"] == "failed"
+
+
+def test_circuit_breaker_transitions(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=2, reset_timeout=60)
+    assert breaker.state == "closed"
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # 一定時間後に1回だけ試す（試している間の他の呼び出しは止める）
+    clock.now += 60
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    # 試した呼び出しが失敗すると、すぐに止め直す
+    assert breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now += 60
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_probe_ending_without_an_outage_lets_the_next_call_probe(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+def test_outage_opens_the_circuit_and_rejects_calls(clock):
+    func, calls = _failing(*[ApiError(503) for _ in range(10)])
+    with pytest.raises(ApiError):
+        call_with_retry("gemini", func)
+    # しきい値（2回）で止めたため、最大試行回数までは試さない
+    assert len(calls) == 2
+    with pytest.raises(CircuitOpenError):
+        call_with_retry("gemini", func)
+    assert len(calls) == 2
+
+    stats = get_retry_metrics()["providers"]["gemini"]
+    assert stats["circuit_opened"] == 1 and stats["rejected"] == 1
+    assert stats["circuit_state"] == "open"
+
+    # 再開までの時間が過ぎれば、試しの呼び出しが成功して再開する
+    clock.now += 60
+    ok, _ = _failing()
+    assert call_with_retry("gemini", ok) == "ok"
+    assert get_retry_metrics()["providers"]["gemini"]["circuit_state"] == "closed"
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""utils.storage のトランザクション・ID採番・コミットのテスト"""
+
+import multiprocessing
+import threading
+from pathlib import Path
+
+import pytest
+
+from utils import storage
+from utils.storage import JsonStore, SQLiteStore, IntegrityError
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        s = JsonStore(tmp_path / "data")
+    else:
+        s = SQLiteStore(tmp_path / "data" / "test.sqlite3")
+    s.ensure_tables()
+    return s
+
+
+def _score(store, submission_id, barrier, results):
+    with store.transaction():
+        result_id = store.insert("evaluation_results", {"submission_id": submission_id})
+        barrier.wait()
+        store.insert("evaluation_details", {"evaluation_result_id": result_id, "score": submission_id})
+        barrier.wait()
+    results[submission_id] = result_id
+
+
+def test_interleaved_transactions_get_distinct_ids(store):
+    barrier = threading.Barrier(2)
+    results = {}
+    threads = [threading.Thread(target=_score, args=(store, i, barrier, results)) for i in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results[1] != results[2]
+    rows = {row["id"]: row for row in store.all("evaluation_results")}
+    assert rows[results[1]]["submission_id"] == 1
+    assert rows[results[2]]["submission_id"] == 2
+    for detail in store.all("evaluation_details"):
+        assert rows[detail["evaluation_result_id"]]["submission_id"] == detail["score"]
+
+
+def test_rollback_discards_writes_and_skips_after_commit(store):
+    called = []
+    with pytest.raises(RuntimeError):
+        with store.transaction() as tx:
+            store.insert("schools", {"name": "A"})
+            tx.after_commit(lambda: called.append(True))
+            raise RuntimeError("中断")
+    assert store.all("schools") == []
+    assert called == []
+
+    with store.transaction() as tx:
+        school_id = store.insert("schools", {"name": "B"})
+        tx.after_commit(lambda: called.append(store.get("schools", school_id)["name"]))
+    assert called == ["B"]
+
+
+def test_ids_are_not_reused_after_rollback(store):
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.insert("schools", {"name": "A"})
+            raise RuntimeError("中断")
+    school_id = store.insert("schools", {"name": "B"})
+    assert store.get("schools", school_id)["name"] == "B"
+    assert store.insert("schools", {"name": "C"}) == school_id + 1
+
+
+def test_reads_inside_transaction_see_pending_writes(store):
+    with store.transaction():
+        school_id = store.insert("schools", {"name": "A"})
+        store.update("schools", school_id, {"name": "B"})
+        assert store.get("schools", school_id)["name"] == "B"
+        assert store.count("schools") == 1
+    assert store.get("schools", school_id)["name"] == "B"
+
+
+def test_duplicate_explicit_id_is_rejected(store):
+    store.insert("schools", {"id": 5, "name": "A"})
+    with pytest.raises(IntegrityError):
+        store.insert("schools", {"id": 5, "name": "B"})
+    assert [row["name"] for row in store.all("schools")] == ["A"]
+
+
+def _insert_in_process(data_dir, worker, count):
+    s = JsonStore(Path(data_dir))
+    for index in range(count):
+        with s.transaction():
+            result_id = s.insert("evaluation_results", {"submission_id": worker})
+            s.insert("evaluation_details", {"evaluation_result_id": result_id, "score": worker})
+
+
+@pytest.mark.skipif(storage.fcntl is None, reason="fcntl が使えない環境")
+def test_json_store_concurrent_processes(tmp_path):
+    data_dir = tmp_path / "data"
+    JsonStore(data_dir).ensure_tables()
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_insert_in_process, args=(str(data_dir), worker, 20))
+                 for worker in (1, 2, 3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    s = JsonStore(data_dir)
+    results = s.all("evaluation_results")
+    details = s.all("evaluation_details")
+    assert len(results) == len({row["id"] for row in results}) == 60
+    assert len(details) == len({row["id"] for row in details}) == 60
+    by_id = {row["id"]: row for row in results}
+    for detail in details:
+        assert by_id[detail["evaluation_result_id"]]["submission_id"] == detail["score"]
+
+
+def test_json_commit_interrupted_between_renames_is_rolled_forward(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    s = JsonStore(data_dir)
+    s.ensure_tables()
+
+    original_replace = Path.replace
+    calls = []
+
+    def crash_on_second_table(self, target):
+        if self.name.endswith(".json.tmp") and not self.name.startswith("."):
+            calls.append(self.name)
+            if len(calls) == 2:
+                raise OSError("中断")
+        return original_replace(self, target)
+
+    monkeypatch.setattr(Path, "replace", crash_on_second_table)
+    with pytest.raises(OSError):
+        with s.transaction():
+            s.replace_all("schools", [{"id": 1, "name": "A"}])
+            s.replace_all("submissions", [{"id": 1, "school_id": 1}])
+    monkeypatch.setattr(Path, "replace", original_replace)
+    assert (data_dir / storage.JSON_JOURNAL_FILENAME).exists()
+
+    # 別のプロセスとして開き直すと、ジャーナルから残りのテーブルが反映される
+    reopened = JsonStore(data_dir)
+    assert reopened.all("schools") == [{"id": 1, "name": "A"}]
+    assert reopened.all("submissions") == [{"id": 1, "school_id": 1}]
+    assert not (data_dir / storage.JSON_JOURNAL_FILENAME).exists()
+
+
+def test_json_commit_interrupted_before_journal_is_discarded(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    s = JsonStore(data_dir)
+    s.ensure_tables()
+    s.replace_all("schools", [{"id": 1, "name": "A"}])
+
+    original_dump = storage.dump_table_file
+
+    def crash_on_second_table(file_path, rows, compact=False):
+        if file_path.name.startswith("submissions"):
+            raise OSError("中断")
+        return original_dump(file_path, rows, compact)
+
+    monkeypatch.setattr(storage, "dump_table_file", crash_on_second_table)
+    with pytest.raises(OSError):
+        with s.transaction():
+            s.replace_all("schools", [{"id": 2, "name": "B"}])
+            s.replace_all("submissions", [{"id": 1, "school_id": 2}])
+
+    reopened = JsonStore(data_dir)
+    assert reopened.all("schools") == [{"id": 1, "name": "A"}]
+    assert reopened.all("submissions") == []
+
+
+def test_change_listener_receives_committed_ids(store):
+    changes = []
+    store.add_change_listener(changes.append)
+    with store.transaction():
+        result_id = store.insert("evaluation_results", {"submission_id": 1})
+    assert changes[-1]["table"] == "evaluation_results"
+    assert changes[-1]["ops"] == [("insert", {"id": result_id, "submission_id": 1})]
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""utils.telemetry の呼び出し記録の集計のテスト"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.telemetry import TelemetryStore, get_summary_since, percentile
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TelemetryStore(tmp_path / "telemetry.sqlite3")
+
+
+def _call(store, days_ago=0, **fields):
+    call = {
+        "called_at": (datetime.now() - timedelta(days=days_ago)).isoformat(),
+        "provider": "openai", "model": "gpt-4", "operation": "criterion",
+        "prompt_tokens": 100, "completion_tokens": 20, "attempts": 1,
+        "outcome": "success", "cost_usd": 0.01,
+    }
+    call.update(fields)
+    return store.record(call)
+
+
+def test_summary_totals_and_groups(store):
+    _call(store, criterion_id=1, submission_id=10, latency_ms=100)
+    _call(store, criterion_id=1, submission_id=10, latency_ms=300, attempts=3)
+    _call(store, criterion_id=2, submission_id=11, latency_ms=200, prompt_tokens=300)
+    _call(store, operation="combined", submission_id=11, latency_ms=1000)
+    _call(store, criterion_id=2, submission_id=11, outcome="error", latency_ms=None,
+          prompt_tokens=0, completion_tokens=0, attempts=2, cost_usd=None)
+    _call(store, criterion_id=None, latency_ms=50)
+
+    summary = store.summary()
+    assert (summary["calls"], summary["errors"], summary["retries"]) == (6, 1, 3)
+    assert summary["prompt_tokens"] == 100 * 4 + 300
+    assert summary["completion_tokens"] == 20 * 5
+    assert summary["cost_usd"] == pytest.approx(0.05)
+    assert summary["p50_ms"] == percentile([100, 300, 200, 1000, 50], 50)
+    assert summary["p95_ms"] == percentile([100, 300, 200, 1000, 50], 95)
+
+    # 評価項目ごとの集計は成功した呼び出しのみ
+    by_criterion = summary["by_criterion"]
+    assert set(by_criterion) == {"1", "2", "combined", "None"}
+    assert by_criterion["1"]["calls"] == 2
+    assert by_criterion["1"]["p50_ms"] == 200
+    assert by_criterion["2"] == {"calls": 1, "p50_ms": 200, "p95_ms": 200, "avg_tokens": 320}
+    assert by_criterion["combined"]["calls"] == 1
+
+    # 提出資料ごとの集計はエラーも含み、提出資料のない呼び出しは除く
+    assert summary["by_submission"] == {
+        10: {"calls": 2, "tokens": 240, "cost_usd": pytest.approx(0.02)},
+        11: {"calls": 3, "tokens": 440, "cost_usd": pytest.approx(0.02)},
+    }
+    assert summary["submissions"] == 2
+    assert summary["tokens_per_submission"] == 340
+
+
+def test_summary_only_counts_calls_since(store):
+    _call(store, days_ago=40, criterion_id=1, submission_id=1, latency_ms=5000)
+    _call(store, days_ago=1, criterion_id=1, submission_id=2, latency_ms=100)
+
+    recent = store.summary(since=get_summary_since(30))
+    assert recent["calls"] == 1
+    assert recent["p95_ms"] == 100
+    assert list(recent["by_submission"]) == [2]
+    assert store.summary()["calls"] == 2
+
+
+def test_summary_window_can_be_disabled(monkeypatch):
+    monkeypatch.setenv("TELEMETRY_SUMMARY_DAYS", "0")
+    assert get_summary_since() is None
+    monkeypatch.setenv("TELEMETRY_SUMMARY_DAYS", "7")
+    since = datetime.fromisoformat(get_summary_since())
+    assert timedelta(days=6, hours=23) < datetime.now() - since < timedelta(days=7, minutes=1)
+
+
+def test_empty_summary(store):
+    summary = store.summary()
+    assert summary["calls"] == summary["errors"] == summary["retries"] == 0
+    assert summary["p50_ms"] is None and summary["tokens_per_submission"] is None
+    assert summary["by_criterion"] == {} and summary["by_submission"] == {}
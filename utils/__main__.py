@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+python -m utils でコマンドラインツールを実行
+"""
+
+import sys
+
+from utils.cli import main
+
+sys.exit(main())
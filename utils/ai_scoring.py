@@ -6,12 +6,78 @@ OpenAI GPT-4またはGoogle Geminiを使用して採点を実行します。
 """
 
 import os
-from typing import Dict, List, Optional
+import re
+import json
+import hashlib
+import queue
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional, Iterator, Iterable
+from utils.response_cache import get_response_cache, make_cache_key, text_sha256
+from utils.rate_limiter import get_rate_limiter, estimate_tokens, get_limits
+from utils.retry_policy import (
+    call_with_retry, get_retry_policy, get_status_code, is_rate_limit_error, CircuitOpenError
+)
+from utils.telemetry import track_call, telemetry_context, CallRecord
+from utils.st_cache import cached_resource, is_streamlit_running
 
-# グローバル変数（セッション状態から設定）
-_client = None
-_ai_provider = None
-_genai_configured = False
+# set_api_key で設定したクライアントを保持するセッション状態のキー
+# （プロバイダー・APIキーはセッションごとに持ち、他のセッションの採点には影響しない）
+SESSION_CLIENT_KEY = "ai_client"
+
+# このセッションで選んだ採点モードを保存するセッション状態のキー
+SESSION_SCORING_MODE_KEY = "scoring_mode"
+
+SUPPORTED_PROVIDERS = ("openai", "gemini")
+
+# プロバイダーごとの同時リクエスト数の上限（環境変数 OPENAI_MAX_CONCURRENCY / GEMINI_MAX_CONCURRENCY で変更可能）
+DEFAULT_PROVIDER_CONCURRENCY = {
+    "openai": 6,
+    "gemini": 2,  # 無料プランはRPMが小さいため控えめに設定
+}
+
+# プロンプトに含める提出資料の最大文字数（トークン制限を考慮）
+MAX_CONTENT_CHARS = 8000
+
+# 採点に使うOpenAIのモデルと温度（一貫性を高めるため低く設定）
+OPENAI_MODEL = "gpt-4"
+SCORING_TEMPERATURE = 0.1
+
+# プロンプトの組み立て方を変更したら上げる（応答キャッシュのキーに含まれる）
+PROMPT_VERSION = 1
+
+# 採点モード（環境変数 SCORING_MODE で既定値を変更可能）
+# - per_criterion: 評価項目ごとに1回ずつ呼び出す
+# - combined: 提出資料を1回だけ送り、6項目をまとめて採点する
+SCORING_MODES = ("per_criterion", "combined")
+DEFAULT_SCORING_MODE = "per_criterion"
+
+# Geminiのモデル解決結果を再利用する期間（秒、環境変数 GEMINI_MODEL_TTL で変更可能）
+GEMINI_MODEL_TTL = int(os.getenv("GEMINI_MODEL_TTL", "3600"))
+
+# 優先順位つきのGeminiモデル候補（2024年12月時点で利用可能なモデル）
+GEMINI_MODEL_NAMES = [
+    'gemini-1.5-flash',  # 最新の高速モデル
+    'gemini-1.5-pro',    # 最新の高性能モデル
+    'gemini-1.0-pro',    # 旧バージョン
+    'gemini-pro'         # 旧バージョン（非推奨）
+]
+
+# プロセス内の全セッションで共有する同時実行数の制御
+_provider_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_provider_semaphores_lock = threading.Lock()
+
+# 呼び出し中の処理が保持しているプロバイダーのセマフォ（送信枠を待っている間は解放する）
+_held_semaphore: contextvars.ContextVar = contextvars.ContextVar("held_provider_semaphore", default=None)
+
+# 送信枠の待ち方（max_wait: 待ち時間の上限、on_wait: 待つ場合に待ち時間で呼ばれる）
+# 採点を呼び出したスレッドで決め、ワーカースレッドに引き継ぐ
+_rate_limit_wait: contextvars.ContextVar = contextvars.ContextVar("rate_limit_wait", default={})
+
+# 並列採点中に、ワーカースレッドからの待ち時間の通知を確認する間隔（秒）
+WAIT_NOTICE_INTERVAL = 0.5
 
 def detect_api_provider(api_key: str) -> str:
     """APIキーの形式からプロバイダーを自動検出"""
@@ -27,45 +93,101 @@ def detect_api_provider(api_key: str) -> str:
         # デフォルトはopenai（後方互換性のため）
         return "openai"
 
-def set_api_key(api_key: str, provider: str = None):
-    """APIキーを設定（アプリ内で入力）"""
-    global _client, _ai_provider, _genai_configured
-    
-    # プロバイダーが指定されていない場合は自動検出
-    if provider is None:
-        provider = detect_api_provider(api_key)
-    
-    _ai_provider = provider.lower()
-    
-    # APIキーの形式とプロバイダーが一致しているか確認
-    if _ai_provider == "openai":
+def _validate_api_key(api_key: str, provider: str):
+    """APIキーの形式とプロバイダーが一致しているか確認"""
+    if provider == "openai":
         if not api_key.startswith("sk-"):
             raise ValueError(
                 f"OpenAI APIキーの形式が正しくありません。"
                 f"提供されたキーはGoogle Gemini APIキーのようです（AIzaSy...で始まります）。"
                 f"プロバイダーを「gemini」に変更してください。"
             )
-        from openai import OpenAI
-        _client = OpenAI(api_key=api_key)
-    elif _ai_provider == "gemini":
+    elif provider == "gemini":
         if not api_key.startswith("AIzaSy"):
             raise ValueError(
                 f"Google Gemini APIキーの形式が正しくありません。"
                 f"提供されたキーはOpenAI APIキーのようです（sk-...で始まります）。"
                 f"プロバイダーを「openai」に変更してください。"
             )
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
-        _genai_configured = True
     else:
-        raise ValueError(f"サポートされていないAIプロバイダー: {_ai_provider}")
+        raise ValueError(f"サポートされていないAIプロバイダー: {provider}")
+
+class AIClient:
+    """採点に使うプロバイダーとAPIキー（OpenAIクライアント・Geminiのモデルを保持）
+    
+    create_client で作成し、同じプロバイダー・APIキーのものは全セッションで共有します。
+    採点関数には、このオブジェクトを引数で渡します。
+    """
+    
+    def __init__(self, provider: str, api_key: str):
+        self.provider = provider
+        self.api_key = api_key
+    
+    def openai_client(self):
+        """OpenAIクライアント（APIキーごとに1つ）"""
+        return get_openai_client(self.api_key)
+    
+    def gemini_session(self) -> "GeminiSession":
+        """Geminiセッション（APIキーごとに1つ）"""
+        return get_gemini_session(self.api_key)
+
+@cached_resource
+def _create_ai_client(provider: str, api_key: str) -> AIClient:
+    """プロバイダー・APIキーごとのクライアントを作成（Streamlitの実行中は st.cache_resource で共有）"""
+    client = AIClient(provider, api_key)
+    if provider == "openai":
+        client.openai_client()
+    elif provider == "gemini":
+        # 利用するモデルを一度だけ解決しておく（失敗時は初回の採点時に再試行）
+        try:
+            client.gemini_session().resolve()
+        except Exception:
+            pass
+    return client
 
-def is_api_configured() -> bool:
+def create_client(api_key: str, provider: str = None) -> AIClient:
+    """APIキーを検証してクライアントを取得（プロバイダー省略時はキーの形式から自動検出）"""
+    api_key = api_key.strip()
+    provider = (provider or detect_api_provider(api_key)).lower()
+    _validate_api_key(api_key, provider)
+    return _create_ai_client(provider, api_key)
+
+def set_api_key(api_key: str, provider: str = None) -> AIClient:
+    """APIキーを設定（アプリ内で入力、このセッションだけに反映）
+    
+    Streamlitの実行中はセッション状態に保存します。それ以外（CLIなど）では
+    返されたクライアントを採点関数に渡してください。
+    """
+    client = create_client(api_key, provider)
+    if is_streamlit_running():
+        import streamlit as st
+        st.session_state[SESSION_CLIENT_KEY] = client
+    return client
+
+def get_client(client: Optional[AIClient] = None) -> Optional[AIClient]:
+    """採点に使うクライアントを取得（引数 → このセッションで設定したキー → 環境変数の順、なければNone）"""
+    if client is not None:
+        return client
+    if is_streamlit_running():
+        import streamlit as st
+        session_client = st.session_state.get(SESSION_CLIENT_KEY)
+        if session_client is not None:
+            return session_client
+    return client_from_env()
+
+def is_api_configured(client: Optional[AIClient] = None) -> bool:
     """APIキーが設定されているか確認"""
-    # 環境変数からも確認（Streamlit Cloud用）
-    if os.getenv("OPENAI_API_KEY") or os.getenv("GOOGLE_API_KEY"):
-        return True
-    return _client is not None or _genai_configured
+    return get_client(client) is not None
+
+@cached_resource
+def _create_openai_client(api_key: str):
+    """APIキーごとのOpenAIクライアントを作成（Streamlitの実行中は st.cache_resource で共有）"""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
+def get_openai_client(api_key: str):
+    """APIキーに対応するOpenAIクライアントを取得"""
+    return _create_openai_client(api_key)
 
 def get_api_provider_from_env() -> Optional[str]:
     """環境変数からAPIプロバイダーを取得"""
@@ -75,19 +197,165 @@ def get_api_provider_from_env() -> Optional[str]:
         return "gemini"
     return None
 
-def initialize_from_env():
-    """環境変数からAPIキーを初期化（Streamlit Cloud用）"""
-    global _client, _ai_provider, _genai_configured
-    
+def client_from_env() -> Optional[AIClient]:
+    """環境変数のAPIキーのクライアントを取得（Streamlit Cloud用、未設定の場合はNone）"""
+    provider = get_api_provider_from_env()
+    if provider == "openai":
+        return _create_ai_client(provider, os.getenv("OPENAI_API_KEY").strip())
+    elif provider == "gemini":
+        return _create_ai_client(provider, os.getenv("GOOGLE_API_KEY").strip())
+    return None
+
+def initialize_from_env() -> Optional[AIClient]:
+    """環境変数からAPIキーを初期化（Streamlit Cloud用、キーの形式を起動時に検証する）"""
     provider = get_api_provider_from_env()
     if provider == "openai":
-        api_key = os.getenv("OPENAI_API_KEY")
-        if api_key:
-            set_api_key(api_key, provider)
+        return create_client(os.getenv("OPENAI_API_KEY"), provider)
     elif provider == "gemini":
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if api_key:
-            set_api_key(api_key, provider)
+        return create_client(os.getenv("GOOGLE_API_KEY"), provider)
+    return None
+
+# ==================== Geminiモデルセッション ====================
+
+class GeminiSession:
+    """APIキーごとに解決済みのGeminiモデルを保持し、TTL経過後に再解決する
+    
+    genai.configure（プロセス全体の設定）は使わず、APIキーを指定したサービスクライアントで呼び出します。
+    """
+    
+    def __init__(self, api_key: str, ttl: int = GEMINI_MODEL_TTL):
+        self.api_key = api_key
+        self.ttl = ttl
+        self.model_name: Optional[str] = None
+        self.available_models: List[str] = []
+        self.resolved_at: Optional[float] = None
+        self._model = None
+        self._lock = threading.Lock()
+    
+    def is_expired(self) -> bool:
+        import time
+        if self._model is None or self.resolved_at is None:
+            return True
+        return time.monotonic() - self.resolved_at >= self.ttl
+    
+    def _service_client(self, name: str):
+        """このAPIキーのサービスクライアント（"Model" / "Generative"）"""
+        import google.ai.generativelanguage as glm
+        return getattr(glm, f"{name}ServiceClient")(client_options={"api_key": self.api_key})
+    
+    def invalidate(self):
+        """キャッシュを破棄し、次回の呼び出し時にモデルを再解決する"""
+        with self._lock:
+            self._model = None
+            self.resolved_at = None
+    
+    def resolve(self) -> str:
+        """利用可能なモデル一覧を確認し、優先順位に従ってモデルを選択する"""
+        import time
+        import google.generativeai as genai
+        
+        with self._lock:
+            # 他のスレッドが解決済みの場合はそのまま使う
+            if not self.is_expired():
+                return self.model_name
+            
+            successful_model = None
+            available_model_names = []
+            
+            # まず、モデル一覧から利用可能なモデルを確認を試みる
+            try:
+                for model_info in genai.list_models(client=self._service_client("Model")):
+                    if hasattr(model_info, 'name'):
+                        model_full_name = model_info.name
+                        model_short_name = model_full_name.split('/')[-1] if '/' in model_full_name else model_full_name
+                        supported_methods = getattr(model_info, 'supported_generation_methods', [])
+                        if 'generateContent' in supported_methods:
+                            available_model_names.append(model_short_name)
+            except Exception:
+                # モデル一覧取得に失敗した場合は、候補を直接試行する
+                available_model_names = []
+            
+            # 利用可能なモデルが見つかった場合、優先順位に従って選択
+            if available_model_names:
+                for preferred in GEMINI_MODEL_NAMES:
+                    if preferred in available_model_names:
+                        successful_model = preferred
+                        break
+                # 見つからない場合は、最初の利用可能なモデルを使用
+                if not successful_model:
+                    successful_model = available_model_names[0]
+            
+            model = None
+            last_error = None
+            candidates = [successful_model] if successful_model else GEMINI_MODEL_NAMES
+            for test_model_name in candidates:
+                try:
+                    model = genai.GenerativeModel(test_model_name)
+                    # 既定のクライアント（genai.configure の設定）ではなく、このAPIキーのクライアントを使う
+                    model._client = self._service_client("Generative")
+                    successful_model = test_model_name
+                    break
+                except Exception as e:
+                    last_error = e
+                    continue
+            
+            if model is None:
+                error_msg = f"利用可能なGeminiモデルが見つかりませんでした。\n"
+                error_msg += f"試行したモデル: {', '.join(candidates)}\n"
+                if last_error:
+                    error_msg += f"最後のエラー: {last_error}"
+                raise Exception(error_msg)
+            
+            self._model = model
+            self.model_name = successful_model
+            self.available_models = available_model_names
+            self.resolved_at = time.monotonic()
+            return successful_model
+    
+    def get_model(self):
+        """キャッシュ済みのモデルを返す（期限切れの場合は再解決）"""
+        if self.is_expired():
+            self.resolve()
+        return self._model
+
+_gemini_sessions: Dict[str, GeminiSession] = {}
+_gemini_sessions_lock = threading.Lock()
+
+def get_gemini_session(api_key: str) -> GeminiSession:
+    """APIキーに対応するGeminiセッションを取得"""
+    if not api_key:
+        raise ValueError("Google Gemini APIキーが設定されていません")
+    
+    with _gemini_sessions_lock:
+        session = _gemini_sessions.get(api_key)
+        if session is None:
+            session = GeminiSession(api_key)
+            _gemini_sessions[api_key] = session
+        return session
+
+def _gemini_client(client: Optional[AIClient]) -> AIClient:
+    client = get_client(client)
+    if client is None or client.provider != "gemini":
+        raise ValueError("Google Gemini APIキーが設定されていません")
+    return client
+
+def check_gemini_health(client: Optional[AIClient] = None) -> Dict[str, any]:
+    """Geminiのモデルを再解決し、利用可能なモデルを返す（API設定ページの確認用）"""
+    session = _gemini_client(client).gemini_session()
+    session.invalidate()
+    model_name = session.resolve()
+    return {
+        "model": model_name,
+        "available_models": list(session.available_models),
+    }
+
+def get_gemini_model_name(client: Optional[AIClient] = None) -> Optional[str]:
+    """解決済みのGeminiモデル名を返す（未解決の場合はNone）"""
+    client = get_client(client)
+    if client is None or client.provider != "gemini":
+        return None
+    session = _gemini_sessions.get(client.api_key)
+    return session.model_name if session else None
 
 # 評価基準のプロンプトテンプレート（改善版：具体的なルーブリックとFew-shot Learningを含む）
 EVALUATION_PROMPTS = {
@@ -297,42 +565,43 @@ EVALUATION_PROMPTS = {
     },
 }
 
-def evaluate_with_openai(content: str, criterion_id: int) -> Dict[str, any]:
-    """OpenAI GPT-4を使用して採点"""
-    if _client is None:
-        raise ValueError("OpenAI APIキーが設定されていません")
+def _parse_json_result(result_text: str) -> Dict[str, any]:
+    """応答テキストから採点結果のJSONを抽出（```json で囲まれている場合がある）
     
+    Raises:
+        ValueError: JSONが見つからない・読み取れない場合（採点エラーとして扱い、キャッシュしない）
+    """
+    json_match = re.search(r'\{[^{}]*\}', result_text or "", re.DOTALL)
+    if not json_match:
+        raise ValueError(f"応答から採点結果（JSON）を読み取れませんでした: {(result_text or '')[:100]}")
+    return json.loads(json_match.group())
+
+def build_prompt(content: str, criterion_id: int) -> str:
+    """評価項目ごとのプロンプトを作成"""
     prompt_template = EVALUATION_PROMPTS[criterion_id]["prompt"]
-    prompt = prompt_template.format(content=content[:8000])  # トークン制限を考慮
+    return prompt_template.format(content=content[:MAX_CONTENT_CHARS])  # トークン制限を考慮
+
+def evaluate_with_openai(content: str, criterion_id: int, client: Optional[AIClient] = None) -> Dict[str, any]:
+    """OpenAI GPT-4を使用して採点"""
+    return _parse_json_result(_generate_with_openai(build_prompt(content, criterion_id), client))
+
+def _generate_with_openai(prompt: str, client: Optional[AIClient] = None) -> str:
+    """OpenAI GPT-4にプロンプトを送信し、応答テキストを返す（共通のリトライポリシーで再試行）"""
+    client = get_client(client)
+    if client is None or client.provider != "openai":
+        raise ValueError("OpenAI APIキーが設定されていません")
+    openai_client = client.openai_client()
     
     try:
-        response = _client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "あなたは教育現場の審査員です。提出資料を客観的かつ公平に評価してください。評価基準に基づいて、一貫性のある採点を行ってください。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,  # 一貫性を高めるため低く設定（0.1-0.2推奨）
-        )
-        
-        result_text = response.choices[0].message.content
-        # JSONを抽出（```json で囲まれている場合がある）
-        import json
-        import re
-        
-        # JSON部分を抽出
-        json_match = re.search(r'\{[^{}]*\}', result_text, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group())
-        else:
-            # JSONが見つからない場合はデフォルト値を返す
-            result = {"score": 5, "reason": "評価できませんでした"}
-        
-        return result
+        with track_call("openai", OPENAI_MODEL) as call:
+            return call_with_retry("openai", lambda: _request_openai(openai_client, prompt, call))
+    except CircuitOpenError:
+        raise
     except Exception as e:
         error_msg = str(e)
+        status = get_status_code(e)
         # 403エラーの場合の詳細なメッセージ
-        if "403" in error_msg or "Forbidden" in error_msg:
+        if status == 403 or (status is None and ("403" in error_msg or "Forbidden" in error_msg)):
             raise Exception(
                 f"OpenAI APIへのアクセスが拒否されました（403エラー）。\n"
                 f"考えられる原因：\n"
@@ -347,15 +616,15 @@ def evaluate_with_openai(content: str, criterion_id: int) -> Dict[str, any]:
                 f"元のエラー: {error_msg}"
             )
         # 401エラーの場合（認証エラー）
-        elif "401" in error_msg or "Unauthorized" in error_msg:
+        elif status == 401 or (status is None and ("401" in error_msg or "Unauthorized" in error_msg)):
             raise Exception(
                 f"OpenAI APIの認証に失敗しました（401エラー）。\n"
                 f"APIキーが正しく設定されていないか、無効です。\n"
                 f"「⚙️ API設定」ページでAPIキーを再設定してください。\n"
                 f"元のエラー: {error_msg}"
             )
-        # 429エラー（レート制限）
-        elif "429" in error_msg or "rate limit" in error_msg.lower():
+        # 429エラー（レート制限）- リトライしても解消しなかった場合
+        elif is_rate_limit_error(e):
             raise Exception(
                 f"OpenAI APIのレート制限に達しました（429エラー）。\n"
                 f"しばらく待ってから再度お試しください。\n"
@@ -364,102 +633,50 @@ def evaluate_with_openai(content: str, criterion_id: int) -> Dict[str, any]:
         else:
             raise Exception(f"OpenAI API呼び出しエラー: {error_msg}")
 
-def evaluate_with_gemini(content: str, criterion_id: int, retry_count: int = 0, max_retries: int = 3) -> Dict[str, any]:
-    """Google Geminiを使用して採点（レート制限対応のリトライ機能付き）"""
-    if not _genai_configured:
-        raise ValueError("Google Gemini APIキーが設定されていません")
+def _request_openai(client, prompt: str, call: CallRecord) -> str:
+    """OpenAIへの1回分の呼び出し（エラーは変換せずにそのまま送出）"""
+    limiter = get_rate_limiter()
+    reservation = _wait_for_send_slot("openai", prompt)
     
-    import google.generativeai as genai
-    import time
+    call.start_attempt()
+    try:
+        response = client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": "あなたは教育現場の審査員です。提出資料を客観的かつ公平に評価してください。評価基準に基づいて、一貫性のある採点を行ってください。"},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=SCORING_TEMPERATURE,  # 一貫性を高めるため低く設定（0.1-0.2推奨）
+        )
+    finally:
+        call.finish_attempt()
     
-    prompt_template = EVALUATION_PROMPTS[criterion_id]["prompt"]
-    prompt = prompt_template.format(content=content[:8000])
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        call.finish_attempt(getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+        if getattr(usage, "total_tokens", None):
+            limiter.settle(reservation["id"], usage.total_tokens)
+    return response.choices[0].message.content
+
+def evaluate_with_gemini(content: str, criterion_id: int, client: Optional[AIClient] = None) -> Dict[str, any]:
+    """Google Geminiを使用して採点（レート制限・一時的な障害はリトライ）"""
+    return _parse_json_result(_generate_with_gemini(build_prompt(content, criterion_id), client))
+
+def _generate_with_gemini(prompt: str, client: Optional[AIClient] = None) -> str:
+    """Google Geminiにプロンプトを送信し、応答テキストを返す（共通のリトライポリシーで再試行）"""
+    session = _gemini_client(client).gemini_session()
     
     try:
-        # 利用可能なモデルを順に試行
-        # 最新のモデル名から順に試す（2024年12月時点で利用可能なモデル）
-        model_names = [
-            'gemini-1.5-flash',  # 最新の高速モデル
-            'gemini-1.5-pro',    # 最新の高性能モデル
-            'gemini-1.0-pro',    # 旧バージョン
-            'gemini-pro'         # 旧バージョン（非推奨）
-        ]
-        
-        model = None
-        last_error = None
-        successful_model = None
-        
-        # まず、モデル一覧から利用可能なモデルを確認を試みる
-        try:
-            available_models_list = list(genai.list_models())
-            if available_models_list:
-                # 利用可能なモデル名を抽出
-                available_model_names = []
-                for model_info in available_models_list:
-                    if hasattr(model_info, 'name'):
-                        model_full_name = model_info.name
-                        model_short_name = model_full_name.split('/')[-1] if '/' in model_full_name else model_full_name
-                        supported_methods = getattr(model_info, 'supported_generation_methods', [])
-                        if 'generateContent' in supported_methods:
-                            available_model_names.append(model_short_name)
-                
-                # 利用可能なモデルが見つかった場合、優先順位に従って選択
-                if available_model_names:
-                    for preferred in model_names:
-                        if preferred in available_model_names:
-                            successful_model = preferred
-                            break
-                    # 見つからない場合は、最初の利用可能なモデルを使用
-                    if not successful_model and available_model_names:
-                        successful_model = available_model_names[0]
-        except Exception:
-            # モデル一覧取得に失敗した場合は、直接試行に進む
-            pass
-        
-        # モデル一覧から見つかった場合はそれを使用、そうでない場合は直接試行
-        if successful_model:
-            model = genai.GenerativeModel(successful_model)
-        else:
-            # 直接モデル名を試行（実際の呼び出し時にエラーをキャッチ）
-            for test_model_name in model_names:
-                try:
-                    model = genai.GenerativeModel(test_model_name)
-                    successful_model = test_model_name
-                    # モデルオブジェクトの作成に成功したら、実際の呼び出しで確認
-                    break
-                except Exception as e:
-                    last_error = e
-                    continue
-        
-        if model is None:
-            error_msg = f"利用可能なGeminiモデルが見つかりませんでした。\n"
-            error_msg += f"試行したモデル: {', '.join(model_names)}\n"
-            if last_error:
-                error_msg += f"最後のエラー: {last_error}"
-            raise Exception(error_msg)
-        
-        # 実際の採点を実行（温度設定で一貫性を高める）
-        generation_config = {
-            "temperature": 0.1,  # 一貫性を高めるため低く設定
-        }
-        response = model.generate_content(prompt, generation_config=generation_config)
-        
-        result_text = response.text
-        # JSONを抽出
-        import json
-        import re
-        
-        json_match = re.search(r'\{[^{}]*\}', result_text, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group())
-        else:
-            result = {"score": 5, "reason": "評価できませんでした"}
-        
-        return result
+        with track_call("gemini", session.model_name) as call:
+            return call_with_retry("gemini", lambda: _request_gemini(session, prompt, call))
+    except CircuitOpenError:
+        raise
     except Exception as e:
         error_msg = str(e)
+        status = get_status_code(e)
         # 403エラーの場合の詳細なメッセージ
-        if "403" in error_msg or "Forbidden" in error_msg or "PERMISSION_DENIED" in error_msg:
+        if status == 403 or (status is None and (
+                "403" in error_msg or "Forbidden" in error_msg or "PERMISSION_DENIED" in error_msg)):
             raise Exception(
                 f"Google Gemini APIへのアクセスが拒否されました（403エラー）。\n"
                 f"考えられる原因：\n"
@@ -475,105 +692,443 @@ def evaluate_with_gemini(content: str, criterion_id: int, retry_count: int = 0,
                 f"元のエラー: {error_msg}"
             )
         # 401エラーの場合（認証エラー）
-        elif "401" in error_msg or "Unauthorized" in error_msg or "API_KEY_INVALID" in error_msg:
+        elif (status == 401 or "API_KEY_INVALID" in error_msg
+              or (status is None and ("401" in error_msg or "Unauthorized" in error_msg))):
             raise Exception(
                 f"Google Gemini APIの認証に失敗しました（401エラー）。\n"
                 f"APIキーが正しく設定されていないか、無効です。\n"
                 f"「⚙️ API設定」ページでAPIキーを再設定してください。\n"
                 f"元のエラー: {error_msg}"
             )
-        # 429エラー（レート制限）- リトライ可能
-        elif ("429" in error_msg or "rate limit" in error_msg.lower() or 
-              "RESOURCE_EXHAUSTED" in error_msg or "quota" in error_msg.lower()):
-            if retry_count < max_retries:
-                # レート制限の場合は待機してリトライ
-                wait_time = (retry_count + 1) * 15  # 15秒、30秒、45秒と段階的に待機
-                raise Exception(
-                    f"⚠️ Google Gemini APIのレート制限に達しました（429エラー）。\n"
-                    f"{wait_time}秒待機してからリトライします（{retry_count + 1}/{max_retries}回目）...\n\n"
-                    f"【レート制限について】\n"
-                    f"無料プランの場合：\n"
-                    f"- 1分あたり5リクエスト（RPM）\n"
-                    f"- 1日あたり25リクエスト（RPD）\n\n"
-                    f"元のエラー: {error_msg}"
-                )
-            else:
-                # 最大リトライ回数に達した場合
-                raise Exception(
-                    f"⚠️ Google Gemini APIのレート制限に達しました（429エラー）。\n"
-                    f"最大リトライ回数（{max_retries}回）に達しました。\n\n"
-                    f"【レート制限について】\n"
-                    f"無料プランの場合：\n"
-                    f"- 1分あたり5リクエスト（RPM）\n"
-                    f"- 1日あたり25リクエスト（RPD）\n\n"
-                    f"【対処方法】\n"
-                    f"1. 1-2分待ってから再度お試しください\n"
-                    f"2. 有料プランにアップグレードすると、制限が緩和されます（RPM 300、RPD 1,000）\n"
-                    f"3. Google Cloud ConsoleでAPIの利用状況を確認してください\n\n"
-                    f"元のエラー: {error_msg}"
-                )
+        # 429エラー（レート制限）- リトライしても解消しなかった場合
+        elif is_rate_limit_error(e):
+            limits = get_limits("gemini")
+            raise Exception(
+                f"⚠️ Google Gemini APIのレート制限に達しました（429エラー）。\n"
+                f"最大リトライ回数（{get_retry_policy().max_attempts}回）に達しました。\n\n"
+                f"【レート制限について】\n"
+                f"このアプリに設定されている上限（環境変数 GEMINI_RPM / GEMINI_RPD）：\n"
+                f"- 1分あたり{limits['rpm'] or '無制限'}リクエスト（RPM）\n"
+                f"- 1日あたり{limits['rpd'] or '無制限'}リクエスト（RPD）\n"
+                f"ご契約のプランの上限がこれより低い場合は、環境変数で設定を合わせてください。\n\n"
+                f"【対処方法】\n"
+                f"1. 1-2分待ってから再度お試しください\n"
+                f"2. 有料プランにアップグレードすると、制限が緩和されます\n"
+                f"3. Google Cloud ConsoleでAPIの利用状況を確認してください\n\n"
+                f"元のエラー: {error_msg}"
+            )
         else:
+            # モデルが廃止・変更された場合は次回呼び出し時に再解決する
+            if status == 404 or "not found" in error_msg.lower():
+                session.invalidate()
             raise Exception(f"Gemini API呼び出しエラー: {error_msg}")
 
-def evaluate_criterion(content: str, criterion_id: int) -> Dict[str, any]:
-    """評価項目ごとに採点を実行（レート制限対応のリトライ機能付き）"""
-    if not is_api_configured():
+def _request_gemini(session: "GeminiSession", prompt: str, call: CallRecord) -> str:
+    """Geminiへの1回分の呼び出し（エラーは変換せずにそのまま送出）"""
+    limiter = get_rate_limiter()
+    reservation = _wait_for_send_slot("gemini", prompt)
+    
+    model = session.get_model()
+    call.model = session.model_name
+    
+    # 実際の採点を実行（温度設定で一貫性を高める）
+    generation_config = {
+        "temperature": SCORING_TEMPERATURE,  # 一貫性を高めるため低く設定
+    }
+    call.start_attempt()
+    try:
+        response = model.generate_content(prompt, generation_config=generation_config)
+    finally:
+        call.finish_attempt()
+    
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        call.finish_attempt(getattr(usage, "prompt_token_count", None),
+                            getattr(usage, "candidates_token_count", None))
+        if getattr(usage, "total_token_count", None):
+            limiter.settle(reservation["id"], usage.total_token_count)
+    return response.text
+
+def _require_client(client: Optional[AIClient]) -> AIClient:
+    client = get_client(client)
+    if client is None:
         raise ValueError("APIキーが設定されていません。設定ページでAPIキーを入力してください。")
+    if client.provider not in SUPPORTED_PROVIDERS:
+        raise ValueError(f"サポートされていないAIプロバイダー: {client.provider}")
+    return client
+
+def evaluate_criterion(content: str, criterion_id: int, client: Optional[AIClient] = None) -> Dict[str, any]:
+    """評価項目ごとに採点を実行（レート制限・一時的な障害はリトライ）"""
+    client = _require_client(client)
+    with telemetry_context(operation="criterion", criterion_id=criterion_id):
+        if client.provider == "openai":
+            return evaluate_with_openai(content, criterion_id, client)
+        return evaluate_with_gemini(content, criterion_id, client)
+
+def _generate(prompt: str, client: Optional[AIClient] = None) -> str:
+    """クライアントのプロバイダーにプロンプトを送信し、応答テキストを返す"""
+    client = _require_client(client)
+    if client.provider == "openai":
+        return _generate_with_openai(prompt, client)
+    return _generate_with_gemini(prompt, client)
+
+# ==================== 一括採点モード ====================
+
+def _validate_scoring_mode(mode: str) -> str:
+    """採点モードを検証し、小文字にして返す"""
+    mode = mode.strip().lower()
+    if mode not in SCORING_MODES:
+        raise ValueError(f"サポートされていない採点モード: {mode}")
+    return mode
+
+def set_scoring_mode(mode: str) -> str:
+    """採点モード（"per_criterion" または "combined"）を設定（このセッションだけに反映）
+    
+    Streamlitの実行中はセッション状態に保存します。それ以外（CLIなど）では
+    返されたモードを採点関数に渡してください。
+    """
+    mode = _validate_scoring_mode(mode)
+    if is_streamlit_running():
+        import streamlit as st
+        st.session_state[SESSION_SCORING_MODE_KEY] = mode
+    return mode
+
+def get_scoring_mode(mode: Optional[str] = None) -> str:
+    """採点モードを取得（引数 → このセッションで選んだモード → 環境変数 SCORING_MODE の順）"""
+    if mode:
+        return _validate_scoring_mode(mode)
+    if is_streamlit_running():
+        import streamlit as st
+        session_mode = st.session_state.get(SESSION_SCORING_MODE_KEY)
+        if session_mode:
+            return session_mode
+    env_mode = os.getenv("SCORING_MODE", DEFAULT_SCORING_MODE).strip().lower()
+    return env_mode if env_mode in SCORING_MODES else DEFAULT_SCORING_MODE
+
+def _criterion_rubric(criterion_id: int) -> str:
+    """評価項目のプロンプトから、評価基準の部分（提出資料・出力形式を除く）を取り出す"""
+    prompt = EVALUATION_PROMPTS[criterion_id]["prompt"]
+    rubric = prompt.split("【提出資料】")[0]
+    # 先頭の「あなたは教育現場の審査員です。…」の行を除く
+    rubric = rubric.split("\n", 1)[1].strip()
+    reason_match = re.search(r'"reason": "([^"]*)"', prompt)
+    if reason_match:
+        rubric += f"\n\n【採点理由の書き方】\n{reason_match.group(1)}"
+    return rubric
+
+def build_combined_prompt(content: str, criterion_ids: Iterable[int]) -> str:
+    """複数の評価項目をまとめて採点するプロンプトを作成（提出資料は1回だけ含める）"""
+    criterion_ids = list(criterion_ids)
+    sections = [
+        f"■ 評価項目ID: {criterion_id}\n{_criterion_rubric(criterion_id)}"
+        for criterion_id in criterion_ids
+    ]
+    examples = ",\n".join(
+        f'    {{"criterion_id": {criterion_id}, "score": 0-10の整数, "reason": "採点理由（日本語で200文字程度）"}}'
+        for criterion_id in criterion_ids
+    )
+    return (
+        f"あなたは教育現場の審査員です。以下の提出資料を読み、次の{len(criterion_ids)}つの評価基準"
+        f"それぞれについて、評価基準に基づいて0-10点で採点してください。"
+        f"各評価基準は互いに独立して採点してください。\n\n"
+        + "\n\n".join(sections)
+        + f"\n\n【提出資料】\n{content[:MAX_CONTENT_CHARS]}\n\n"
+        f"採点結果は、評価項目ごとに1要素ずつ（計{len(criterion_ids)}要素）の"
+        f"以下のJSON配列の形式だけで返してください：\n[\n{examples}\n]"
+    )
+
+def _validate_combined_item(item, criterion_ids) -> Optional[Dict[str, any]]:
+    """一括採点の1要素を検証し、正しければ {criterion_id, score, reason} を返す"""
+    if not isinstance(item, dict):
+        return None
+    criterion_id = item.get("criterion_id")
+    score = item.get("score")
+    reason = item.get("reason")
+    if isinstance(criterion_id, str) and criterion_id.strip().isdigit():
+        criterion_id = int(criterion_id)
+    if isinstance(score, float) and score.is_integer():
+        score = int(score)
+    if (isinstance(criterion_id, bool) or not isinstance(criterion_id, int)
+            or criterion_id not in criterion_ids):
+        return None
+    if isinstance(score, bool) or not isinstance(score, int) or not 0 <= score <= 10:
+        return None
+    if not isinstance(reason, str) or not reason.strip():
+        return None
+    return {"criterion_id": criterion_id, "score": score, "reason": reason}
+
+def parse_combined_result(result_text: str, criterion_ids: Iterable[int]) -> Dict[int, Dict[str, any]]:
+    """一括採点の応答からJSON配列を取り出し、検証を通過した項目だけを返す
     
-    import time
+    Returns:
+        dict: {criterion_id: {"score": ..., "reason": ...}}（不正な項目は含まない）
+    """
+    criterion_ids = set(criterion_ids)
+    start = result_text.find("[")
+    end = result_text.rfind("]")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        items = json.loads(result_text[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(items, list):
+        return {}
     
-    if _ai_provider == "openai":
-        return evaluate_with_openai(content, criterion_id)
-    elif _ai_provider == "gemini":
-        # レート制限対応：リトライロジック
-        max_retries = 3
-        retry_count = 0
-        last_error = None
-        
-        while retry_count <= max_retries:
-            try:
-                return evaluate_with_gemini(content, criterion_id, retry_count, max_retries)
-            except Exception as e:
-                error_msg = str(e)
-                # レート制限エラーの場合、待機してリトライ
-                if ("429" in error_msg or "rate limit" in error_msg.lower() or 
-                    "RESOURCE_EXHAUSTED" in error_msg or "quota" in error_msg.lower()):
-                    if retry_count < max_retries:
-                        wait_time = (retry_count + 1) * 15  # 15秒、30秒、45秒と段階的に待機
-                        last_error = e
-                        retry_count += 1
-                        time.sleep(wait_time)  # 待機
-                        continue
-                    else:
-                        # 最大リトライ回数に達した場合
-                        raise e
-                else:
-                    # レート制限以外のエラーはそのまま再発生
-                    raise e
-        
-        # すべてのリトライが失敗した場合
-        if last_error:
-            raise last_error
-        else:
-            raise Exception("採点中に予期しないエラーが発生しました")
-    else:
-        raise ValueError(f"サポートされていないAIプロバイダー: {_ai_provider}")
+    parsed = {}
+    for item in items:
+        validated = _validate_combined_item(item, criterion_ids)
+        if validated and validated["criterion_id"] not in parsed:
+            parsed[validated["criterion_id"]] = {
+                "score": validated["score"],
+                "reason": validated["reason"]
+            }
+    return parsed
+
+def evaluate_criteria_combined(content: str, criterion_ids: Iterable[int],
+                               client: Optional[AIClient] = None) -> Dict[int, Dict[str, any]]:
+    """1回の呼び出しで複数の評価項目を採点（検証に失敗した項目は結果に含まない）"""
+    criterion_ids = list(criterion_ids)
+    with telemetry_context(operation="combined", criterion_id=None):
+        result_text = _generate(build_combined_prompt(content, criterion_ids), client)
+    return parse_combined_result(result_text, criterion_ids)
+
+def _evaluate_combined_limited(content: str, criterion_ids: List[int],
+                               client: AIClient) -> Dict[int, Dict[str, any]]:
+    """同時実行数の上限を守って一括採点"""
+    with _provider_slot(client.provider):
+        return evaluate_criteria_combined(content, criterion_ids, client)
+
+# ==================== 応答キャッシュ ====================
+
+def get_model_name(client: Optional[AIClient] = None) -> Optional[str]:
+    """クライアントのプロバイダーで採点に使うモデル名を取得（解決できない場合はNone）"""
+    client = get_client(client)
+    if client is None:
+        return None
+    if client.provider == "openai":
+        return OPENAI_MODEL
+    elif client.provider == "gemini":
+        try:
+            session = client.gemini_session()
+            session.get_model()
+            return session.model_name
+        except Exception:
+            return None
+    return None
+
+def prompt_template_hash(criterion_id: int, mode: str) -> str:
+    """評価項目のプロンプトテンプレートと採点モードのハッシュ"""
+    template = json.dumps({
+        "version": PROMPT_VERSION,
+        "mode": mode,
+        "max_content_chars": MAX_CONTENT_CHARS,
+        "criterion": EVALUATION_PROMPTS[criterion_id],
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()
+
+def _response_cache_keys(content: str, criterion_ids: List[int], client: AIClient,
+                         mode: str) -> Dict[int, str]:
+    """評価項目ごとのキャッシュキーを作成（モデルが解決できない場合は空）"""
+    model_name = get_model_name(client)
+    if not model_name:
+        return {}
+    content_hash = text_sha256(content)
+    return {
+        criterion_id: make_cache_key(content_hash, criterion_id, prompt_template_hash(criterion_id, mode),
+                                     client.provider, model_name, SCORING_TEMPERATURE)
+        for criterion_id in criterion_ids
+    }
+
+# ==================== 並列採点 ====================
+
+def get_provider_concurrency(provider: Optional[str] = None) -> int:
+    """プロバイダーの同時リクエスト数の上限を取得（省略時は使用中のクライアントのプロバイダー）"""
+    if provider is None:
+        client = get_client()
+        provider = client.provider if client else "openai"
+    provider = provider.lower()
+    env_value = os.getenv(f"{provider.upper()}_MAX_CONCURRENCY")
+    if env_value:
+        try:
+            return max(1, int(env_value))
+        except ValueError:
+            pass
+    return DEFAULT_PROVIDER_CONCURRENCY.get(provider, 1)
 
-def evaluate_all_criteria(content: str) -> List[Dict[str, any]]:
-    """すべての評価項目について採点を実行"""
-    results = []
-    for criterion_id in range(1, 7):  # 1-6の評価項目
+def _get_provider_semaphore(provider: str) -> threading.BoundedSemaphore:
+    """プロバイダーごとのセマフォを取得（初回に上限値で作成）"""
+    with _provider_semaphores_lock:
+        if provider not in _provider_semaphores:
+            _provider_semaphores[provider] = threading.BoundedSemaphore(
+                get_provider_concurrency(provider)
+            )
+        return _provider_semaphores[provider]
+
+@contextmanager
+def _provider_slot(provider: str):
+    """プロバイダーの同時実行数の枠を1つ確保する"""
+    semaphore = _get_provider_semaphore(provider)
+    with semaphore:
+        token = _held_semaphore.set(semaphore)
         try:
-            result = evaluate_criterion(content, criterion_id)
-            result["criterion_id"] = criterion_id
-            result["criterion_name"] = EVALUATION_PROMPTS[criterion_id]["name"]
-            results.append(result)
-        except Exception as e:
-            # エラーが発生した場合はデフォルト値を設定
-            results.append({
+            yield
+        finally:
+            _held_semaphore.reset(token)
+
+def _wait_for_send_slot(provider: str, prompt: str) -> Dict[str, any]:
+    """上限内に収まる送信時刻を予約し、その時刻まで待つ（他のセッション・プロセスと枠を共有）
+    
+    待っている間は同時実行数の枠を解放し、すぐに送信できる呼び出しに譲ります。
+    """
+    options = _rate_limit_wait.get()
+    return get_rate_limiter().acquire(provider, estimate_tokens(prompt),
+                                      max_wait=options.get("max_wait"),
+                                      on_wait=options.get("on_wait"),
+                                      release_while_waiting=_held_semaphore.get())
+
+def _context_with_wait(max_wait: Optional[float],
+                       on_wait: Optional[Callable[[float], None]]) -> contextvars.Context:
+    """呼び出し元のコンテキストに送信枠の待ち方を設定した複製を作成"""
+    context = contextvars.copy_context()
+    context.run(_rate_limit_wait.set, {"max_wait": max_wait, "on_wait": on_wait})
+    return context
+
+def _evaluate_criterion_limited(content: str, criterion_id: int, client: AIClient) -> Dict[str, any]:
+    """同時実行数の上限を守って1項目を採点"""
+    with _provider_slot(client.provider):
+        return evaluate_criterion(content, criterion_id, client)
+
+def iter_evaluate_criteria(content: str,
+                           criterion_ids: Optional[Iterable[int]] = None,
+                           use_cache: bool = True,
+                           client: Optional[AIClient] = None,
+                           max_wait: Optional[float] = None,
+                           on_wait: Optional[Callable[[float], None]] = None,
+                           mode: Optional[str] = None) -> Iterator[Dict[str, any]]:
+    """評価項目を並列に採点し、完了した順に結果を返す
+    
+    同じ提出資料・プロンプト・モデルで採点済みの項目は応答キャッシュから返します。
+    採点モードが "combined" の場合は、まず全項目を1回の呼び出しで採点し、
+    検証に失敗した項目だけを評価項目ごとに採点します。
+    同時に送信するリクエスト数はプロバイダーごとの上限（get_provider_concurrency）に
+    制限されます。上限はプロセス内のすべてのセッションで共有されます。
+    レート制限の送信枠を待っている間は、同時実行数の枠を他の評価項目に譲ります。
+    
+    Args:
+        content: 提出資料のテキスト
+        criterion_ids: 採点する評価項目ID（省略時は1-6すべて）
+        use_cache: Falseの場合はキャッシュを読まずに採点し直す（結果は保存する）
+        client: 採点に使うクライアント（省略時はこのセッションで設定したAPIキー、または環境変数）
+        max_wait: レート制限の送信枠の待ち時間の上限（秒、省略時は RATE_LIMIT_MAX_WAIT）。
+                  超える場合はその評価項目をエラーにする
+        on_wait: 送信枠を待つ場合に待ち時間（秒）で呼ばれる（呼び出し元のスレッドで呼ぶ）
+        mode: 採点モード（省略時はこのセッションで選んだモード、または環境変数 SCORING_MODE）
+    
+    Yields:
+        dict: criterion_id, criterion_name, score, reason（失敗時は error も含む）
+    """
+    criterion_ids = list(criterion_ids) if criterion_ids is not None else list(EVALUATION_PROMPTS)
+    if not criterion_ids:
+        return
+    # ワーカースレッドからはセッション状態を参照できないため、ここで決めたクライアントを渡す
+    client = _require_client(client)
+    mode = get_scoring_mode(mode)
+    
+    cache = get_response_cache()
+    cache_keys = _response_cache_keys(content, criterion_ids, client, mode)
+    
+    if use_cache and cache_keys:
+        remaining = []
+        for criterion_id in criterion_ids:
+            cached = cache.get(cache_keys[criterion_id])
+            if cached is None:
+                remaining.append(criterion_id)
+                continue
+            yield {
                 "criterion_id": criterion_id,
                 "criterion_name": EVALUATION_PROMPTS[criterion_id]["name"],
-                "score": 0,
-                "reason": f"採点エラー: {str(e)}"
-            })
+                **cached,
+                "cached": True
+            }
+        criterion_ids = remaining
+        if not criterion_ids:
+            return
+    
+    for result in _iter_evaluate_uncached(content, criterion_ids, client, mode, max_wait, on_wait):
+        # 失敗した採点はキャッシュしない
+        if "error" not in result and result["criterion_id"] in cache_keys:
+            cache.put(cache_keys[result["criterion_id"]], result["criterion_id"],
+                      {"score": result.get("score", 0), "reason": result.get("reason", "")})
+        yield result
+
+def _iter_evaluate_uncached(content: str, criterion_ids: List[int], client: AIClient, mode: str,
+                            max_wait: Optional[float] = None,
+                            on_wait: Optional[Callable[[float], None]] = None) -> Iterator[Dict[str, any]]:
+    """キャッシュを使わずに評価項目を採点し、完了した順に結果を返す"""
+    
+    # 一括採点モード：まず1回の呼び出しで全項目を採点し、
+    # 検証に失敗した項目だけを評価項目ごとの呼び出しで採点し直す
+    if mode == "combined" and len(criterion_ids) > 1:
+        try:
+            combined = _context_with_wait(max_wait, on_wait).run(
+                _evaluate_combined_limited, content, criterion_ids, client)
+        except Exception:
+            combined = {}
+        for criterion_id in criterion_ids:
+            if criterion_id in combined:
+                yield {
+                    "criterion_id": criterion_id,
+                    "criterion_name": EVALUATION_PROMPTS[criterion_id]["name"],
+                    **combined[criterion_id]
+                }
+        criterion_ids = [c for c in criterion_ids if c not in combined]
+        if not criterion_ids:
+            return
+    
+    # ワーカースレッドからの待ち時間の通知は、呼び出し元のスレッドで on_wait に渡す
+    # （Streamlitの画面はスクリプトのスレッドからしか更新できないため）
+    wait_notices: "queue.Queue[float]" = queue.Queue()
+    notify = wait_notices.put if on_wait else None
+    
+    max_workers = min(len(criterion_ids), get_provider_concurrency(client.provider))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scoring") as executor:
+        # 呼び出し元の情報（テレメトリ用）をワーカースレッドに引き継ぐ
+        futures = {
+            executor.submit(_context_with_wait(max_wait, notify).run,
+                            _evaluate_criterion_limited, content, criterion_id, client): criterion_id
+            for criterion_id in criterion_ids
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=WAIT_NOTICE_INTERVAL, return_when=FIRST_COMPLETED)
+            while on_wait and not wait_notices.empty():
+                on_wait(wait_notices.get_nowait())
+            for future in done:
+                yield _criterion_result(future, futures[future])
+
+def _criterion_result(future, criterion_id: int) -> Dict[str, any]:
+    """並列採点の1項目分の結果（失敗時はエラーの結果）"""
+    criterion_name = EVALUATION_PROMPTS[criterion_id]["name"]
+    try:
+        result = dict(future.result())
+        result["criterion_id"] = criterion_id
+        result["criterion_name"] = criterion_name
+    except Exception as e:
+        # エラーが発生した場合はデフォルト値を設定
+        result = {
+            "criterion_id": criterion_id,
+            "criterion_name": criterion_name,
+            "score": 0,
+            "reason": f"採点エラー: {str(e)}",
+            "error": str(e)
+        }
+    return result
+
+def evaluate_all_criteria(content: str, use_cache: bool = True,
+                          client: Optional[AIClient] = None,
+                          mode: Optional[str] = None) -> List[Dict[str, any]]:
+    """すべての評価項目について採点を実行（並列実行、結果は評価項目順）"""
+    results = list(iter_evaluate_criteria(content, use_cache=use_cache, client=client, mode=mode))
+    results.sort(key=lambda r: r["criterion_id"])
     return results
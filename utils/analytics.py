@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+採点結果の統計
+採点完了結果 × 評価項目のスコア行列（pandas.DataFrame）をデータの版ごとに1回だけ作成し、
+評価項目ごとの平均・標準偏差・パーセンタイル、総合スコアの分布、都道府県ごとの集計、
+評価項目間の相関をベクトル演算で計算します。
+"""
+
+import threading
+import warnings
+from typing import Optional, Dict, Any, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.data_manager import get_store, get_all_criteria
+
+# 統計が参照するテーブル（版が変わったらスコア行列を作り直す）
+# 評価項目はテーブルではなく get_all_criteria() の定義のため、版の代わりに内容の指紋を使う
+ANALYTICS_TABLES = ("schools", "submissions", "evaluation_results", "evaluation_details")
+
+# 評価項目ごとの統計で計算するパーセンタイル
+STAT_PERCENTILES = (25, 50, 75, 90)
+
+# 総合スコアの分布の階級の幅（点）
+DISTRIBUTION_BIN_WIDTH = 5
+
+# 総合スコアの満点
+MAX_TOTAL_SCORE = 60
+
+# 都道府県が未設定の参加校の表示名
+UNKNOWN_PREFECTURE = "（未設定）"
+
+_cache: Optional[Tuple[Any, pd.DataFrame]] = None
+_cache_lock = threading.Lock()
+
+
+def _criterion_columns() -> Dict[int, str]:
+    """評価項目ID -> スコア行列の列名（表示順）"""
+    criteria = sorted(get_all_criteria(), key=lambda c: c.get('display_order', c['id']))
+    return {c['id']: c['criterion_name'] for c in criteria}
+
+
+def _criteria_fingerprint() -> Tuple:
+    """スコア行列の列に影響する評価項目の定義（ID・名前・表示順）"""
+    return tuple(sorted((c['id'], c['criterion_name'], c.get('display_order')) for c in get_all_criteria()))
+
+
+def build_score_frame(store=None) -> pd.DataFrame:
+    """
+    採点完了結果 × 評価項目のスコア行列を作成
+
+    Returns:
+        DataFrame: 採点結果IDを索引とし、school_name / prefecture / theme_title / total_score と
+                   評価項目名ごとのスコアの列を持つ（採点されていない評価項目はNaN）
+    """
+    store = store or get_store()
+    criteria = _criterion_columns()
+    info_columns = ["submission_id", "school_id", "school_name", "prefecture", "theme_title", "total_score"]
+
+    results = pd.DataFrame(store.all("evaluation_results"))
+    if results.empty or "evaluation_status" not in results:
+        return pd.DataFrame(columns=info_columns + list(criteria.values()),
+                            index=pd.Index([], name="result_id"))
+    results = results.loc[results["evaluation_status"] == "completed", ["id", "submission_id", "total_score"]]
+
+    submissions = pd.DataFrame(store.all("submissions"), columns=["id", "school_id", "theme_title"])
+    schools = pd.DataFrame(store.all("schools"), columns=["id", "name", "prefecture"])
+    frame = (
+        results.rename(columns={"id": "result_id"})
+        .merge(submissions.rename(columns={"id": "submission_id"}), on="submission_id", how="left")
+        .merge(schools.rename(columns={"id": "school_id", "name": "school_name"}), on="school_id", how="left")
+        .set_index("result_id")
+    )
+    frame["school_name"] = frame["school_name"].fillna("不明")
+    frame["prefecture"] = frame["prefecture"].replace("", np.nan).fillna(UNKNOWN_PREFECTURE)
+    frame["total_score"] = pd.to_numeric(frame["total_score"], errors="coerce").fillna(0)
+
+    details = pd.DataFrame(store.all("evaluation_details"),
+                           columns=["evaluation_result_id", "criterion_id", "score"])
+    details = details[details["evaluation_result_id"].isin(frame.index)
+                      & details["criterion_id"].isin(list(criteria))]
+    # 同じ評価項目の詳細が複数ある場合は後のもの（再採点）を使う
+    scores = (
+        details.assign(score=pd.to_numeric(details["score"], errors="coerce"))
+        .pivot_table(index="evaluation_result_id", columns="criterion_id", values="score", aggfunc="last")
+        .reindex(index=frame.index, columns=list(criteria))
+        .rename(columns=criteria)
+    )
+    return pd.concat([frame[info_columns], scores], axis=1)
+
+
+def get_score_frame() -> pd.DataFrame:
+    """スコア行列を取得（データの版と評価項目が変わっていなければ前回の結果を使う）"""
+    global _cache
+    store = get_store()
+    with _cache_lock:
+        versions = (tuple(store.version(name) for name in ANALYTICS_TABLES), _criteria_fingerprint())
+        if _cache is None or _cache[0] != versions or store.in_transaction():
+            frame = build_score_frame(store)
+            if store.in_transaction():
+                return frame
+            _cache = (versions, frame)
+        return _cache[1]
+
+
+def criterion_columns(frame: pd.DataFrame) -> list:
+    """スコア行列のうち評価項目の列"""
+    names = set(_criterion_columns().values())
+    return [column for column in frame.columns if column in names]
+
+
+def criterion_statistics(frame: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    評価項目ごとの統計
+
+    Returns:
+        DataFrame: 評価項目名を索引とし、件数・平均・標準偏差・最小・パーセンタイル・最大の列を持つ
+    """
+    frame = get_score_frame() if frame is None else frame
+    columns = criterion_columns(frame)
+    matrix = frame[columns].to_numpy(dtype=float)
+    index = pd.Index(columns, name="評価項目")
+    if matrix.size == 0 or np.isnan(matrix).all():
+        return pd.DataFrame(index=index)
+
+    # 採点詳細がない評価項目（すべてNaNの列）の RuntimeWarning は無視する
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        stats = {
+            "件数": np.count_nonzero(~np.isnan(matrix), axis=0),
+            "平均": np.nanmean(matrix, axis=0),
+            "標準偏差": np.nanstd(matrix, axis=0, ddof=1) if len(matrix) > 1 else np.full(len(columns), np.nan),
+            "最小": np.nanmin(matrix, axis=0),
+        }
+        percentiles = np.nanpercentile(matrix, STAT_PERCENTILES, axis=0)
+        for p, values in zip(STAT_PERCENTILES, percentiles):
+            stats["中央値" if p == 50 else f"p{p}"] = values
+        stats["最大"] = np.nanmax(matrix, axis=0)
+    return pd.DataFrame(stats, index=index)
+
+
+def score_distribution(frame: Optional[pd.DataFrame] = None,
+                       bin_width: int = DISTRIBUTION_BIN_WIDTH) -> pd.DataFrame:
+    """
+    総合スコアの分布
+
+    Returns:
+        DataFrame: 階級（"50-54" など）と件数の列を持つ
+    """
+    frame = get_score_frame() if frame is None else frame
+    edges = np.arange(0, MAX_TOTAL_SCORE + bin_width, bin_width)
+    edges[-1] = max(edges[-1], MAX_TOTAL_SCORE) + 1  # 満点を最後の階級に含める
+    counts, _ = np.histogram(frame["total_score"].to_numpy(dtype=float), bins=edges)
+    labels = [f"{int(low)}-{int(high) - 1}" for low, high in zip(edges[:-1], edges[1:])]
+    return pd.DataFrame({"総合スコア": labels, "件数": counts})
+
+
+def prefecture_breakdown(frame: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    都道府県ごとの集計
+
+    Returns:
+        DataFrame: 都道府県を索引とし、採点件数・総合スコアの平均と最高・評価項目ごとの平均の列を持つ
+    """
+    frame = get_score_frame() if frame is None else frame
+    if frame.empty:
+        return pd.DataFrame()
+    grouped = frame.groupby("prefecture")
+    summary = pd.DataFrame({
+        "採点件数": grouped.size(),
+        "平均スコア": grouped["total_score"].mean(),
+        "最高スコア": grouped["total_score"].max(),
+    })
+    summary = summary.join(grouped[criterion_columns(frame)].mean())
+    summary.index.name = "都道府県"
+    return summary.sort_values(["平均スコア", "採点件数"], ascending=False)
+
+
+def criterion_correlations(frame: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """評価項目間の相関係数（ピアソン、2件以上の採点結果がある場合）"""
+    frame = get_score_frame() if frame is None else frame
+    columns = criterion_columns(frame)
+    if len(frame) < 2:
+        return pd.DataFrame(index=columns, columns=columns, dtype=float)
+    return frame[columns].astype(float).corr()
+
@@ -5,10 +5,19 @@
 採点結果に基づいて賞を自動判定します。
 """
 
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 from utils.data_manager import get_all_evaluation_results, get_evaluation_details, get_all_criteria
 
 
+def ranking_key(result: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    順位の並び順のキー（総合スコアの高い順、同点は採点結果IDの小さい順）
+    
+    ランキング・賞の判定・エクスポートで同じ順位になるよう、並べ替えにはこのキーを使います。
+    """
+    return (-(result.get('total_score') or 0), result.get('id') or 0)
+
+
 def determine_awards(results: List[Dict[str, Any]]) -> Dict[int, List[str]]:
     """
     採点結果に基づいて賞を自動判定
@@ -29,10 +38,8 @@ def determine_awards(results: List[Dict[str, Any]]) -> Dict[int, List[str]]:
     
     awards = {}
     
-    # 総合スコアでソート（高い順）
-    sorted_results = sorted(completed_results, 
-                           key=lambda x: x.get('total_score', 0), 
-                           reverse=True)
+    # 総合スコアでソート（高い順、同点は採点結果IDの小さい順）
+    sorted_results = sorted(completed_results, key=ranking_key)
     
     # 基本賞の判定
     for idx, result in enumerate(sorted_results):
@@ -40,26 +47,41 @@ def determine_awards(results: List[Dict[str, Any]]) -> Dict[int, List[str]]:
         if result_id is None:
             continue
         
-        award_list = []
-        
-        # 最優秀賞（1位）
-        if idx == 0:
-            award_list.append("🏆 最優秀賞")
-        
-        # 優秀賞（2-3位）
-        elif idx in [1, 2]:
-            award_list.append("🥇 優秀賞")
-        
-        # 特別審査員賞（手動設定）
-        if result.get('special_judge_award', False):
-            award_list.append("⭐ 特別審査員賞")
-        
+        award_list = awards_for_rank(idx + 1, result.get('special_judge_award', False))
         if award_list:
             awards[result_id] = award_list
     
     return awards
 
 
+def awards_for_rank(rank: int, special_judge_award: bool = False) -> List[str]:
+    """
+    順位と特別審査員賞の設定から賞を判定
+    
+    Args:
+        rank: 総合スコアの順位（1から）
+        special_judge_award: 特別審査員賞が設定されているか
+    
+    Returns:
+        awards: 賞のリスト
+    """
+    award_list = []
+    
+    # 最優秀賞（1位）
+    if rank == 1:
+        award_list.append("🏆 最優秀賞")
+    
+    # 優秀賞（2-3位）
+    elif rank in [2, 3]:
+        award_list.append("🥇 優秀賞")
+    
+    # 特別審査員賞（手動設定）
+    if special_judge_award:
+        award_list.append("⭐ 特別審査員賞")
+    
+    return award_list
+
+
 def get_awards_for_result(result_id: int, all_results: List[Dict[str, Any]]) -> List[str]:
     """
     特定の採点結果に付与された賞を取得
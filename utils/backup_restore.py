@@ -3,128 +3,601 @@
 """
 データのバックアップと復元機能
 Streamlit Cloudでのデータ永続化をサポートします。
+
+バックアップはスナップショットとして data/backups/ に保存します。
+テーブル（JSON）とアップロードファイルは内容のハッシュ（SHA-256）をファイル名にして objects/ に保存し、
+スナップショットにはテーブル・ファイルごとのハッシュを記録したマニフェストだけを書き込みます。
+前回のスナップショットから変わっていないテーブル・ファイルは書き込まないため、2回目以降は変更分だけで済みます。
+
+ダウンロード用のZIPファイルは、スナップショットからディスクへ直接書き出します（メモリ上に全体を作りません）。
+
+一括採点のキュー（scoring_jobs）もバックアップします。復元時、実行中だったジョブは
+復元先で実行しているワーカーがいないため、待機中に戻して再実行の対象にします。
 """
 
+import os
+import io
 import json
+import time
+import shutil
+import hashlib
 import zipfile
+import tempfile
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Union, BinaryIO
 from utils.data_manager import (
-    DATA_DIR, SCHOOLS_FILE, SUBMISSIONS_FILE, 
-    EVALUATION_RESULTS_FILE, EVALUATION_DETAILS_FILE, FILES_FILE,
-    save_json, load_json
+    DATA_DIR, SCHOOLS_FILE, SUBMISSIONS_FILE,
+    EVALUATION_RESULTS_FILE, EVALUATION_DETAILS_FILE, FILES_FILE, SCORING_JOBS_FILE,
+    save_json, load_json, describe_table_file, get_storage_backend
 )
 
+# バックアップの保存先（環境変数 BACKUP_DIR で変更可能）
+DEFAULT_BACKUP_DIR = DATA_DIR / "backups"
 
-def create_backup() -> bytes:
+# アップロードファイルの保存先（app.py と同じ）
+UPLOAD_DIR = Path("uploads")
+
+# 保持するスナップショットの数（環境変数 BACKUP_KEEP_SNAPSHOTS で変更可能、古いものから削除）
+DEFAULT_KEEP_SNAPSHOTS = 10
+
+# バックアップ形式のバージョン（1.0: テーブルのみ、2.0: マニフェスト・アップロードファイルを含む）
+BACKUP_FORMAT_VERSION = "2.0"
+
+# ファイルを読み書きする単位（バイト）
+CHUNK_SIZE = 1024 * 1024
+
+# バックアップ対象のテーブル
+BACKUP_TABLES = {
+    "schools": SCHOOLS_FILE,
+    "submissions": SUBMISSIONS_FILE,
+    "evaluation_results": EVALUATION_RESULTS_FILE,
+    "evaluation_details": EVALUATION_DETAILS_FILE,
+    "files": FILES_FILE,
+    "scoring_jobs": SCORING_JOBS_FILE,
+}
+
+
+# ==================== スナップショット ====================
+
+def get_backup_dir() -> Path:
+    """バックアップの保存先を取得"""
+    return Path(os.getenv("BACKUP_DIR", str(DEFAULT_BACKUP_DIR)))
+
+
+def _objects_dir() -> Path:
+    return get_backup_dir() / "objects"
+
+
+def _snapshots_dir() -> Path:
+    return get_backup_dir() / "snapshots"
+
+
+def _object_path(sha256: str) -> Path:
+    return _objects_dir() / sha256[:2] / sha256
+
+
+class _HashingWriter(io.RawIOBase):
+    """書き込んだ内容のハッシュとサイズを計算しながらファイルに書き込む"""
+
+    def __init__(self, fp: BinaryIO):
+        self._fp = fp
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.hash.update(data)
+        self.size += len(data)
+        self._fp.write(data)
+        return len(data)
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _store_object(source: Path, sha256: str, move: bool = False) -> bool:
+    """内容をオブジェクトとして保存（同じ内容がすでにあればFalse）"""
+    target = _object_path(sha256)
+    if target.exists():
+        if move:
+            source.unlink()
+        return False
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_name(target.name + ".tmp")
+    if move:
+        shutil.move(str(source), str(temp_path))
+    else:
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, target)
+    return True
+
+
+def _dump_table(key: str, file_path: Path, work_dir: Path) -> Dict[str, Any]:
+    """テーブルをJSONに書き出してオブジェクトとして保存"""
+    data = load_json(file_path)
+    temp_path = work_dir / f"{key}.json"
+    with open(temp_path, "wb") as f:
+        writer = _HashingWriter(f)
+        text = io.TextIOWrapper(io.BufferedWriter(writer, CHUNK_SIZE), encoding="utf-8")
+        json.dump(data, text, ensure_ascii=False, indent=2)
+        text.flush()
+        text.detach()
+    sha256 = writer.hash.hexdigest()
+    created = _store_object(temp_path, sha256, move=True)
+    return {"sha256": sha256, "size": writer.size, "count": len(data), "created": created}
+
+
+def _scan_uploads(previous: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     """
-    すべてのデータファイルをZIP形式でバックアップ
-    
+    アップロードファイルのハッシュを計算
+
+    前回のスナップショットとサイズ・更新日時が同じファイルは、読み込まずに前回のハッシュを使います。
+    """
+    files = {}
+    if not UPLOAD_DIR.exists():
+        return files
+    for path in sorted(p for p in UPLOAD_DIR.rglob("*") if p.is_file()):
+        if path.name.endswith(".tmp"):
+            continue
+        relative = path.relative_to(UPLOAD_DIR).as_posix()
+        stat = path.stat()
+        entry = previous.get(relative)
+        if (entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+                and _object_path(entry["sha256"]).exists()):
+            files[relative] = dict(entry)
+            continue
+        files[relative] = {"sha256": _hash_file(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return files
+
+
+def list_snapshots() -> List[str]:
+    """スナップショットのIDの一覧（古い順）"""
+    snapshots_dir = _snapshots_dir()
+    if not snapshots_dir.exists():
+        return []
+    return sorted(p.stem for p in snapshots_dir.glob("*.json"))
+
+
+def load_snapshot(snapshot_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """スナップショットのマニフェストを読み込む（省略時は最新、なければNone）"""
+    if snapshot_id is None:
+        snapshots = list_snapshots()
+        if not snapshots:
+            return None
+        snapshot_id = snapshots[-1]
+    path = _snapshots_dir() / f"{snapshot_id}.json"
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def create_snapshot(include_uploads: bool = True) -> Dict[str, Any]:
+    """
+    現在のデータのスナップショットを作成
+
+    Args:
+        include_uploads: アップロードファイルも含めるか
+
     Returns:
-        bytes: ZIPファイルのバイトデータ
+        dict: マニフェスト（stats に新たに書き込んだオブジェクトの数・バイト数）
     """
-    backup_data = {
-        "backup_date": datetime.now().isoformat(),
-        "version": "1.0",
-        "data": {}
-    }
-    
-    # 各データファイルを読み込んでバックアップデータに追加
-    data_files = {
-        "schools": SCHOOLS_FILE,
-        "submissions": SUBMISSIONS_FILE,
-        "evaluation_results": EVALUATION_RESULTS_FILE,
-        "evaluation_details": EVALUATION_DETAILS_FILE,
-        "files": FILES_FILE,
+    previous = load_snapshot() or {}
+    backup_dir = get_backup_dir()
+    backup_dir.mkdir(parents=True, exist_ok=True)
+
+    now = datetime.now()
+    manifest = {
+        "snapshot_id": now.strftime("%Y%m%dT%H%M%S_%f"),
+        "backup_date": now.isoformat(),
+        "version": BACKUP_FORMAT_VERSION,
+        "storage_backend": get_storage_backend(),
+        "parent": previous.get("snapshot_id"),
+        "tables": {},
+        "files": {},
     }
-    
-    for key, file_path in data_files.items():
-        if file_path.exists():
-            backup_data["data"][key] = load_json(file_path)
-        else:
-            backup_data["data"][key] = []
-    
-    # ZIPファイルとして作成
-    import io
-    zip_buffer = io.BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        # メタデータファイル
+    stats = {"new_objects": 0, "reused_objects": 0, "written_bytes": 0}
+
+    with tempfile.TemporaryDirectory(dir=backup_dir) as work_dir:
+        for key, file_path in BACKUP_TABLES.items():
+            entry = _dump_table(key, file_path, Path(work_dir))
+            if entry.pop("created"):
+                stats["new_objects"] += 1
+                stats["written_bytes"] += entry["size"]
+            else:
+                stats["reused_objects"] += 1
+            manifest["tables"][key] = entry
+
+    if include_uploads:
+        manifest["files"] = _scan_uploads(previous.get("files", {}))
+        for relative, entry in manifest["files"].items():
+            if _store_object(UPLOAD_DIR / relative, entry["sha256"]):
+                stats["new_objects"] += 1
+                stats["written_bytes"] += entry["size"]
+            else:
+                stats["reused_objects"] += 1
+
+    snapshots_dir = _snapshots_dir()
+    snapshots_dir.mkdir(parents=True, exist_ok=True)
+    temp_path = snapshots_dir / f"{manifest['snapshot_id']}.json.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, snapshots_dir / f"{manifest['snapshot_id']}.json")
+
+    prune_snapshots()
+    manifest["stats"] = stats
+    return manifest
+
+
+def prune_snapshots(keep: Optional[int] = None) -> int:
+    """
+    古いスナップショットと、どのスナップショットからも参照されないオブジェクトを削除
+
+    Returns:
+        int: 削除したオブジェクトの数
+    """
+    if keep is None:
+        keep = int(os.getenv("BACKUP_KEEP_SNAPSHOTS", str(DEFAULT_KEEP_SNAPSHOTS)))
+    snapshots = list_snapshots()
+    for snapshot_id in snapshots[:max(0, len(snapshots) - max(1, keep))]:
+        (_snapshots_dir() / f"{snapshot_id}.json").unlink()
+
+    referenced = set()
+    for snapshot_id in list_snapshots():
+        manifest = load_snapshot(snapshot_id) or {}
+        referenced.update(entry["sha256"] for entry in manifest.get("tables", {}).values())
+        referenced.update(entry["sha256"] for entry in manifest.get("files", {}).values())
+
+    removed = 0
+    objects_dir = _objects_dir()
+    if objects_dir.exists():
+        for path in objects_dir.glob("*/*"):
+            if path.name not in referenced and not path.name.endswith(".tmp"):
+                path.unlink()
+                removed += 1
+    return removed
+
+
+# ==================== バックアップ（ZIP） ====================
+
+def write_backup(output_path: Union[str, Path], include_uploads: bool = True,
+                 snapshot: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    スナップショットを作成し、ZIPファイルとしてディスクに書き出す
+
+    Args:
+        output_path: 出力するZIPファイル
+        include_uploads: アップロードファイルも含めるか
+        snapshot: 書き出すスナップショット（省略時は新たに作成）
+
+    Returns:
+        dict: スナップショットのマニフェスト
+    """
+    manifest = snapshot or create_snapshot(include_uploads=include_uploads)
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(output_path.name + ".tmp")
+
+    metadata = {key: value for key, value in manifest.items() if key != "stats"}
+    with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        # メタデータ（マニフェスト）
         zip_file.writestr(
             "backup_metadata.json",
-            json.dumps(backup_data, ensure_ascii=False, indent=2)
+            json.dumps(metadata, ensure_ascii=False, indent=2)
         )
-        
-        # 各データファイル
-        for key, file_path in data_files.items():
-            if file_path.exists():
-                zip_file.write(file_path, f"{key}.json")
-            else:
-                # ファイルが存在しない場合は空のリストを保存
-                zip_file.writestr(
-                    f"{key}.json",
-                    json.dumps([], ensure_ascii=False, indent=2)
-                )
-    
-    zip_buffer.seek(0)
-    return zip_buffer.read()
 
+        # 各データファイル（バックエンドに関わらずJSON形式で保存）
+        for key, entry in manifest["tables"].items():
+            zip_file.write(_object_path(entry["sha256"]), f"{key}.json")
+
+        # アップロードファイル（PDF・PowerPointは圧縮済みのため無圧縮で格納）
+        if include_uploads:
+            for relative, entry in manifest.get("files", {}).items():
+                zip_file.write(_object_path(entry["sha256"]), f"uploads/{relative}",
+                               compress_type=zipfile.ZIP_STORED)
+
+    os.replace(temp_path, output_path)
+    return manifest
+
+
+def create_backup() -> bytes:
+    """
+    すべてのデータファイルをZIP形式でバックアップ
+
+    ZIPファイルを直接保存する場合は write_backup を使用してください。
+
+    Returns:
+        bytes: ZIPファイルのバイトデータ
+    """
+    backup_dir = get_backup_dir()
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=backup_dir) as work_dir:
+        output_path = Path(work_dir) / "backup.zip"
+        write_backup(output_path)
+        return output_path.read_bytes()
+
+
+# ==================== 復元 ====================
+
+# 各テーブルの行に必要な列と型
+TABLE_SCHEMAS = {
+    "schools": {"id": int, "name": str},
+    "submissions": {"id": int, "school_id": int},
+    "evaluation_results": {"id": int, "submission_id": int},
+    "evaluation_details": {"id": int, "evaluation_result_id": int, "criterion_id": int},
+    "files": {"id": int, "submission_id": int, "file_path": str},
+    "scoring_jobs": {"id": int, "submission_id": int},
+}
+
+# 外部キー（テーブル, 列, 参照先のテーブル）
+FOREIGN_KEYS = [
+    ("submissions", "school_id", "schools"),
+    ("evaluation_results", "submission_id", "submissions"),
+    ("evaluation_details", "evaluation_result_id", "evaluation_results"),
+    ("files", "submission_id", "submissions"),
+    ("scoring_jobs", "submission_id", "submissions"),
+]
+
+# ZIPファイルを並列に展開するスレッド数（環境変数 RESTORE_WORKERS で変更可能）
+DEFAULT_RESTORE_WORKERS = 4
+
+# 検証エラー・警告として報告する最大件数（テーブル・外部キーごと）
+MAX_REPORTED_PROBLEMS = 5
+
+
+class _HashingReader(io.RawIOBase):
+    """読み込んだ内容のハッシュを計算しながら読み込む"""
 
-def restore_backup(backup_file: bytes) -> Dict[str, Any]:
+    def __init__(self, fp: BinaryIO):
+        self._fp = fp
+        self.hash = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._fp.read(len(buffer))
+        buffer[:len(data)] = data
+        self.hash.update(data)
+        return len(data)
+
+
+def _read_table(zip_file: zipfile.ZipFile, key: str, expected_sha256: Optional[str]) -> List[Dict[str, Any]]:
+    """ZIP内のテーブルを展開しながら読み込む（マニフェストにハッシュがあれば照合）"""
+    with zip_file.open(f"{key}.json") as f:
+        reader = _HashingReader(f)
+        data = json.load(io.TextIOWrapper(io.BufferedReader(reader, CHUNK_SIZE), encoding="utf-8"))
+    if expected_sha256 and reader.hash.hexdigest() != expected_sha256:
+        raise ValueError("内容がマニフェストのハッシュと一致しません（ファイルが破損している可能性があります）")
+    return data
+
+
+def _extract_upload(zip_file: zipfile.ZipFile, name: str, staging_dir: Path,
+                    expected_sha256: Optional[str]) -> Path:
+    """ZIP内のアップロードファイルを一時ディレクトリに展開"""
+    relative = Path(name[len("uploads/"):])
+    if relative.is_absolute() or ".." in relative.parts or not relative.parts:
+        raise ValueError(f"不正なファイルパスです: {name}")
+    target = staging_dir / relative
+    target.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    with zip_file.open(name) as source, open(target, "wb") as f:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            f.write(chunk)
+    if expected_sha256 and digest.hexdigest() != expected_sha256:
+        raise ValueError("内容がマニフェストのハッシュと一致しません")
+    return relative
+
+
+def validate_tables(tables: Dict[str, List[Dict[str, Any]]],
+                    upload_paths: Optional[set] = None) -> Dict[str, List[str]]:
+    """
+    復元するテーブルの形式と外部キーを検証
+
+    Args:
+        tables: テーブル名 -> 行のリスト
+        upload_paths: バックアップに含まれるアップロードファイル（uploads/ からの相対パス）
+
+    Returns:
+        dict: errors（形式の誤り、復元できない）と warnings（参照先のない行など）
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+    ids: Dict[str, set] = {}
+
+    for key, rows in tables.items():
+        if not isinstance(rows, list):
+            errors.append(f"{key}: 行のリストではありません")
+            continue
+        schema = TABLE_SCHEMAS.get(key, {"id": int})
+        seen = set()
+        problems = []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                problems.append(f"{index + 1}行目がオブジェクトではありません")
+                continue
+            for column, expected_type in schema.items():
+                value = row.get(column)
+                # 外部キーは未設定（None）を許可
+                if value is None and column != "id":
+                    continue
+                if not isinstance(value, expected_type) or isinstance(value, bool):
+                    problems.append(f"{index + 1}行目の {column} が不正です: {value!r}")
+            row_id = row.get("id")
+            if row_id in seen:
+                problems.append(f"IDが重複しています: {row_id}")
+            seen.add(row_id)
+        ids[key] = seen
+        for problem in problems[:MAX_REPORTED_PROBLEMS]:
+            errors.append(f"{key}: {problem}")
+        if len(problems) > MAX_REPORTED_PROBLEMS:
+            errors.append(f"{key}: ほか{len(problems) - MAX_REPORTED_PROBLEMS}件の問題があります")
+
+    for key, column, parent in FOREIGN_KEYS:
+        if key not in tables or parent not in ids or not isinstance(tables[key], list):
+            continue
+        orphans = [row.get("id") for row in tables[key]
+                   if isinstance(row, dict) and row.get(column) is not None and row.get(column) not in ids[parent]]
+        if orphans:
+            shown = ", ".join(str(row_id) for row_id in orphans[:MAX_REPORTED_PROBLEMS])
+            warnings.append(f"{key}: {column} の参照先（{parent}）がない行が{len(orphans)}件あります（ID: {shown}）")
+
+    if upload_paths is not None and isinstance(tables.get("files"), list):
+        missing = [row.get("file_path") for row in tables["files"]
+                   if isinstance(row, dict) and isinstance(row.get("file_path"), str)
+                   and Path(row["file_path"]).parts[:1] == (UPLOAD_DIR.name,)
+                   and Path(*Path(row["file_path"]).parts[1:]).as_posix() not in upload_paths]
+        if missing:
+            warnings.append(f"files: バックアップに含まれないファイルが{len(missing)}件あります（{missing[0]} など）")
+
+    return {"errors": errors, "warnings": warnings}
+
+
+def restore_backup(backup_file: Union[bytes, str, Path, BinaryIO], dry_run: bool = False,
+                   strict: bool = False) -> Dict[str, Any]:
     """
     バックアップファイルからデータを復元
-    
+
+    ZIPファイルのテーブルとアップロードファイルを並列に展開し、形式と外部キーを検証してから、
+    アップロードファイルを配置し、すべてのテーブルを1つのトランザクションでまとめて置き換えます。
+    検証でエラーがあった場合は何も書き込みません。
+
+    テーブルの置き換えはJSON・SQLiteどちらのバックエンドでも途中で中断されない（JSONはジャーナルから
+    続きを反映する）ため、テーブルは復元前か復元後のどちらかの状態に揃います。
+    アップロードファイルはテーブルより先に配置するため、テーブルが参照するファイルが欠けることはありません
+    （テーブルの置き換えに失敗した場合に残ったブロブは collect_garbage で削除されます）。
+
     Args:
-        backup_file: ZIPファイルのバイトデータ
-        
+        backup_file: ZIPファイルのパス、ファイルオブジェクト、またはバイトデータ
+        dry_run: Trueの場合は検証と件数の集計だけを行い、書き込まない
+        strict: Trueの場合は参照先のない行（警告）があっても復元しない
+
     Returns:
-        dict: 復元結果の情報
+        dict: 復元結果の情報（counts: テーブルごとの件数、timings: 処理時間（秒））
     """
-    import io
-    
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.data_manager import transaction
+
+    started = time.perf_counter()
     result = {
         "success": False,
+        "dry_run": dry_run,
         "restored_files": [],
+        "restored_uploads": 0,
+        "counts": {},
         "errors": [],
+        "warnings": [],
+        "timings": {},
         "backup_date": None
     }
-    
+
     try:
-        zip_buffer = io.BytesIO(backup_file)
-        
-        with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
+        source = io.BytesIO(backup_file) if isinstance(backup_file, (bytes, bytearray)) else backup_file
+        workers = max(1, int(os.getenv("RESTORE_WORKERS", str(DEFAULT_RESTORE_WORKERS))))
+        staging_root = get_backup_dir()
+        staging_root.mkdir(parents=True, exist_ok=True)
+
+        with zipfile.ZipFile(source, 'r') as zip_file, \
+                tempfile.TemporaryDirectory(dir=staging_root, prefix="restore_") as staging:
+            staging_dir = Path(staging)
+            names = zip_file.namelist()
+
             # メタデータを読み込む
-            if "backup_metadata.json" in zip_file.namelist():
-                metadata_str = zip_file.read("backup_metadata.json").decode('utf-8')
-                metadata = json.loads(metadata_str)
+            metadata = {}
+            if "backup_metadata.json" in names:
+                with zip_file.open("backup_metadata.json") as f:
+                    metadata = json.load(f)
                 result["backup_date"] = metadata.get("backup_date")
-            
-            # 各データファイルを復元
-            data_files = {
-                "schools": SCHOOLS_FILE,
-                "submissions": SUBMISSIONS_FILE,
-                "evaluation_results": EVALUATION_RESULTS_FILE,
-                "evaluation_details": EVALUATION_DETAILS_FILE,
-                "files": FILES_FILE,
-            }
-            
-            for key, file_path in data_files.items():
-                json_filename = f"{key}.json"
-                if json_filename in zip_file.namelist():
+            # ハッシュは2.0形式のマニフェストにのみある（1.0形式は "data" にテーブルの内容を含む）
+            manifest_tables = metadata.get("tables") if isinstance(metadata.get("tables"), dict) else {}
+            manifest_files = metadata.get("files") if isinstance(metadata.get("files"), dict) else {}
+            table_hashes = {key: entry.get("sha256") for key, entry in manifest_tables.items()}
+            file_hashes = {f"uploads/{relative}": entry.get("sha256")
+                           for relative, entry in manifest_files.items()}
+
+            # テーブルとアップロードファイルを並列に展開（テーブルはハッシュを照合しながら読み込む）
+            table_keys = [key for key in BACKUP_TABLES if f"{key}.json" in names]
+            upload_names = [name for name in names if name.startswith("uploads/") and not name.endswith("/")]
+            tables: Dict[str, List[Dict[str, Any]]] = {}
+            staged_uploads: List[Path] = []
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                table_futures = {key: executor.submit(_read_table, zip_file, key, table_hashes.get(key))
+                                 for key in table_keys}
+                upload_futures = {} if dry_run else {
+                    name: executor.submit(_extract_upload, zip_file, name, staging_dir, file_hashes.get(name))
+                    for name in upload_names
+                }
+                for key, future in table_futures.items():
                     try:
-                        data_str = zip_file.read(json_filename).decode('utf-8')
-                        data = json.loads(data_str)
-                        save_json(file_path, data)
-                        result["restored_files"].append(key)
+                        tables[key] = future.result()
                     except Exception as e:
                         result["errors"].append(f"{key}: {str(e)}")
-            
-            result["success"] = len(result["restored_files"]) > 0
-            
+                for name, future in upload_futures.items():
+                    try:
+                        staged_uploads.append(future.result())
+                    except Exception as e:
+                        result["errors"].append(f"{name}: {str(e)}")
+            result["timings"]["read"] = time.perf_counter() - started
+
+            # 形式・外部キーの検証（1回の走査で行う）
+            validate_started = time.perf_counter()
+            upload_paths = {name[len("uploads/"):] for name in upload_names} if upload_names else None
+            validation = validate_tables(tables, upload_paths)
+            result["errors"].extend(validation["errors"])
+            result["warnings"].extend(validation["warnings"])
+            result["counts"] = {key: len(rows) for key, rows in tables.items() if isinstance(rows, list)}
+            result["timings"]["validate"] = time.perf_counter() - validate_started
+
+            if not tables:
+                result["errors"].append("復元できるデータがありません")
+            if strict and result["warnings"]:
+                result["errors"].append("参照先のない行があるため復元を中止しました")
+            if result["errors"] or dry_run:
+                result["success"] = not result["errors"]
+                return result
+
+            # アップロードファイルを配置（テーブルが参照する前に置く）
+            write_started = time.perf_counter()
+            for relative in staged_uploads:
+                target = UPLOAD_DIR / relative
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(staging_dir / relative), str(target))
+            result["restored_uploads"] = len(staged_uploads)
+
+            # 実行中のまま保存されたジョブは、復元後に実行するワーカーがいないため待機中に戻す
+            if isinstance(tables.get("scoring_jobs"), list):
+                tables["scoring_jobs"] = [
+                    dict(job, status="queued", completed_criteria=0) if job.get("status") == "running" else job
+                    for job in tables["scoring_jobs"]
+                ]
+
+            # すべてのテーブルをまとめて置き換え（復元前・復元後のどちらかの状態に揃う）
+            try:
+                with transaction():
+                    for key, rows in tables.items():
+                        save_json(BACKUP_TABLES[key], rows)
+            except Exception as e:
+                result["errors"].append(f"データの書き込みエラー: {str(e)}")
+                return result
+            result["restored_files"] = list(tables)
+            result["timings"]["write"] = time.perf_counter() - write_started
+
+            result["success"] = True
+
     except Exception as e:
         result["errors"].append(f"バックアップファイルの読み込みエラー: {str(e)}")
-    
+    finally:
+        result["timings"]["total"] = time.perf_counter() - started
+
     return result
 
 
@@ -141,6 +614,7 @@ def get_backup_info() -> Dict[str, Any]:
         "evaluation_results": ("採点結果", EVALUATION_RESULTS_FILE),
         "evaluation_details": ("採点詳細", EVALUATION_DETAILS_FILE),
         "files": ("ファイル情報", FILES_FILE),
+        "scoring_jobs": ("採点ジョブ", SCORING_JOBS_FILE),
     }
     
     info = {
@@ -150,16 +624,16 @@ def get_backup_info() -> Dict[str, Any]:
     }
     
     for key, (name, file_path) in data_files.items():
-        if file_path.exists():
+        status = describe_table_file(file_path)
+        if status["exists"]:
             data = load_json(file_path)
-            file_size = file_path.stat().st_size
             info["total_files"] += 1
-            info["total_size"] += file_size
+            info["total_size"] += status["size"]
             info["files"].append({
                 "key": key,
                 "name": name,
-                "path": str(file_path),
-                "size": file_size,
+                "path": status["path"],
+                "size": status["size"],
                 "count": len(data),
                 "exists": True
             })
@@ -167,10 +641,14 @@ def get_backup_info() -> Dict[str, Any]:
             info["files"].append({
                 "key": key,
                 "name": name,
-                "path": str(file_path),
+                "path": status["path"],
                 "size": 0,
                 "count": 0,
                 "exists": False
             })
     
+    info["snapshots"] = len(list_snapshots())
+    latest = load_snapshot()
+    info["latest_snapshot"] = latest.get("backup_date") if latest else None
+    
     return info
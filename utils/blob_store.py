@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+アップロードファイルの保存先（内容のハッシュごとに1つだけ保存するブロブストア）
+ファイルは uploads/blobs/<ハッシュの先頭2文字>/<SHA-256><拡張子> に保存します。
+同じ資料を再アップロードしても複製は作らず、同名の別ファイルで上書きされることもありません。
+
+ブロブの参照数は files テーブルの file_path から数えます。
+ファイル情報を削除して参照がなくなったブロブは削除されます。
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, BinaryIO
+
+from utils.data_manager import get_store
+
+# アップロードファイルの保存先（app.py と同じ）
+UPLOAD_DIR = Path("uploads")
+
+# ブロブの保存先
+BLOB_DIR = UPLOAD_DIR / "blobs"
+
+# ファイルを読み書きする単位（バイト）
+CHUNK_SIZE = 1024 * 1024
+
+# 参照のないブロブを一括削除するときに、作成からこの秒数以内のものは残す
+# （保存直後でファイル情報をまだ登録していないブロブを消さないため）
+DEFAULT_GC_GRACE_SECONDS = 600
+
+# ファイル情報の削除に続けてブロブを削除するときに、保存（再利用）からこの秒数以内のものは残す
+# （別のアップロードが同じ内容のブロブを再利用した直後の場合があるため。残ったものは collect_garbage で削除）
+RELEASE_GRACE_SECONDS = 60
+
+_lock = threading.Lock()
+
+
+def blob_path(content_sha256: str, suffix: str = "") -> Path:
+    """内容のハッシュと拡張子からブロブのパスを取得"""
+    return BLOB_DIR / content_sha256[:2] / f"{content_sha256}{suffix.lower()}"
+
+
+def is_blob(file_path) -> bool:
+    """ブロブストアのファイルか"""
+    try:
+        Path(file_path).relative_to(BLOB_DIR)
+        return True
+    except ValueError:
+        return False
+
+
+def store_stream(stream: BinaryIO, file_name: str) -> Tuple[Path, str, int]:
+    """
+    ストリームの内容をブロブとして保存（一定サイズずつ読み込みながらハッシュを計算）
+
+    Args:
+        stream: 読み込むストリーム（バイナリ）
+        file_name: 元のファイル名（拡張子を使用）
+
+    Returns:
+        tuple: (ブロブのパス, SHA-256, サイズ)
+    """
+    BLOB_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_name = tempfile.mkstemp(dir=BLOB_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        content_sha256 = digest.hexdigest()
+        target = blob_path(content_sha256, Path(file_name).suffix)
+        with _lock:
+            if target.exists():
+                # 同じ内容のブロブがすでにある場合は再利用（release で削除されないよう更新日時を更新）
+                os.unlink(temp_name)
+                os.utime(target)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp_name, target)
+        return target, content_sha256, size
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.unlink(temp_name)
+        raise
+
+
+def store_file(source: Path) -> Tuple[Path, str, int]:
+    """ファイルをブロブとして保存"""
+    with open(source, "rb") as f:
+        return store_stream(f, Path(source).name)
+
+
+def store_uploaded_file(uploaded_file) -> Tuple[Path, str, int]:
+    """Streamlitでアップロードされたファイルをブロブとして保存"""
+    uploaded_file.seek(0)
+    return store_stream(uploaded_file, uploaded_file.name)
+
+
+def reference_counts() -> Dict[str, int]:
+    """ファイルのパス -> 参照しているファイル情報の数"""
+    counts: Dict[str, int] = {}
+    for record in get_store().all("files"):
+        file_path = record.get("file_path")
+        if file_path:
+            key = Path(file_path).as_posix()
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def release(file_paths: Iterable[str]) -> int:
+    """
+    参照がなくなったファイルを削除（ファイル情報を削除した後に呼ぶ）
+
+    ブロブストア導入前の uploads/<提出資料ID>/ のファイルも、参照がなければ削除します。
+
+    Returns:
+        int: 削除したファイルの数
+    """
+    candidates = {Path(file_path).as_posix() for file_path in file_paths if file_path}
+    if not candidates:
+        return 0
+    counts = reference_counts()
+    cutoff = time.time() - RELEASE_GRACE_SECONDS
+    removed = 0
+    with _lock:
+        for file_path in candidates:
+            if counts.get(file_path):
+                continue
+            path = Path(file_path)
+            if not (is_blob(path) or _is_under_uploads(path)):
+                continue
+            try:
+                if is_blob(path) and path.stat().st_mtime > cutoff:
+                    continue
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def collect_garbage(grace_seconds: Optional[float] = None) -> Dict[str, int]:
+    """
+    どのファイル情報からも参照されていないブロブを削除
+
+    Args:
+        grace_seconds: 作成からこの秒数以内のブロブは残す（省略時は環境変数 BLOB_GC_GRACE_SECONDS または600）
+
+    Returns:
+        dict: blobs（ブロブの数）, removed（削除した数）, freed_bytes（削除したサイズ）
+    """
+    if grace_seconds is None:
+        grace_seconds = float(os.getenv("BLOB_GC_GRACE_SECONDS", str(DEFAULT_GC_GRACE_SECONDS)))
+    stats = {"blobs": 0, "removed": 0, "freed_bytes": 0}
+    if not BLOB_DIR.exists():
+        return stats
+    counts = reference_counts()
+    cutoff = time.time() - grace_seconds
+    with _lock:
+        for path in BLOB_DIR.glob("*/*"):
+            if not path.is_file():
+                continue
+            stats["blobs"] += 1
+            if counts.get(path.as_posix()):
+                continue
+            stat = path.stat()
+            if stat.st_mtime > cutoff:
+                continue
+            path.unlink()
+            stats["removed"] += 1
+            stats["freed_bytes"] += stat.st_size
+        # 中断された書き込みの一時ファイル
+        for path in BLOB_DIR.glob("*.tmp"):
+            if path.stat().st_mtime <= cutoff:
+                path.unlink()
+    return stats
+
+
+def _is_under_uploads(path: Path) -> bool:
+    try:
+        path.relative_to(UPLOAD_DIR)
+        return True
+    except ValueError:
+        return False
@@ -3,11 +3,33 @@
 """
 表彰状文章生成ユーティリティ
 各賞に適した表彰状の文章を生成します。
+
+生成した文章は (採点結果ID, 賞, 採点結果の更新日時) ごとにプロセス内でキャッシュし、
+画面の再描画のたびに評価詳細を読み込み直さないようにしています。
 """
 
-from typing import Optional, Dict, Any, List
+import os
+import hashlib
+import zipfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
-from utils.data_manager import get_evaluation_details, get_all_criteria
+from utils.data_manager import get_evaluation_details, get_all_criteria, get_store
+
+# 生成した表彰状の文章を保持する最大件数（古いものから削除）
+CERTIFICATE_CACHE_MAX_ENTRIES = 512
+
+# 表彰状をまとめたZIPファイルの保存先（環境変数 CERTIFICATE_EXPORT_DIR で変更可能）
+DEFAULT_CERTIFICATE_EXPORT_DIR = Path("data") / "exports"
+
+# 表彰状の内容に関係するテーブル（版が変わったらZIPファイルを作り直す）
+CERTIFICATE_TABLES = ("schools", "submissions", "evaluation_results", "evaluation_details")
+
+_certificate_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_certificate_cache_lock = threading.Lock()
+_export_lock = threading.Lock()
 
 
 def _get_high_score_criteria(result_id: Optional[int], threshold: int = 8) -> List[Dict[str, Any]]:
@@ -238,7 +260,7 @@ def generate_certificate_text(
 def generate_certificate_for_result(
     result: Dict[str, Any],
     award_types: List[str],
-    all_results: List[Dict[str, Any]]
+    all_results: Optional[List[Dict[str, Any]]] = None
 ) -> Dict[str, str]:
     """
     採点結果に基づいて表彰状の文章を生成
@@ -246,7 +268,7 @@ def generate_certificate_for_result(
     Args:
         result: 採点結果の辞書
         award_types: 授与された賞の種類のリスト（例: ["最優秀賞", "優秀賞"]）
-        all_results: すべての採点結果のリスト（ランキング判定用）
+        all_results: すべての採点結果のリスト（互換性のために残している引数で、使用しません）
     
     Returns:
         certificates: {賞の種類: 表彰状の文章} の辞書
@@ -260,17 +282,124 @@ def generate_certificate_for_result(
     
     for award_type in award_types:
         # 賞の種類から絵文字を除去（表示用）
-        clean_award_type = award_type.replace('🏆 ', '').replace('🥇 ', '').replace('⭐ ', '')
+        clean_award_type = _clean_award_type(award_type)
         
-        certificate_text = generate_certificate_text(
-            school_name=school_name,
-            theme_title=theme_title,
-            award_type=clean_award_type,
-            result_id=result_id,
-            total_score=total_score
-        )
+        # 同じ採点結果・賞・更新日時（・日付）の表彰状は生成済みのものを使う
+        cache_key = (result_id, clean_award_type, result.get('updated_at'),
+                     school_name, theme_title, total_score, datetime.now().date())
+        certificate_text = _get_cached_certificate(cache_key)
+        if certificate_text is None:
+            certificate_text = generate_certificate_text(
+                school_name=school_name,
+                theme_title=theme_title,
+                award_type=clean_award_type,
+                result_id=result_id,
+                total_score=total_score
+            )
+            _put_cached_certificate(cache_key, certificate_text)
         
         certificates[award_type] = certificate_text
     
     return certificates
 
+
+def _clean_award_type(award_type: str) -> str:
+    return award_type.replace('🏆 ', '').replace('🥇 ', '').replace('⭐ ', '')
+
+
+def _get_cached_certificate(key: tuple) -> Optional[str]:
+    with _certificate_cache_lock:
+        text = _certificate_cache.get(key)
+        if text is not None:
+            _certificate_cache.move_to_end(key)
+        return text
+
+
+def _put_cached_certificate(key: tuple, text: str):
+    with _certificate_cache_lock:
+        _certificate_cache[key] = text
+        _certificate_cache.move_to_end(key)
+        while len(_certificate_cache) > CERTIFICATE_CACHE_MAX_ENTRIES:
+            _certificate_cache.popitem(last=False)
+
+
+def clear_certificate_cache():
+    """生成済みの表彰状の文章をすべて破棄"""
+    with _certificate_cache_lock:
+        _certificate_cache.clear()
+
+
+# ==================== 表彰状の一括出力 ====================
+
+def write_certificates_zip(
+    output_path: Path,
+    winners: List[Tuple[Dict[str, Any], List[str]]]
+) -> int:
+    """
+    表彰状をMarkdownファイルにしてZIPファイルに書き出す
+    
+    Args:
+        output_path: 出力するZIPファイル
+        winners: (採点結果, 賞のリスト) のリスト（採点結果には school_name / theme_title / rank が必要）
+    
+    Returns:
+        count: 書き出した表彰状の数
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # 書き込み途中のファイルを読まれないよう、一時ファイルに書いてから置き換える
+    temp_path = output_path.with_name(output_path.name + ".tmp")
+    count = 0
+    with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for result, awards in winners:
+            certificates = generate_certificate_for_result(result, awards)
+            for award_type, certificate_text in certificates.items():
+                school_name = _safe_filename(result.get('school_name', '不明'))
+                rank = result.get('rank')
+                prefix = f"{rank:03d}_" if isinstance(rank, int) else ""
+                filename = f"{prefix}{school_name}_{_clean_award_type(award_type)}.md"
+                zf.writestr(filename, certificate_text + "\n")
+                count += 1
+    os.replace(temp_path, output_path)
+    return count
+
+
+def _safe_filename(name: str) -> str:
+    return "".join("_" if c in '\\/:*?"<>|' or ord(c) < 32 else c for c in str(name)).strip() or "不明"
+
+
+def export_all_certificates(force: bool = False) -> Tuple[Path, int]:
+    """
+    すべての受賞校の表彰状をZIPファイルに出力
+    
+    データが変わっていなければ、前回出力したZIPファイルをそのまま返します
+    （ファイル名にテーブルの版と日付を含めています）。
+    
+    Returns:
+        tuple: (ZIPファイルのパス, 表彰状の数。前回のファイルを使った場合はNone)
+    """
+    from utils.leaderboard import get_leaderboard
+
+    store = get_store()
+    signature = repr(([store.version(table) for table in CERTIFICATE_TABLES],
+                      datetime.now().date().isoformat()))
+    digest = hashlib.sha256(signature.encode('utf-8')).hexdigest()[:16]
+    export_dir = Path(os.getenv("CERTIFICATE_EXPORT_DIR", str(DEFAULT_CERTIFICATE_EXPORT_DIR)))
+    output_path = export_dir / f"certificates_{digest}.zip"
+
+    with _export_lock:
+        if output_path.exists() and not force:
+            return output_path, None
+        leaderboard = get_leaderboard()
+        winners = [(leaderboard.get_entry(result_id), awards)
+                   for result_id, awards in leaderboard.awards().items() if awards]
+        count = write_certificates_zip(output_path, [(r, a) for r, a in winners if r])
+        # 古いZIPファイルは削除
+        for old_path in export_dir.glob("certificates_*.zip"):
+            if old_path != output_path:
+                try:
+                    old_path.unlink()
+                except OSError:
+                    pass
+        return output_path, count
+
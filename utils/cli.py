@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+コマンドラインツール
+Streamlitを起動せずに、提出資料の取り込み・採点・エクスポート・バックアップを行います。
+
+使い方:
+    python -m utils import submissions/ --theme "探究テーマ"
+    python -m utils score --unscored --jobs 4
+    python -m utils export --output ranking.csv
+    python -m utils certificates --output certificates.zip
+    python -m utils backup --output backup.zip
+"""
+
+import sys
+import csv
+import json
+import shutil
+import argparse
+from pathlib import Path
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+# 取り込み対象のファイル形式
+SUPPORTED_SUFFIXES = ('.pdf', '.pptx', '.ppt', '.txt')
+
+
+def _configure_api(args):
+    """採点クライアントを作成（--api-key または環境変数 OPENAI_API_KEY / GOOGLE_API_KEY、なければNone）"""
+    from utils.ai_scoring import create_client, initialize_from_env
+
+    if getattr(args, "api_key", None):
+        return create_client(args.api_key, getattr(args, "provider", None))
+    return initialize_from_env()
+
+
+# ==================== import ====================
+
+def _find_or_create_school(name: str, schools: Dict[str, int]) -> int:
+    from utils.data_manager import create_school
+
+    if name not in schools:
+        schools[name] = create_school(name)
+    return schools[name]
+
+def import_directory(source_dir: Path, theme_title: Optional[str] = None) -> List[int]:
+    """
+    ディレクトリから提出資料を取り込む
+
+    source_dir 直下のサブディレクトリを1校の提出資料として扱います（ディレクトリ名 = 学校名）。
+    同名の参加校が登録済みの場合は、その参加校の提出資料として追加します。
+
+    Args:
+        source_dir: 取り込むディレクトリ
+        theme_title: テーマタイトル（省略時は学校名）
+
+    Returns:
+        list: 作成した提出資料IDのリスト
+    """
+    from utils.data_manager import (
+        get_all_schools, create_submission, create_file, update_submission_status, transaction
+    )
+    from utils.file_processor import get_file_type
+    from utils.blob_store import store_file
+
+    schools = {school['name']: school['id'] for school in get_all_schools()}
+    submission_ids = []
+
+    for school_dir in sorted(p for p in Path(source_dir).iterdir() if p.is_dir()):
+        files = sorted(p for p in school_dir.iterdir()
+                       if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES)
+        if not files:
+            print(f"スキップ: {school_dir.name}（対応するファイルがありません）", file=sys.stderr)
+            continue
+
+        with transaction():
+            school_id = _find_or_create_school(school_dir.name, schools)
+            submission_id = create_submission(school_id, theme_title or school_dir.name)
+
+        with transaction():
+            for source in files:
+                file_path, content_sha256, file_size = store_file(source)
+                create_file(submission_id, source.name, str(file_path),
+                            get_file_type(file_path), file_size,
+                            content_sha256=content_sha256)
+            update_submission_status(submission_id, "completed")
+
+        submission_ids.append(submission_id)
+        print(f"取り込み: {school_dir.name}（提出資料ID: {submission_id}、{len(files)}ファイル）")
+
+    return submission_ids
+
+def cmd_import(args) -> int:
+    submission_ids = import_directory(Path(args.directory), args.theme)
+    print(f"{len(submission_ids)}件の提出資料を取り込みました")
+    if args.enqueue and submission_ids:
+        from utils.job_queue import enqueue_submissions
+        enqueue_submissions(submission_ids, priority=args.priority, scoring_mode=args.mode)
+        print(f"{len(submission_ids)}件の採点ジョブをキューに追加しました")
+    return 0
+
+
+# ==================== score / worker ====================
+
+def _print_job_result(job: Dict[str, Any], result: Dict[str, Any]):
+    if result.get("success"):
+        print(f"完了: 提出資料ID {job['submission_id']}（総合スコア: {result['total_score']}/60）")
+    else:
+        print(f"失敗: 提出資料ID {job['submission_id']}（{result.get('error')}）", file=sys.stderr)
+
+def cmd_score(args) -> int:
+    from utils.job_queue import enqueue_submissions, get_unscored_submission_ids, drain_queue
+    from utils.data_manager import get_all_submissions
+
+    client = _configure_api(args)
+    if client is None:
+        print("APIキーが設定されていません（--api-key または OPENAI_API_KEY / GOOGLE_API_KEY）", file=sys.stderr)
+        return 2
+
+    if args.submission:
+        submission_ids = args.submission
+    elif args.all:
+        submission_ids = [s['id'] for s in get_all_submissions()]
+    else:
+        submission_ids = get_unscored_submission_ids()
+
+    if submission_ids:
+        enqueue_submissions(submission_ids, priority=args.priority, use_cache=not args.force,
+                            scoring_mode=args.mode)
+    print(f"{len(submission_ids)}件の提出資料を採点します（同時実行数: {args.jobs}）")
+
+    processed = drain_queue(concurrency=args.jobs, on_job_done=_print_job_result, client=client)
+    print(f"{processed}件のジョブを実行しました")
+    return 0
+
+def cmd_worker(args) -> int:
+    from utils.job_queue import ScoringWorker
+
+    client = _configure_api(args)
+    if client is None:
+        print("APIキーが設定されていません（--api-key または OPENAI_API_KEY / GOOGLE_API_KEY）", file=sys.stderr)
+        return 2
+
+    worker = ScoringWorker(poll_interval=args.poll_interval, stop_when_empty=args.once, client=client)
+    worker.start()
+    print("ワーカーを起動しました（Ctrl+Cで停止）")
+    try:
+        while worker.is_alive():
+            worker.join(timeout=1)
+    except KeyboardInterrupt:
+        print("実行中のジョブが終わり次第停止します...")
+        worker.stop()
+        worker.join()
+    return 0
+
+
+# ==================== export ====================
+
+def build_ranking() -> List[Dict[str, Any]]:
+    """採点済みの結果を総合スコア順（同点は採点結果IDの小さい順、画面のランキングと同じ）に並べたランキングを作成"""
+    from utils.data_manager import get_all_evaluation_results, get_evaluation_details_by_result
+    from utils.award_manager import determine_awards, ranking_key
+
+    completed_results = [r for r in get_all_evaluation_results()
+                         if r.get("evaluation_status") == "completed"]
+    sorted_results = sorted(completed_results, key=ranking_key)
+    awards_dict = determine_awards(completed_results)
+
+    details = get_evaluation_details_by_result([r['id'] for r in sorted_results])
+
+    ranking = []
+    for rank, result in enumerate(sorted_results, 1):
+        row = {
+            "順位": rank,
+            "参加校": result.get('school_name', '不明'),
+            "テーマ": result.get('theme_title', '不明'),
+            "総合スコア": result.get('total_score', 0),
+            "賞": " ".join(awards_dict.get(result.get('id'), [])),
+        }
+        for detail in details.get(result['id'], []):
+            row[detail.get('criterion_name', f"評価項目{detail['criterion_id']}")] = detail.get('score', 0)
+        row["result_id"] = result.get('id')
+        row["submission_id"] = result.get('submission_id')
+        ranking.append(row)
+    return ranking
+
+def cmd_export(args) -> int:
+    ranking = build_ranking()
+    output = open(args.output, 'w', encoding='utf-8-sig' if args.format == "csv" else 'utf-8',
+                  newline='') if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(ranking, output, ensure_ascii=False, indent=2)
+            output.write("\n")
+        else:
+            columns = []
+            for row in ranking:
+                columns.extend(column for column in row if column not in columns)
+            writer = csv.DictWriter(output, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(ranking)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.output:
+        print(f"{len(ranking)}件の採点結果を {args.output} に出力しました", file=sys.stderr)
+    return 0
+
+
+def cmd_certificates(args) -> int:
+    from utils.certificate_generator import export_all_certificates
+
+    path, count = export_all_certificates(force=args.force)
+    if args.output:
+        shutil.copyfile(path, args.output)
+        path = args.output
+    if count is None:
+        print(f"表彰状は更新されていません: {path}")
+    else:
+        print(f"{count}件の表彰状を {path} に出力しました")
+    return 0
+
+
+# ==================== backup / restore / migrate ====================
+
+def cmd_backup(args) -> int:
+    from utils.backup_restore import create_snapshot, write_backup, get_backup_dir
+
+    if args.snapshot_only:
+        manifest = create_snapshot(include_uploads=not args.no_uploads)
+        print(f"スナップショットを作成しました: {manifest['snapshot_id']}（{get_backup_dir()}）")
+    else:
+        output = args.output or f"pitch_contest_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        manifest = write_backup(output, include_uploads=not args.no_uploads)
+        print(f"バックアップを作成しました: {output}")
+    stats = manifest["stats"]
+    print(f"新たに保存: {stats['new_objects']}件（{stats['written_bytes']:,} bytes）、"
+          f"前回から変更なし: {stats['reused_objects']}件")
+    return 0
+
+def cmd_restore(args) -> int:
+    from utils.backup_restore import restore_backup
+
+    result = restore_backup(Path(args.backup_file), dry_run=args.dry_run, strict=args.strict)
+    for error in result["errors"]:
+        print(f"エラー: {error}", file=sys.stderr)
+    for warning in result["warnings"]:
+        print(f"警告: {warning}", file=sys.stderr)
+    if args.dry_run:
+        for table_name, row_count in result["counts"].items():
+            print(f"{table_name}: {row_count}件")
+        timings = result["timings"]
+        print(f"読み込み: {timings.get('read', 0):.2f}秒、検証: {timings.get('validate', 0):.2f}秒")
+        print("検証に成功しました（データは変更していません）" if result["success"] else "検証に失敗しました")
+        return 0 if result["success"] else 1
+    if not result["success"]:
+        print("データの復元に失敗しました", file=sys.stderr)
+        return 1
+    print(f"復元したデータ: {', '.join(result['restored_files'])}")
+    if result["restored_uploads"]:
+        print(f"復元したアップロードファイル: {result['restored_uploads']}件")
+    if result["backup_date"]:
+        print(f"バックアップ日時: {result['backup_date']}")
+    return 0
+
+def cmd_gc(args) -> int:
+    from utils.blob_store import collect_garbage
+
+    stats = collect_garbage(grace_seconds=args.grace)
+    print(f"参照されていないファイルを{stats['removed']}件削除しました"
+          f"（{stats['freed_bytes']:,} bytes、保存中のファイル: {stats['blobs'] - stats['removed']}件）")
+    return 0
+
+def cmd_format(args) -> int:
+    from utils.data_manager import get_store
+    from utils.storage import JsonStore, rewrite_json_tables
+
+    store = get_store()
+    if not isinstance(store, JsonStore):
+        print("JSONバックエンドでのみ使用できます（DATA_BACKEND=json）", file=sys.stderr)
+        return 1
+    names = rewrite_json_tables(store)
+    print(f"{', '.join(names)} を {store.json_format} 形式で書き直しました")
+    return 0
+
+def cmd_benchmark(args) -> int:
+    from utils.storage import benchmark_json_formats
+
+    print(f"採点詳細 {args.rows:,}行で計測しています...", file=sys.stderr)
+    for result in benchmark_json_formats(args.rows):
+        rss = f"{result['rss_bytes'] / 1024 / 1024:.1f} MB" if result["rss_bytes"] is not None else "-"
+        print(f"{result['format']:<16} ファイル: {result['file_bytes'] / 1024 / 1024:.1f} MB  "
+              f"書き込み: {result['write_seconds']:.2f}秒  読み込み: {result['load_seconds']:.2f}秒  "
+              f"RSS増加: {rss}  保持メモリ: {result['retained_bytes'] / 1024 / 1024:.1f} MB  "
+              f"最大: {result['peak_bytes'] / 1024 / 1024:.1f} MB")
+    return 0
+
+def cmd_migrate(args) -> int:
+    from utils.data_manager import DATA_DIR
+    from utils.storage import migrate_json_to_sqlite
+
+    counts = migrate_json_to_sqlite(DATA_DIR, args.db and Path(args.db), overwrite=args.overwrite)
+    for table_name, row_count in counts.items():
+        print(f"{table_name}: {row_count}件")
+    print("移行が完了しました。DATA_BACKEND=sqlite を設定して起動してください。")
+    return 0
+
+
+# ==================== エントリーポイント ====================
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m utils",
+        description="ピッチコンテストAI採点システムのコマンドラインツール"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_api_options(subparser):
+        subparser.add_argument("--api-key", help="APIキー（省略時は環境変数 OPENAI_API_KEY / GOOGLE_API_KEY）")
+        subparser.add_argument("--provider", choices=["openai", "gemini"], help="AIプロバイダー（省略時はキーから自動検出）")
+
+    def add_mode_option(subparser):
+        subparser.add_argument("--mode", choices=["per_criterion", "combined"],
+                               help="採点モード（ジョブに記録される、省略時は環境変数 SCORING_MODE）")
+
+    p = subparsers.add_parser("import", help="ディレクトリから提出資料を取り込む（サブディレクトリ = 1校）")
+    p.add_argument("directory", help="取り込むディレクトリ")
+    p.add_argument("--theme", help="テーマタイトル（省略時は学校名）")
+    p.add_argument("--enqueue", action="store_true", help="取り込んだ提出資料を採点キューに追加する")
+    p.add_argument("--priority", type=int, default=0, help="採点キューの優先度")
+    add_mode_option(p)
+    p.set_defaults(func=cmd_import)
+
+    p = subparsers.add_parser("score", help="提出資料を採点する（既定: 未採点のみ）")
+    target = p.add_mutually_exclusive_group()
+    target.add_argument("--unscored", action="store_true", help="未採点の提出資料を採点する（既定）")
+    target.add_argument("--all", action="store_true", help="すべての提出資料を採点する（採点済みは再採点）")
+    target.add_argument("--submission", type=int, nargs="+", metavar="ID", help="指定した提出資料を採点する")
+    p.add_argument("--jobs", type=int, default=2, help="同時に採点する提出資料の数")
+    p.add_argument("--priority", type=int, default=0, help="採点キューの優先度")
+    p.add_argument("--force", action="store_true", help="応答キャッシュを使わずに採点し直す")
+    add_api_options(p)
+    add_mode_option(p)
+    p.set_defaults(func=cmd_score)
+
+    p = subparsers.add_parser("worker", help="採点キューを処理するワーカーを起動する")
+    p.add_argument("--once", action="store_true", help="キューが空になったら終了する")
+    p.add_argument("--poll-interval", type=float, default=5.0, help="キューを確認する間隔（秒）")
+    add_api_options(p)
+    p.set_defaults(func=cmd_worker)
+
+    p = subparsers.add_parser("export", help="ランキング（評価項目ごとの点数つき）を出力する")
+    p.add_argument("--format", choices=["csv", "json"], default="csv", help="出力形式")
+    p.add_argument("--output", "-o", help="出力ファイル（省略時は標準出力）")
+    p.set_defaults(func=cmd_export)
+
+    p = subparsers.add_parser("certificates", help="受賞校の表彰状をまとめてZIPファイルに出力する")
+    p.add_argument("--output", "-o", help="出力ファイル（省略時は data/exports/ に出力）")
+    p.add_argument("--force", action="store_true", help="データが変わっていなくても作り直す")
+    p.set_defaults(func=cmd_certificates)
+
+    p = subparsers.add_parser("backup", help="データをZIPファイルにバックアップする")
+    p.add_argument("--output", "-o", help="出力ファイル")
+    p.add_argument("--snapshot-only", action="store_true",
+                   help="ZIPファイルを作らず、data/backups/ にスナップショット（変更分のみ）を保存する")
+    p.add_argument("--no-uploads", action="store_true", help="アップロードファイルを含めない")
+    p.set_defaults(func=cmd_backup)
+
+    p = subparsers.add_parser("restore", help="バックアップのZIPファイルから復元する")
+    p.add_argument("backup_file", help="バックアップファイル")
+    p.add_argument("--dry-run", action="store_true", help="書き込まずに検証し、件数と処理時間を表示する")
+    p.add_argument("--strict", action="store_true", help="参照先のない行があれば復元しない")
+    p.set_defaults(func=cmd_restore)
+
+    p = subparsers.add_parser("gc", help="どの提出資料からも参照されていないアップロードファイルを削除する")
+    p.add_argument("--grace", type=float, help="保存からこの秒数以内のファイルは残す（既定: 600）")
+    p.set_defaults(func=cmd_gc)
+
+    p = subparsers.add_parser("format", help="採点結果・採点詳細のJSONファイルを DATA_JSON_FORMAT の形式で書き直す")
+    p.set_defaults(func=cmd_format)
+
+    p = subparsers.add_parser("benchmark", help="JSONの保存形式ごとのファイルサイズ・読み込み時間・メモリを比較する")
+    p.add_argument("--rows", type=int, default=100000, help="採点詳細の行数")
+    p.set_defaults(func=cmd_benchmark)
+
+    p = subparsers.add_parser("migrate", help="data/*.json をSQLiteへ移行する")
+    p.add_argument("--db", help="移行先のSQLiteファイル")
+    p.add_argument("--overwrite", action="store_true", help="既存データを上書きする")
+    p.set_defaults(func=cmd_migrate)
+
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
@@ -1,14 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-データ管理ユーティリティ（CSV/JSONファイルベース）
+データ管理ユーティリティ（JSONファイル / SQLite）
 """
 
+import sys
 import json
-import pandas as pd
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 from datetime import datetime
+from utils.storage import create_store
+from utils.st_cache import cache_by_version
 
 # データディレクトリ
 DATA_DIR = Path("data")
@@ -20,17 +22,88 @@ SUBMISSIONS_FILE = DATA_DIR / "submissions.json"
 EVALUATION_RESULTS_FILE = DATA_DIR / "evaluation_results.json"
 EVALUATION_DETAILS_FILE = DATA_DIR / "evaluation_details.json"
 FILES_FILE = DATA_DIR / "files.json"
+SCORING_JOBS_FILE = DATA_DIR / "scoring_jobs.json"
+
+# ファイルパス -> テーブル名
+TABLE_FILES = {
+    SCHOOLS_FILE: "schools",
+    SUBMISSIONS_FILE: "submissions",
+    EVALUATION_RESULTS_FILE: "evaluation_results",
+    EVALUATION_DETAILS_FILE: "evaluation_details",
+    FILES_FILE: "files",
+    SCORING_JOBS_FILE: "scoring_jobs",
+}
+
+# データストア（環境変数 DATA_BACKEND で json / sqlite を切り替え）
+_store = create_store(DATA_DIR)
+
+def _mark_data_changed(table: str):
+    """Streamlit Cloudでのデータ永続化のため、セッション状態に変更フラグを設定"""
+    # CLIなどStreamlitを使わない実行ではstreamlitを読み込まない
+    if "streamlit" not in sys.modules:
+        return
+    try:
+        import streamlit as st
+        if 'data_changed' not in st.session_state:
+            st.session_state.data_changed = False
+        st.session_state.data_changed = True
+        st.session_state.last_data_change_time = datetime.now().isoformat()
+    except:
+        # Streamlitコンテキスト外では無視
+        pass
+
+_store.add_write_listener(_mark_data_changed)
+
+def _cached(*tables: str):
+    """読み込み結果をテーブルの版ごとにキャッシュ（Streamlitの実行中のみ、トランザクション中は使わない）"""
+    return cache_by_version(tables, _store.version, bypass=_store.in_transaction)
+
+def get_store():
+    """現在のデータストアを取得"""
+    return _store
+
+def get_storage_backend() -> str:
+    """使用中のストレージバックエンド名を取得（"json" / "sqlite"）"""
+    return _store.backend_name
+
+def transaction():
+    """書き込みをまとめてコミットする作業単位を開始
+    
+    with transaction(): の中で行った作成・更新・削除はバッファされ、
+    ブロックを抜けた時点で変更のあったテーブルごとに1回の書き込みで反映されます。
+    ブロック内で例外が発生した場合は何も書き込まれません。
+    """
+    return _store.transaction()
+
+def initialize_storage():
+    """テーブル（JSONファイルまたはSQLiteテーブル）を初期化"""
+    _store.ensure_tables()
+
+def describe_table_file(file_path: Path) -> Dict[str, Any]:
+    """テーブルの保存状態（存在有無・サイズ・パス）を取得"""
+    return _store.describe(TABLE_FILES[file_path])
 
 def load_json(file_path: Path, default: List = None) -> List[Dict[str, Any]]:
-    """JSONファイルを読み込む"""
+    """JSONファイルを読み込む（管理対象のテーブルはデータストアから取得）"""
+    table = TABLE_FILES.get(file_path)
+    if table is not None:
+        rows = _store.all(table)
+        if not rows and default is not None:
+            return default
+        return rows
     if file_path.exists():
         with open(file_path, 'r', encoding='utf-8') as f:
             return json.load(f)
     return default if default is not None else []
 
 def save_json(file_path: Path, data: List[Dict[str, Any]]):
-    """JSONファイルに保存（永続化）"""
+    """JSONファイルに保存（永続化、管理対象のテーブルはデータストアへ保存）"""
     try:
+        table = TABLE_FILES.get(file_path)
+        if table is not None:
+            _store.replace_all(table, data)
+            return
+        
         # ディレクトリが存在しない場合は作成
         file_path.parent.mkdir(parents=True, exist_ok=True)
         
@@ -45,17 +118,6 @@ def save_json(file_path: Path, data: List[Dict[str, Any]]):
         # ファイルが正しく保存されたか確認
         if not file_path.exists():
             raise IOError(f"ファイルの保存に失敗しました: {file_path}")
-        
-        # Streamlit Cloudでのデータ永続化のため、セッション状態に変更フラグを設定
-        try:
-            import streamlit as st
-            if 'data_changed' not in st.session_state:
-                st.session_state.data_changed = False
-            st.session_state.data_changed = True
-            st.session_state.last_data_change_time = datetime.now().isoformat()
-        except:
-            # Streamlitコンテキスト外では無視
-            pass
             
     except Exception as e:
         # エラーが発生した場合はログに記録
@@ -73,47 +135,33 @@ def get_next_id(data_list: List[Dict[str, Any]]) -> int:
 
 def create_school(name: str, prefecture: Optional[str] = None) -> int:
     """参加校を作成"""
-    schools = load_json(SCHOOLS_FILE)
-    school_id = get_next_id(schools)
     school = {
-        "id": school_id,
         "name": name,
         "prefecture": prefecture,
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat()
     }
-    schools.append(school)
-    save_json(SCHOOLS_FILE, schools)
-    return school_id
+    return _store.insert("schools", school)
 
 def get_school(school_id: int) -> Optional[Dict[str, Any]]:
     """参加校を取得"""
-    schools = load_json(SCHOOLS_FILE)
-    return next((s for s in schools if s['id'] == school_id), None)
+    return _store.get("schools", school_id)
 
+@_cached("schools")
 def get_all_schools() -> List[Dict[str, Any]]:
     """すべての参加校を取得"""
     return load_json(SCHOOLS_FILE)
 
 def delete_school(school_id: int) -> bool:
     """参加校を削除"""
-    schools = load_json(SCHOOLS_FILE)
-    original_count = len(schools)
-    schools = [s for s in schools if s['id'] != school_id]
-    if len(schools) < original_count:
-        save_json(SCHOOLS_FILE, schools)
-        return True
-    return False
+    return _store.delete_where("schools", "id", school_id) > 0
 
 # ==================== Submissions ====================
 
 def create_submission(school_id: int, theme_title: str,
                      theme_description: Optional[str] = None) -> int:
     """提出資料を作成"""
-    submissions = load_json(SUBMISSIONS_FILE)
-    submission_id = get_next_id(submissions)
     submission = {
-        "id": submission_id,
         "school_id": school_id,
         "theme_title": theme_title,
         "theme_description": theme_description,
@@ -122,20 +170,18 @@ def create_submission(school_id: int, theme_title: str,
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat()
     }
-    submissions.append(submission)
-    save_json(SUBMISSIONS_FILE, submissions)
-    return submission_id
+    return _store.insert("submissions", submission)
 
 def get_submission(submission_id: int) -> Optional[Dict[str, Any]]:
     """提出資料を取得"""
-    submissions = load_json(SUBMISSIONS_FILE)
-    submission = next((s for s in submissions if s['id'] == submission_id), None)
+    submission = _store.get("submissions", submission_id)
     if submission:
         school = get_school(submission['school_id'])
         if school:
             submission['school_name'] = school['name']
     return submission
 
+@_cached("submissions", "schools")
 def get_all_submissions() -> List[Dict[str, Any]]:
     """すべての提出資料を取得"""
     submissions = load_json(SUBMISSIONS_FILE)
@@ -146,71 +192,65 @@ def get_all_submissions() -> List[Dict[str, Any]]:
 
 def update_submission_status(submission_id: int, status: str):
     """提出資料のステータスを更新"""
-    submissions = load_json(SUBMISSIONS_FILE)
-    for submission in submissions:
-        if submission['id'] == submission_id:
-            submission['submission_status'] = status
-            submission['updated_at'] = datetime.now().isoformat()
-            break
-    save_json(SUBMISSIONS_FILE, submissions)
+    _store.update("submissions", submission_id, {
+        "submission_status": status,
+        "updated_at": datetime.now().isoformat()
+    })
 
 # ==================== Files ====================
 
 def create_file(submission_id: int, file_name: str, file_path: str,
-                file_type: str, file_size: int) -> int:
+                file_type: str, file_size: int, content_sha256: Optional[str] = None) -> int:
     """ファイル情報を作成"""
-    files = load_json(FILES_FILE)
-    file_id = get_next_id(files)
     file_data = {
-        "id": file_id,
         "submission_id": submission_id,
         "file_name": file_name,
         "file_path": file_path,
         "file_type": file_type,
         "file_size": file_size,
+        "content_sha256": content_sha256,
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat()
     }
-    files.append(file_data)
-    save_json(FILES_FILE, files)
-    return file_id
+    return _store.insert("files", file_data)
 
+def update_file(file_id: int, **fields) -> bool:
+    """ファイル情報を更新（content_sha256、text_parser_version など）"""
+    fields["updated_at"] = datetime.now().isoformat()
+    return _store.update("files", file_id, fields)
+
+@_cached("files")
 def get_files_by_submission(submission_id: int) -> List[Dict[str, Any]]:
     """提出資料に紐づくファイルを取得"""
-    files = load_json(FILES_FILE)
-    return [f for f in files if f['submission_id'] == submission_id]
+    return _store.find("files", "submission_id", submission_id)
 
 def delete_files_by_submission(submission_id: int):
-    """提出資料に紐づくファイルを削除"""
-    files = load_json(FILES_FILE)
-    original_count = len(files)
-    files = [f for f in files if f['submission_id'] != submission_id]
-    if len(files) < original_count:
-        save_json(FILES_FILE, files)
-        return True
-    return False
+    """提出資料に紐づくファイルを削除（参照がなくなったアップロードファイルも削除）"""
+    from utils.blob_store import release
+    with _store.transaction() as tx:
+        file_paths = [f.get('file_path') for f in _store.find("files", "submission_id", submission_id)]
+        deleted = _store.delete_where("files", "submission_id", submission_id) > 0
+        # ファイルは削除がコミットされてから削除する（ロールバックした場合は残す）
+        if deleted:
+            tx.after_commit(lambda: release(file_paths))
+    return deleted
 
 def update_submission(submission_id: int, theme_title: str, theme_description: Optional[str] = None):
     """提出資料を更新"""
-    submissions = load_json(SUBMISSIONS_FILE)
-    for submission in submissions:
-        if submission['id'] == submission_id:
-            submission['theme_title'] = theme_title
-            if theme_description is not None:
-                submission['theme_description'] = theme_description
-            submission['updated_at'] = datetime.now().isoformat()
-            break
-    save_json(SUBMISSIONS_FILE, submissions)
+    fields = {
+        "theme_title": theme_title,
+        "updated_at": datetime.now().isoformat()
+    }
+    if theme_description is not None:
+        fields["theme_description"] = theme_description
+    _store.update("submissions", submission_id, fields)
 
 # ==================== Evaluation Results ====================
 
 def create_evaluation_result(submission_id: int, evaluated_by: Optional[int] = None,
                             ai_model: Optional[str] = None) -> int:
     """採点結果を作成"""
-    results = load_json(EVALUATION_RESULTS_FILE)
-    result_id = get_next_id(results)
     result = {
-        "id": result_id,
         "submission_id": submission_id,
         "total_score": 0,
         "max_score": 60,
@@ -222,38 +262,29 @@ def create_evaluation_result(submission_id: int, evaluated_by: Optional[int] = N
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat()
     }
-    results.append(result)
-    save_json(EVALUATION_RESULTS_FILE, results)
-    return result_id
+    return _store.insert("evaluation_results", result)
 
 def update_evaluation_result(result_id: int, total_score: int, status: str,
                              evaluation_notes: Optional[str] = None):
     """採点結果を更新"""
-    results = load_json(EVALUATION_RESULTS_FILE)
-    for result in results:
-        if result['id'] == result_id:
-            result['total_score'] = total_score
-            result['evaluation_status'] = status
-            result['evaluation_notes'] = evaluation_notes
-            result['evaluated_at'] = datetime.now().isoformat()
-            result['updated_at'] = datetime.now().isoformat()
-            break
-    save_json(EVALUATION_RESULTS_FILE, results)
+    _store.update("evaluation_results", result_id, {
+        "total_score": total_score,
+        "evaluation_status": status,
+        "evaluation_notes": evaluation_notes,
+        "evaluated_at": datetime.now().isoformat(),
+        "updated_at": datetime.now().isoformat()
+    })
 
 def set_special_judge_award(result_id: int, is_awarded: bool = True):
     """特別審査員賞を設定"""
-    results = load_json(EVALUATION_RESULTS_FILE)
-    for result in results:
-        if result['id'] == result_id:
-            result['special_judge_award'] = is_awarded
-            result['updated_at'] = datetime.now().isoformat()
-            break
-    save_json(EVALUATION_RESULTS_FILE, results)
+    _store.update("evaluation_results", result_id, {
+        "special_judge_award": is_awarded,
+        "updated_at": datetime.now().isoformat()
+    })
 
 def get_special_judge_award(result_id: int) -> bool:
     """特別審査員賞の設定を取得"""
-    results = load_json(EVALUATION_RESULTS_FILE)
-    result = next((r for r in results if r['id'] == result_id), None)
+    result = _store.get("evaluation_results", result_id)
     if result:
         return result.get('special_judge_award', False)
     return False
@@ -261,10 +292,7 @@ def get_special_judge_award(result_id: int) -> bool:
 def create_evaluation_detail(result_id: int, criterion_id: int,
                              score: int, evaluation_reason: str) -> int:
     """採点結果詳細を作成"""
-    details = load_json(EVALUATION_DETAILS_FILE)
-    detail_id = get_next_id(details)
     detail = {
-        "id": detail_id,
         "evaluation_result_id": result_id,
         "criterion_id": criterion_id,
         "score": score,
@@ -272,14 +300,11 @@ def create_evaluation_detail(result_id: int, criterion_id: int,
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat()
     }
-    details.append(detail)
-    save_json(EVALUATION_DETAILS_FILE, details)
-    return detail_id
+    return _store.insert("evaluation_details", detail)
 
 def get_evaluation_result(result_id: int) -> Optional[Dict[str, Any]]:
     """採点結果を取得"""
-    results = load_json(EVALUATION_RESULTS_FILE)
-    result = next((r for r in results if r['id'] == result_id), None)
+    result = _store.get("evaluation_results", result_id)
     if result:
         submission = get_submission(result['submission_id'])
         if submission:
@@ -287,10 +312,10 @@ def get_evaluation_result(result_id: int) -> Optional[Dict[str, Any]]:
             result['school_name'] = submission.get('school_name', '不明')
     return result
 
+@_cached("evaluation_details")
 def get_evaluation_details(result_id: int) -> List[Dict[str, Any]]:
     """採点結果詳細を取得"""
-    details = load_json(EVALUATION_DETAILS_FILE)
-    result_details = [d for d in details if d['evaluation_result_id'] == result_id]
+    result_details = _store.find("evaluation_details", "evaluation_result_id", result_id)
     
     # 評価基準情報を追加
     criteria = get_all_criteria()
@@ -306,6 +331,7 @@ def get_evaluation_details(result_id: int) -> List[Dict[str, Any]]:
     result_details.sort(key=lambda x: criteria_dict.get(x['criterion_id'], {}).get('display_order', 0))
     return result_details
 
+@_cached("evaluation_results", "submissions", "schools")
 def get_all_evaluation_results() -> List[Dict[str, Any]]:
     """すべての採点結果を取得"""
     results = load_json(EVALUATION_RESULTS_FILE)
@@ -319,31 +345,141 @@ def get_all_evaluation_results() -> List[Dict[str, Any]]:
     
     return results
 
+@_cached("evaluation_details")
+def get_evaluation_details_by_result(result_ids: Optional[List[int]] = None) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    複数の採点結果の詳細をまとめて取得（詳細テーブルは1回だけ読み込む）
+    
+    Args:
+        result_ids: 採点結果IDのリスト（省略時はすべて）
+    
+    Returns:
+        dict: 採点結果ID -> 詳細のリスト（get_evaluation_details と同じ形式・順序）
+    """
+    criteria_dict = {c['id']: c for c in get_all_criteria()}
+    wanted = set(result_ids) if result_ids is not None else None
+    
+    grouped: Dict[int, List[Dict[str, Any]]] = {}
+    for detail in _store.all("evaluation_details"):
+        result_id = detail.get('evaluation_result_id')
+        if wanted is not None and result_id not in wanted:
+            continue
+        criterion = criteria_dict.get(detail['criterion_id'])
+        if criterion:
+            detail['criterion_name'] = criterion['criterion_name']
+            detail['criterion_description'] = criterion['description']
+        grouped.setdefault(result_id, []).append(detail)
+    
+    for details in grouped.values():
+        details.sort(key=lambda x: criteria_dict.get(x['criterion_id'], {}).get('display_order', 0))
+    return grouped
+
+@_cached("schools", "submissions", "evaluation_results", "evaluation_details")
+def get_school_score_matrix() -> List[Dict[str, Any]]:
+    """
+    参加校 × 評価項目のスコア・採点理由の表を取得
+    
+    各参加校の最新の採点完了結果（evaluated_at が最も新しいもの）を使います。
+    参加校・提出資料・採点結果・詳細をそれぞれ1回ずつ読み込み、件数に比例した時間で作成します。
+    
+    Returns:
+        list: 参加校ごと（get_all_schools の順）の dict
+            - school: 参加校
+            - result: 最新の採点結果（未採点の場合はNone）
+            - submission_id: 採点結果の提出資料ID（未採点の場合はNone）
+            - scores: 評価項目ID -> スコア
+            - reasons: 評価項目ID -> 採点理由
+    """
+    schools = get_all_schools()
+    submission_schools = {s['id']: s.get('school_id') for s in _store.all("submissions")}
+    
+    # 参加校ごとの最新の採点完了結果
+    latest: Dict[int, Dict[str, Any]] = {}
+    for result in _store.all("evaluation_results"):
+        if result.get('evaluation_status') != "completed":
+            continue
+        school_id = submission_schools.get(result.get('submission_id'))
+        if not school_id:
+            continue
+        current = latest.get(school_id)
+        if current is None or (result.get('evaluated_at') or '') > (current.get('evaluated_at') or ''):
+            latest[school_id] = result
+    
+    details = get_evaluation_details_by_result([r['id'] for r in latest.values()])
+    
+    matrix = []
+    for school in schools:
+        result = latest.get(school['id'])
+        result_details = details.get(result['id'], []) if result else []
+        matrix.append({
+            "school": school,
+            "result": result,
+            "submission_id": result.get('submission_id') if result else None,
+            "scores": {d['criterion_id']: d.get('score', 0) for d in result_details},
+            "reasons": {d['criterion_id']: d.get('evaluation_reason', '') for d in result_details},
+        })
+    return matrix
+
 def delete_evaluation_details(result_id: int):
     """採点結果詳細を削除（採点結果は残す）"""
-    details = load_json(EVALUATION_DETAILS_FILE)
-    original_count = len(details)
-    details = [d for d in details if d['evaluation_result_id'] != result_id]
-    if len(details) < original_count:
-        save_json(EVALUATION_DETAILS_FILE, details)
-        return True
-    return False
+    return _store.delete_where("evaluation_details", "evaluation_result_id", result_id) > 0
 
 def delete_evaluation_result(result_id: int) -> bool:
-    """採点結果を削除（関連する詳細も削除）"""
-    # 採点結果を削除
-    results = load_json(EVALUATION_RESULTS_FILE)
-    original_count = len(results)
-    results = [r for r in results if r['id'] != result_id]
-    if len(results) < original_count:
-        save_json(EVALUATION_RESULTS_FILE, results)
-        
-        # 関連する詳細も削除
-        delete_evaluation_details(result_id)
-        
-        return True
+    """採点結果を削除（関連する詳細も同じトランザクションで削除）"""
+    with transaction():
+        # 採点結果を削除
+        if _store.delete_where("evaluation_results", "id", result_id) > 0:
+            # 関連する詳細も削除（詳細だけが残った状態にはならない）
+            delete_evaluation_details(result_id)
+            return True
     return False
 
+# ==================== Scoring Jobs ====================
+
+def create_scoring_job(submission_id: int, priority: int = 0, use_cache: bool = True,
+                       scoring_mode: Optional[str] = None) -> int:
+    """採点ジョブを作成（キューに追加）"""
+    job = {
+        "submission_id": submission_id,
+        "priority": priority,
+        "use_cache": use_cache,
+        "scoring_mode": scoring_mode,
+        "status": "queued",
+        "attempts": 0,
+        "completed_criteria": 0,
+        "total_criteria": 0,
+        "result_id": None,
+        "total_score": None,
+        "error": None,
+        "started_at": None,
+        "finished_at": None,
+        "created_at": datetime.now().isoformat(),
+        "updated_at": datetime.now().isoformat()
+    }
+    return _store.insert("scoring_jobs", job)
+
+def get_scoring_job(job_id: int) -> Optional[Dict[str, Any]]:
+    """採点ジョブを取得"""
+    return _store.get("scoring_jobs", job_id)
+
+@_cached("scoring_jobs")
+def get_all_scoring_jobs() -> List[Dict[str, Any]]:
+    """すべての採点ジョブを取得"""
+    return _store.all("scoring_jobs")
+
+def get_scoring_jobs_by_submission(submission_id: int) -> List[Dict[str, Any]]:
+    """提出資料に紐づく採点ジョブを取得"""
+    return _store.find("scoring_jobs", "submission_id", submission_id)
+
+def update_scoring_job(job_id: int, **fields) -> bool:
+    """採点ジョブを更新（status、completed_criteria など）"""
+    fields["updated_at"] = datetime.now().isoformat()
+    return _store.update("scoring_jobs", job_id, fields)
+
+def delete_scoring_job(job_id: int) -> bool:
+    """採点ジョブを削除"""
+    return _store.delete_where("scoring_jobs", "id", job_id) > 0
+
 # ==================== Evaluation Criteria ====================
 
 def get_all_criteria() -> List[Dict[str, Any]]:
@@ -7,7 +7,7 @@ Streamlit Cloudでのデータ永続化をサポートします。
 
 import streamlit as st
 from pathlib import Path
-from utils.data_manager import DATA_DIR, SCHOOLS_FILE, SUBMISSIONS_FILE, EVALUATION_RESULTS_FILE, EVALUATION_DETAILS_FILE, FILES_FILE
+from utils.data_manager import DATA_DIR, SCHOOLS_FILE, SUBMISSIONS_FILE, EVALUATION_RESULTS_FILE, EVALUATION_DETAILS_FILE, FILES_FILE, SCORING_JOBS_FILE, describe_table_file, get_storage_backend
 
 
 def check_data_persistence():
@@ -23,17 +23,12 @@ def check_data_persistence():
         "採点結果": EVALUATION_RESULTS_FILE,
         "採点詳細": EVALUATION_DETAILS_FILE,
         "ファイル情報": FILES_FILE,
+        "採点ジョブ": SCORING_JOBS_FILE,
     }
     
     status = {}
     for name, file_path in data_files.items():
-        exists = file_path.exists()
-        size = file_path.stat().st_size if exists else 0
-        status[name] = {
-            "exists": exists,
-            "size": size,
-            "path": str(file_path)
-        }
+        status[name] = describe_table_file(file_path)
     
     return status
 
@@ -43,7 +38,8 @@ def show_data_persistence_info():
     st.info("""
     **データの永続化について**
     
-    データは`data/`ディレクトリのJSONファイルに保存されます。
+    データは`data/`ディレクトリのJSONファイル（またはSQLiteデータベース）に保存されます。
+    保存方式は環境変数 `DATA_BACKEND`（`json` / `sqlite`）で切り替えられます。
     
     **Streamlit Cloudでの注意事項：**
     - データファイルはGitリポジトリにコミットすることで永続化されます
@@ -59,6 +55,7 @@ def show_data_persistence_info():
     status = check_data_persistence()
     
     st.markdown("### データファイルの状態")
+    st.caption(f"ストレージバックエンド: {get_storage_backend()}")
     for name, info in status.items():
         if info["exists"]:
             st.success(f"✅ {name}: {info['size']} bytes ({info['path']})")
@@ -70,18 +67,9 @@ def ensure_data_directory():
     """データディレクトリが存在することを確認"""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     
-    # 各データファイルが存在しない場合は空のリストで初期化
-    from utils.data_manager import save_json
+    # 各テーブルが存在しない場合は空で初期化（JSONファイル / SQLiteテーブル）
+    from utils.data_manager import initialize_storage
     
-    if not SCHOOLS_FILE.exists():
-        save_json(SCHOOLS_FILE, [])
-    if not SUBMISSIONS_FILE.exists():
-        save_json(SUBMISSIONS_FILE, [])
-    if not EVALUATION_RESULTS_FILE.exists():
-        save_json(EVALUATION_RESULTS_FILE, [])
-    if not EVALUATION_DETAILS_FILE.exists():
-        save_json(EVALUATION_DETAILS_FILE, [])
-    if not FILES_FILE.exists():
-        save_json(FILES_FILE, [])
+    initialize_storage()
 
 
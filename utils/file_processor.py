@@ -6,65 +6,95 @@ PDF、PowerPoint等のファイルからテキストを抽出します。
 """
 
 import io
+import os
+import sys
+import hashlib
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Optional, List, Dict, Any, Callable, Tuple, Iterator, Iterable, Union
 import PyPDF2
 from pptx import Presentation
 
-def extract_text_from_pdf(file_path: Path) -> str:
-    """PDFファイルからテキストを抽出"""
+# テキスト抽出処理を変更したら上げる（抽出済みテキストのキャッシュが無効になる）
+PARSER_VERSION = 1
+
+# 抽出済みテキストの保存先（環境変数 TEXT_CACHE_DIR で変更可能）
+TEXT_CACHE_DIR = Path(os.getenv("TEXT_CACHE_DIR", str(Path("data") / "text_cache")))
+
+# 提出資料1件あたりに抽出する最大文字数の既定値
+# （採点時のプロンプトには先頭の MAX_CONTENT_CHARS 文字しか含めないため、それ以降のページは読まない）
+DEFAULT_EXTRACTION_MAX_CHARS = 20000
+
+def get_extraction_max_chars() -> int:
+    """提出資料1件あたりに抽出する最大文字数（環境変数 EXTRACTION_MAX_CHARS、0の場合は制限しない）"""
+    return max(0, int(os.getenv("EXTRACTION_MAX_CHARS", str(DEFAULT_EXTRACTION_MAX_CHARS))))
+
+def iter_pdf_pages(file_path: Path) -> Iterator[str]:
+    """PDFファイルのテキストを1ページずつ返す"""
     try:
         with open(file_path, 'rb') as f:
             pdf_reader = PyPDF2.PdfReader(f)
-            text = ""
             for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text.strip()
+                yield page.extract_text() or ""
+    except GeneratorExit:
+        raise
     except Exception as e:
         raise Exception(f"PDFのテキスト抽出に失敗しました: {e}")
 
-def extract_text_from_pptx(file_path: Path) -> str:
-    """PowerPointファイルからテキストを抽出"""
+def iter_pptx_slides(file_path: Path) -> Iterator[str]:
+    """PowerPointファイルのテキストを1スライドずつ返す"""
     try:
         prs = Presentation(file_path)
-        text = ""
         for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + "\n"
-        return text.strip()
+            yield "\n".join(shape.text for shape in slide.shapes if hasattr(shape, "text"))
+    except GeneratorExit:
+        raise
     except Exception as e:
         raise Exception(f"PowerPointのテキスト抽出に失敗しました: {e}")
 
-def extract_text_from_file(file_path: Path) -> Optional[str]:
-    """ファイル形式に応じてテキストを抽出"""
+def _join_with_budget(chunks: Iterable[str], max_chars: Optional[int] = None) -> str:
+    """ページ・スライドごとのテキストを結合（最大文字数に達したら残りは読まない）"""
+    parts = []
+    total = 0
+    for chunk in chunks:
+        if max_chars and total + len(chunk) >= max_chars:
+            parts.append(chunk[:max_chars - total])
+            break
+        parts.append(chunk)
+        total += len(chunk) + 1  # 区切りの改行
+    return "\n".join(parts).strip()
+
+def extract_text_from_pdf(file_path: Path, max_chars: Optional[int] = None) -> str:
+    """PDFファイルからテキストを抽出（max_chars に達したら残りのページは読まない）"""
+    return _join_with_budget(iter_pdf_pages(file_path), max_chars)
+
+def extract_text_from_pptx(file_path: Path, max_chars: Optional[int] = None) -> str:
+    """PowerPointファイルからテキストを抽出（max_chars に達したら残りのスライドは読まない）"""
+    return _join_with_budget(iter_pptx_slides(file_path), max_chars)
+
+def extract_text_from_file(file_path: Path, max_chars: Optional[int] = None) -> Optional[str]:
+    """ファイル形式に応じてテキストを抽出（max_chars を指定した場合はその文字数まで）"""
     suffix = file_path.suffix.lower()
+    read_size = max_chars if max_chars else -1
     
     if suffix == '.pdf':
-        return extract_text_from_pdf(file_path)
+        return extract_text_from_pdf(file_path, max_chars)
     elif suffix in ['.pptx', '.ppt']:
-        return extract_text_from_pptx(file_path)
+        return extract_text_from_pptx(file_path, max_chars)
     elif suffix == '.txt':
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
+                return f.read(read_size)
         except UnicodeDecodeError:
             # UTF-8で読めない場合はShift-JISで試す
             with open(file_path, 'r', encoding='shift-jis') as f:
-                return f.read()
+                return f.read(read_size)
     else:
         raise ValueError(f"サポートされていないファイル形式です: {suffix}")
 
-def save_uploaded_file(uploaded_file, upload_dir: Path) -> Path:
-    """アップロードされたファイルを保存"""
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    file_path = upload_dir / uploaded_file.name
-    
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    
-    return file_path
-
 def get_file_size(file_path: Path) -> int:
     """ファイルサイズを取得（バイト）"""
     return file_path.stat().st_size
@@ -82,19 +112,283 @@ def get_file_type(file_path: Path) -> str:
     }
     return type_map.get(suffix, 'Unknown')
 
+def file_sha256(file_path: Path) -> str:
+    """ファイル内容のSHA-256ハッシュを取得"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
+def _text_cache_path(content_sha256: str, suffix: str, max_chars: int) -> Path:
+    """抽出済みテキストの保存先（内容のハッシュ・形式・パーサーのバージョン・最大文字数ごと）"""
+    return TEXT_CACHE_DIR / f"{content_sha256}{suffix}.v{PARSER_VERSION}.c{max_chars}.txt"
 
+def _read_text_cache(content_sha256: str, suffix: str, max_chars: int) -> Optional[str]:
+    """保存済みのテキストを取得（未保存の場合はNone）"""
+    cache_path = _text_cache_path(content_sha256, suffix, max_chars)
+    if cache_path.exists():
+        return cache_path.read_text(encoding='utf-8')
+    return None
 
+def _write_text_cache(content_sha256: str, suffix: str, max_chars: int, text: str):
+    """抽出したテキストを保存"""
+    cache_path = _text_cache_path(content_sha256, suffix, max_chars)
+    # 一時ファイルに書いてから置き換える（並行して抽出した場合も壊れないように）
+    TEXT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temp_path.write_text(text, encoding='utf-8')
+    os.replace(temp_path, cache_path)
 
+def extract_text_cached(file_path: Path, content_sha256: Optional[str] = None,
+                        max_chars: Optional[int] = None) -> str:
+    """
+    ファイルからテキストを抽出（同じ内容のファイルは保存済みのテキストを再利用）
+    
+    Args:
+        file_path: ファイルパス
+        content_sha256: ファイル内容のハッシュ（省略時は計算する）
+        max_chars: 抽出する最大文字数（省略時は get_extraction_max_chars()）
+    
+    Returns:
+        str: 抽出したテキスト
+    """
+    if content_sha256 is None:
+        content_sha256 = file_sha256(file_path)
+    if max_chars is None:
+        max_chars = get_extraction_max_chars()
+    suffix = file_path.suffix.lower()
+    text = _read_text_cache(content_sha256, suffix, max_chars)
+    if text is None:
+        text = extract_text_from_file(file_path, max_chars) or ""
+        _write_text_cache(content_sha256, suffix, max_chars, text)
+    return text
 
+# ==================== 並列抽出（プロセスプール） ====================
 
+def get_extraction_settings() -> Dict[str, Any]:
+    """並列抽出の設定を取得（環境変数 EXTRACTION_WORKERS / EXTRACTION_TIMEOUT / EXTRACTION_MEMORY_MB）"""
+    return {
+        # 0の場合はプロセスを使わずに順番に抽出する
+        "workers": max(0, int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))),
+        # 1ファイルあたりの制限時間（秒）
+        "timeout": float(os.getenv("EXTRACTION_TIMEOUT", "120")),
+        # 1プロセスあたりのメモリ上限（MB、0の場合は制限しない）
+        "memory_mb": max(0, int(os.getenv("EXTRACTION_MEMORY_MB", "1024"))),
+    }
 
+# 子プロセスは「python -m utils.file_processor」で起動する（Streamlitのスクリプトを読み込まないように）
+_PACKAGE_ROOT = Path(__file__).resolve().parent.parent
 
+def _set_memory_limit(memory_mb: int):
+    """このプロセスのメモリ上限を設定（設定できない環境では何もしない）"""
+    if not memory_mb:
+        return
+    try:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
 
+def _extract_in_subprocess(file_path: Path, timeout: float, memory_mb: int, max_chars: int) -> str:
+    """子プロセスでテキストを抽出（制限時間を超えた場合は強制終了）"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "utils.file_processor", str(Path(file_path).resolve()),
+         "--memory-mb", str(memory_mb), "--max-chars", str(max_chars)],
+        cwd=str(_PACKAGE_ROOT), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise TimeoutError(f"テキスト抽出が制限時間（{timeout:g}秒）を超えました")
+    if process.returncode != 0:
+        message = stderr.decode('utf-8', errors='replace').strip().splitlines()
+        raise Exception(message[-1] if message else
+                        f"テキスト抽出のプロセスが異常終了しました（終了コード: {process.returncode}）")
+    return stdout.decode('utf-8')
 
+def extract_texts_parallel(file_paths: List[Path], workers: Optional[int] = None,
+                           timeout: Optional[float] = None,
+                           memory_mb: Optional[int] = None,
+                           max_chars: Union[int, List[int], None] = None) -> List[Tuple[Optional[str], Optional[Exception]]]:
+    """
+    複数のファイルからテキストを別プロセスで並列に抽出
+    
+    ファイルごとに子プロセスで抽出し、制限時間を超えたプロセスは強制終了します。
+    
+    Args:
+        file_paths: ファイルパスのリスト
+        workers: 同時に実行するプロセス数（省略時は環境変数の設定、0の場合はこのプロセスで順番に抽出）
+        timeout: 1ファイルあたりの制限時間（秒）
+        memory_mb: 1プロセスあたりのメモリ上限（MB）
+        max_chars: 1ファイルから抽出する最大文字数（ファイルごとのリストも可、省略時は get_extraction_max_chars()）
+    
+    Returns:
+        list: 入力と同じ順序の (テキスト, 例外) のリスト（成功時は例外がNone）
+    """
+    settings = get_extraction_settings()
+    workers = settings["workers"] if workers is None else workers
+    timeout = settings["timeout"] if timeout is None else timeout
+    memory_mb = settings["memory_mb"] if memory_mb is None else memory_mb
+    limits = _per_file_limits(max_chars, len(file_paths))
+    
+    def run(file_path, limit) -> Tuple[Optional[str], Optional[Exception]]:
+        try:
+            # テキストファイルは解析が不要なため、このプロセスで読み込む
+            if workers == 0 or Path(file_path).suffix.lower() == '.txt':
+                return extract_text_from_file(Path(file_path), limit) or "", None
+            return _extract_in_subprocess(file_path, timeout, memory_mb, limit), None
+        except Exception as e:
+            return None, e
+    
+    if workers <= 1 or len(file_paths) <= 1:
+        return [run(file_path, limit) for file_path, limit in zip(file_paths, limits)]
+    
+    with ThreadPoolExecutor(max_workers=min(workers, len(file_paths)),
+                            thread_name_prefix="extraction") as executor:
+        return list(executor.map(run, file_paths, limits))
 
+def _per_file_limits(max_chars: Union[int, List[int], None], count: int) -> List[int]:
+    """最大文字数の指定をファイルごとのリストにする"""
+    if max_chars is None:
+        max_chars = get_extraction_max_chars()
+    if isinstance(max_chars, int):
+        return [max_chars] * count
+    return list(max_chars)
 
+def extract_texts_for_file_records(files: List[Dict[str, Any]],
+                                   max_chars: Union[int, List[int], None] = None) -> List[Tuple[Optional[str], Optional[Exception]]]:
+    """
+    ファイル情報のレコードからテキストを抽出（複数の提出資料をまとめて渡してもよい）
+    
+    保存済みのテキストがあるファイルは解析を省略し、残りを別プロセスで並列に抽出します。
+    内容のハッシュはファイル情報に記録済みのものを使い、記録がない場合だけファイルを読んで計算します。
+    ファイル情報には内容のハッシュとパーサーのバージョンを記録します。
+    
+    Args:
+        files: ファイル情報のリスト（id, file_path など）
+        max_chars: 1ファイルから抽出する最大文字数（ファイルごとのリストも可、省略時は get_extraction_max_chars()）
+    
+    Returns:
+        list: 入力と同じ順序の (テキスト, 例外) のリスト（成功時は例外がNone）
+    """
+    from utils.data_manager import update_file, transaction
+    
+    limits = _per_file_limits(max_chars, len(files))
+    
+    results: List[Tuple[Optional[str], Optional[Exception]]] = [(None, None)] * len(files)
+    hashes: Dict[int, str] = {}
+    to_extract = []
+    
+    for index, file_info in enumerate(files):
+        file_path = Path(file_info['file_path'])
+        try:
+            # 記録済みのハッシュがあれば使い、ないファイル（登録直後・旧形式）だけ読み込んで計算する
+            hashes[index] = file_info.get('content_sha256') or file_sha256(file_path)
+            text = _read_text_cache(hashes[index], file_path.suffix.lower(), limits[index])
+        except Exception as e:
+            results[index] = (None, e)
+            continue
+        if text is None:
+            to_extract.append(index)
+        else:
+            results[index] = (text, None)
+    
+    if to_extract:
+        extracted = extract_texts_parallel([Path(files[index]['file_path']) for index in to_extract],
+                                           max_chars=[limits[index] for index in to_extract])
+        for index, (text, error) in zip(to_extract, extracted):
+            if error is None:
+                _write_text_cache(hashes[index], Path(files[index]['file_path']).suffix.lower(),
+                                  limits[index], text)
+            results[index] = (text, error)
+    
+    # 内容のハッシュとパーサーのバージョンをまとめて記録
+    with transaction():
+        for index, file_info in enumerate(files):
+            if (index in hashes and file_info.get('id') is not None
+                    and results[index][1] is None
+                    and (file_info.get('content_sha256') != hashes[index]
+                         or file_info.get('text_parser_version') != PARSER_VERSION)):
+                update_file(file_info['id'], content_sha256=hashes[index],
+                            text_parser_version=PARSER_VERSION)
+    
+    return results
 
+def extract_submission_text(files: List[Dict[str, Any]],
+                            on_error: Optional[Callable[[Dict[str, Any], Exception], None]] = None) -> str:
+    """
+    提出資料のファイルからテキストを抽出して結合
+    
+    結合したテキストが提出資料1件あたりの最大文字数（get_extraction_max_chars()）に収まるよう、
+    残りの文字数をファイルの順に引き継いで抽出し、使い切った時点で残りのファイルは読み込みません。
+    並列抽出のプロセス数（EXTRACTION_WORKERS）ずつまとめて抽出し、まとまりの各ファイルには
+    その時点の残りの文字数を上限として渡します。同じまとまりの中で先のファイルが残りを
+    使い切った場合は、後のファイルの抽出結果は使わずに捨てます。
+    
+    Args:
+        files: ファイル情報のリスト（file_name, file_path）
+        on_error: 抽出に失敗したファイルごとに (ファイル情報, 例外) で呼ばれる
+    
+    Returns:
+        str: 「=== ファイル名 ===」の見出しつきで結合したテキスト
+    """
+    max_chars = get_extraction_max_chars()
+    files = [f for f in files if Path(f['file_path']).exists()]
+    if not max_chars:
+        batch_size = len(files) or 1
+    else:
+        batch_size = max(1, get_extraction_settings()["workers"])
+    
+    parts = []
+    remaining = max_chars
+    for start in range(0, len(files), batch_size):
+        batch = []
+        for file_info in files[start:start + batch_size]:
+            header = f"\n\n=== {file_info['file_name']} ===\n\n"
+            # 見出しを除いた残りの文字数を、このファイルから抽出する上限にする
+            limit = remaining - len(header) if max_chars else 0
+            if max_chars and limit <= 0:
+                continue
+            batch.append((file_info, header, limit))
+        if not batch:
+            continue
+        texts = extract_texts_for_file_records([file_info for file_info, _, _ in batch],
+                                               [limit for _, _, limit in batch])
+        for (file_info, header, _), (text, error) in zip(batch, texts):
+            if error is not None:
+                # テキスト抽出に失敗しても続行
+                if on_error:
+                    on_error(file_info, error)
+                continue
+            if max_chars:
+                if remaining - len(header) <= 0:
+                    continue
+                text = text[:remaining - len(header)]
+            part = header + text
+            parts.append(part)
+            remaining -= len(part)
+    return "".join(parts)
 
 
-
+if __name__ == "__main__":
+    # 並列抽出の子プロセス：抽出したテキストを標準出力に書き出す
+    parser = argparse.ArgumentParser(description="ファイルからテキストを抽出")
+    parser.add_argument("file_path", help="抽出するファイル")
+    parser.add_argument("--memory-mb", type=int, default=0, help="メモリ上限（MB、0の場合は制限しない）")
+    parser.add_argument("--max-chars", type=int, default=0, help="抽出する最大文字数（0の場合は制限しない）")
+    args = parser.parse_args()
+    
+    _set_memory_limit(args.memory_mb)
+    try:
+        text = extract_text_from_file(Path(args.file_path), args.max_chars) or ""
+    except MemoryError:
+        sys.stderr.write(f"テキスト抽出がメモリ上限（{args.memory_mb}MB）を超えました\n")
+        sys.exit(1)
+    except Exception as e:
+        sys.stderr.write(f"{e}\n")
+        sys.exit(1)
+    sys.stdout.buffer.write(text.encode('utf-8'))
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+一括採点キュー
+採点ジョブをデータストアに保存し、バックグラウンドのワーカーが優先度順に採点します。
+アプリを再起動しても、実行中だったジョブはキューに戻して再開します。
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Iterable, Callable
+
+from utils.data_manager import (
+    DATA_DIR, create_scoring_job, get_scoring_job, get_all_scoring_jobs,
+    get_scoring_jobs_by_submission, update_scoring_job, delete_scoring_job,
+    get_all_submissions, get_all_evaluation_results, transaction
+)
+from utils.rescoring import rescore_submission
+from utils.ai_scoring import get_client, get_scoring_mode, AIClient
+
+# ジョブの状態
+JOB_STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# キューが空のときに次のジョブを確認する間隔（秒、環境変数 SCORING_WORKER_POLL_INTERVAL で変更可能）
+WORKER_POLL_INTERVAL = float(os.getenv("SCORING_WORKER_POLL_INTERVAL", "5"))
+
+# ワーカーを1プロセスだけで動かすためのロックファイル
+WORKER_LOCK_FILE = DATA_DIR / "scoring_worker.lock"
+
+# 同じプロセス内の複数スレッドが同じジョブを取らないようにする
+_claim_lock = threading.Lock()
+
+
+# ==================== キュー操作 ====================
+
+def enqueue_submission(submission_id: int, priority: int = 0, use_cache: bool = True,
+                       scoring_mode: Optional[str] = None) -> int:
+    """
+    提出資料の採点ジョブをキューに追加
+
+    同じ提出資料のジョブが待機中・実行中の場合は、新しいジョブを作らずにそのIDを返します
+    （待機中の場合は優先度を高い方に更新し、use_cache=False の指定を引き継ぎます）。
+    実行中のジョブが応答キャッシュを使っている場合に use_cache=False を指定したときは、
+    キャッシュを使わずに採点し直すジョブを追加します。
+    採点モードはジョブに記録し、ワーカーはジョブごとのモードで採点します
+    （待機中のジョブは新しく指定したモードに更新します）。
+
+    Args:
+        submission_id: 提出資料ID
+        priority: 優先度（大きいほど先に採点）
+        use_cache: Falseの場合は応答キャッシュを使わずに採点し直す
+        scoring_mode: 採点モード（省略時はこのセッションで選んだモード、または環境変数 SCORING_MODE）
+
+    Returns:
+        int: ジョブID
+    """
+    scoring_mode = get_scoring_mode(scoring_mode)
+    jobs = get_scoring_jobs_by_submission(submission_id)
+    for job in jobs:
+        if job['status'] == "queued":
+            updates = {}
+            if priority > job.get('priority', 0):
+                updates['priority'] = priority
+            if not use_cache and job.get('use_cache', True):
+                updates['use_cache'] = False
+            if job.get('scoring_mode') != scoring_mode:
+                updates['scoring_mode'] = scoring_mode
+            if updates:
+                update_scoring_job(job['id'], **updates)
+            return job['id']
+    for job in jobs:
+        if job['status'] == "running" and (use_cache or not job.get('use_cache', True)):
+            return job['id']
+    return create_scoring_job(submission_id, priority=priority, use_cache=use_cache,
+                              scoring_mode=scoring_mode)
+
+def enqueue_submissions(submission_ids: Iterable[int], priority: int = 0,
+                        use_cache: bool = True, scoring_mode: Optional[str] = None) -> List[int]:
+    """複数の提出資料の採点ジョブをまとめてキューに追加"""
+    scoring_mode = get_scoring_mode(scoring_mode)
+    with transaction():
+        return [enqueue_submission(submission_id, priority, use_cache, scoring_mode)
+                for submission_id in submission_ids]
+
+def get_unscored_submission_ids() -> List[int]:
+    """採点が完了していない提出資料のIDを取得"""
+    scored = {
+        r['submission_id'] for r in get_all_evaluation_results()
+        if r.get('evaluation_status') == 'completed'
+    }
+    return [s['id'] for s in get_all_submissions() if s['id'] not in scored]
+
+def list_jobs(statuses: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """ジョブを取得（待機中は実行順、それ以外は新しい順）"""
+    jobs = get_all_scoring_jobs()
+    if statuses is not None:
+        statuses = set(statuses)
+        jobs = [job for job in jobs if job['status'] in statuses]
+    submissions = {s['id']: s for s in get_all_submissions()}
+    for job in jobs:
+        submission = submissions.get(job['submission_id'], {})
+        job['school_name'] = submission.get('school_name', '不明')
+        job['theme_title'] = submission.get('theme_title', '')
+    status_order = {status: index for index, status in enumerate(JOB_STATUSES)}
+    jobs.sort(key=lambda job: (status_order.get(job['status'], len(JOB_STATUSES)),
+                               -job.get('priority', 0) if job['status'] == "queued" else 0,
+                               job['id'] if job['status'] == "queued" else -job['id']))
+    return jobs
+
+def get_queue_summary() -> Dict[str, int]:
+    """状態ごとのジョブ数を取得"""
+    summary = {status: 0 for status in JOB_STATUSES}
+    for job in get_all_scoring_jobs():
+        summary[job['status']] = summary.get(job['status'], 0) + 1
+    return summary
+
+def cancel_job(job_id: int) -> bool:
+    """待機中のジョブを取り消す（実行中のジョブは取り消せない）"""
+    job = get_scoring_job(job_id)
+    if not job or job['status'] != "queued":
+        return False
+    return update_scoring_job(job_id, status="cancelled", finished_at=datetime.now().isoformat())
+
+def retry_failed_jobs() -> int:
+    """失敗したジョブをキューに戻す"""
+    failed = [job for job in get_all_scoring_jobs() if job['status'] == "failed"]
+    with transaction():
+        for job in failed:
+            update_scoring_job(job['id'], status="queued", error=None, finished_at=None)
+    return len(failed)
+
+def clear_finished_jobs() -> int:
+    """完了・失敗・取消済みのジョブを削除"""
+    finished = [job for job in get_all_scoring_jobs() if job['status'] in FINISHED_STATUSES]
+    with transaction():
+        for job in finished:
+            delete_scoring_job(job['id'])
+    return len(finished)
+
+
+# ==================== ワーカー ====================
+
+def recover_interrupted_jobs() -> int:
+    """実行中のまま残っているジョブ（アプリの再起動などで中断）をキューに戻す"""
+    interrupted = [job for job in get_all_scoring_jobs() if job['status'] == "running"]
+    with transaction():
+        for job in interrupted:
+            update_scoring_job(job['id'], status="queued", completed_criteria=0)
+    return len(interrupted)
+
+def claim_next_job() -> Optional[Dict[str, Any]]:
+    """優先度が最も高い（同じ場合は古い）待機中のジョブを実行中にして返す"""
+    with _claim_lock:
+        queued = [job for job in get_all_scoring_jobs() if job['status'] == "queued"]
+        if not queued:
+            return None
+        job = min(queued, key=lambda j: (-j.get('priority', 0), j['id']))
+        update_scoring_job(job['id'], status="running", attempts=job.get('attempts', 0) + 1,
+                           completed_criteria=0, error=None, started_at=datetime.now().isoformat())
+        return get_scoring_job(job['id'])
+
+def run_job(job: Dict[str, Any], client: Optional[AIClient] = None) -> Dict[str, Any]:
+    """ジョブを1件実行し、結果を記録（client は採点に使うクライアント）"""
+    job_id = job['id']
+
+    def record_progress(result, completed, total):
+        update_scoring_job(job_id, completed_criteria=completed, total_criteria=total)
+
+    try:
+        # モードを記録していないジョブ（以前のバージョンで追加）は環境変数の既定のモードで採点する
+        result = rescore_submission(job['submission_id'], use_cache=job.get('use_cache', True),
+                                    on_criterion_done=record_progress, client=client,
+                                    mode=job.get('scoring_mode') or get_scoring_mode(None))
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+
+    if result.get("success"):
+        update_scoring_job(job_id, status="completed", result_id=result.get("result_id"),
+                           total_score=result.get("total_score"),
+                           finished_at=datetime.now().isoformat())
+    else:
+        update_scoring_job(job_id, status="failed", error=result.get("error", "不明なエラー"),
+                           finished_at=datetime.now().isoformat())
+    return result
+
+def run_pending_jobs(max_jobs: Optional[int] = None,
+                     on_job_done: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None,
+                     client: Optional[AIClient] = None) -> int:
+    """待機中のジョブがなくなるまで（または max_jobs 件まで）順に実行し、実行件数を返す"""
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            break
+        result = run_job(job, client)
+        if on_job_done:
+            on_job_done(job, result)
+        processed += 1
+    return processed
+
+
+class _WorkerLock:
+    """ワーカーを1プロセスだけで動かすためのファイルロック（取得できない環境では常に成功）"""
+
+    def __init__(self, lock_path: Path):
+        self.lock_path = Path(lock_path)
+        self._file = None
+
+    def acquire(self) -> bool:
+        try:
+            import fcntl
+        except ImportError:
+            return True
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ScoringWorker(threading.Thread):
+    """キューのジョブを順に採点するバックグラウンドスレッド"""
+
+    def __init__(self, poll_interval: float = WORKER_POLL_INTERVAL, stop_when_empty: bool = False,
+                 client: Optional[AIClient] = None):
+        super().__init__(name="scoring-worker", daemon=True)
+        # ワーカースレッドからはセッション状態を参照できないため、起動時のクライアントを保持する
+        self.client = get_client(client)
+        self.poll_interval = poll_interval
+        self.stop_when_empty = stop_when_empty
+        self.current_job_id: Optional[int] = None
+        self.lock_acquired = False
+        self._stop_event = threading.Event()
+        self._lock = _WorkerLock(WORKER_LOCK_FILE)
+
+    def stop(self):
+        """現在のジョブが終わった時点で停止する"""
+        self._stop_event.set()
+
+    def run(self):
+        # 他のプロセスのワーカーが動いている間は待機し、停止したら引き継ぐ
+        while not self._lock.acquire():
+            if self.stop_when_empty or self._stop_event.wait(self.poll_interval):
+                return
+
+        self.lock_acquired = True
+        try:
+            recover_interrupted_jobs()
+            while not self._stop_event.is_set():
+                job = claim_next_job()
+                if job is None:
+                    if self.stop_when_empty:
+                        break
+                    self._stop_event.wait(self.poll_interval)
+                    continue
+                self.current_job_id = job['id']
+                try:
+                    run_job(job, self.client)
+                finally:
+                    self.current_job_id = None
+        finally:
+            self._lock.release()
+
+
+def drain_queue(concurrency: int = 1,
+                on_job_done: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None,
+                client: Optional[AIClient] = None) -> int:
+    """
+    待機中のジョブがなくなるまで、このプロセスで採点する（CLI用）
+
+    Args:
+        concurrency: 同時に採点する提出資料の数
+        on_job_done: ジョブが終わるたびに (ジョブ, 採点結果) で呼ばれる
+        client: 採点に使うクライアント（省略時は環境変数のAPIキー）
+
+    Returns:
+        int: 実行したジョブ数
+    """
+    lock = _WorkerLock(WORKER_LOCK_FILE)
+    if not lock.acquire():
+        raise RuntimeError("別のプロセスのワーカーが採点キューを処理中です")
+    try:
+        recover_interrupted_jobs()
+        client = get_client(client)
+        if concurrency <= 1:
+            return run_pending_jobs(on_job_done=on_job_done, client=client)
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-scoring") as executor:
+            futures = [executor.submit(run_pending_jobs, None, on_job_done, client) for _ in range(concurrency)]
+            return sum(future.result() for future in futures)
+    finally:
+        lock.release()
+
+
+_worker: Optional[ScoringWorker] = None
+_worker_lock = threading.Lock()
+
+def start_worker(client: Optional[AIClient] = None) -> ScoringWorker:
+    """バックグラウンドワーカーを起動（起動済みの場合はそのまま返す）
+
+    ワーカーは起動したセッションのAPIキー（client 省略時）で、キューのすべてのジョブを採点します。
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = ScoringWorker(client=get_client(client))
+            _worker.start()
+        return _worker
+
+def stop_worker():
+    """バックグラウンドワーカーを停止（実行中のジョブが終わってから止まる）"""
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop()
+
+def is_worker_running() -> bool:
+    """このプロセスでワーカーが動いているか"""
+    return _worker is not None and _worker.is_alive()
+
+def get_worker_status() -> Dict[str, Any]:
+    """ワーカーの状態を取得（UIでの表示用）"""
+    return {
+        "running": is_worker_running(),
+        "active": is_worker_running() and _worker.lock_acquired,
+        "current_job_id": _worker.current_job_id if is_worker_running() else None,
+    }
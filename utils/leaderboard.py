@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ランキング（採点完了結果の順位・賞）
+採点結果の書き込みをデータストアの変更通知で受け取り、順位表を差分で更新します。
+画面の再描画のたびに全件を読み込んで並べ替える必要がなく、表示する件数分だけで描画できます。
+
+他のプロセス（ワーカー・CLI）による書き込みは、テーブルの版の変化で検知して読み込み直します。
+"""
+
+import bisect
+import threading
+from typing import Optional, List, Dict, Any, Set, Tuple
+
+from utils.data_manager import get_store
+from utils.award_manager import awards_for_rank, ranking_key
+
+# ランキングが参照するテーブル
+LEADERBOARD_TABLES = ("schools", "submissions", "evaluation_results")
+
+# 賞の判定に使う上位の件数（最優秀賞・優秀賞）
+AWARDED_RANKS = 3
+
+
+class Leaderboard:
+    """採点完了結果の順位表（総合スコアの高い順、同点は採点結果IDの小さい順）"""
+
+    def __init__(self, store=None):
+        self._store = store or get_store()
+        self._lock = threading.RLock()
+        self._versions: Optional[Dict[str, Any]] = None
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._keys: List[Tuple[int, int]] = []  # ranking_key（-総合スコア, 採点結果ID）の昇順
+        self._special: Set[int] = set()
+        self._by_school: Dict[Any, Set[int]] = {}
+        self._latest: Dict[Any, int] = {}
+        self._score_sum = 0
+        self._submissions: Dict[int, Dict[str, Any]] = {}
+        self._school_names: Dict[int, str] = {}
+        self._store.add_change_listener(self._on_change)
+
+    # ---- 読み込み ----
+
+    def _ensure_fresh(self):
+        """他のプロセスの書き込みなどで版が変わっていれば全件から作り直す"""
+        current = {name: self._store.version(name) for name in LEADERBOARD_TABLES}
+        if current != self._versions:
+            self._rebuild(current)
+
+    def _rebuild(self, versions: Dict[str, Any]):
+        self._school_names = {s['id']: s['name'] for s in self._store.all("schools")}
+        self._submissions = {s['id']: s for s in self._store.all("submissions")}
+        self._entries = {}
+        self._keys = []
+        self._special = set()
+        self._by_school = {}
+        self._latest = {}
+        self._score_sum = 0
+        for row in self._store.all("evaluation_results"):
+            self._add(row, keep_sorted=False)
+        self._keys.sort()
+        self._versions = versions
+
+    def _make_entry(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """採点結果に参加校名・テーマを付ける（get_all_evaluation_results と同じ形式）"""
+        entry = dict(row)
+        submission = self._submissions.get(row.get('submission_id'))
+        if submission:
+            entry['school_id'] = submission.get('school_id')
+            entry['theme_title'] = submission.get('theme_title')
+            entry['school_name'] = self._school_names.get(submission.get('school_id'), '不明')
+        return entry
+
+    def _add(self, row: Dict[str, Any], keep_sorted: bool = True):
+        if row.get('evaluation_status') != "completed" or row.get('id') is None:
+            return
+        entry = self._make_entry(row)
+        result_id = entry['id']
+        self._entries[result_id] = entry
+        key = ranking_key(entry)
+        if keep_sorted:
+            bisect.insort(self._keys, key)
+        else:
+            self._keys.append(key)
+        self._score_sum += entry.get('total_score') or 0
+        if entry.get('special_judge_award'):
+            self._special.add(result_id)
+        school_id = entry.get('school_id')
+        if school_id is not None:
+            self._by_school.setdefault(school_id, set()).add(result_id)
+            self._update_latest(school_id)
+
+    def _remove(self, result_id: int):
+        entry = self._entries.pop(result_id, None)
+        if entry is None:
+            return
+        key = ranking_key(entry)
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+        self._score_sum -= entry.get('total_score') or 0
+        self._special.discard(result_id)
+        school_id = entry.get('school_id')
+        if school_id is not None and school_id in self._by_school:
+            self._by_school[school_id].discard(result_id)
+            if not self._by_school[school_id]:
+                del self._by_school[school_id]
+            self._update_latest(school_id)
+
+    def _update_latest(self, school_id: Any):
+        """参加校の最新の採点結果（evaluated_at が最も新しいもの、同じ場合はIDが小さいもの）を更新"""
+        result_ids = self._by_school.get(school_id)
+        if not result_ids:
+            self._latest.pop(school_id, None)
+            return
+        self._latest[school_id] = max(
+            result_ids,
+            key=lambda rid: (self._entries[rid].get('evaluated_at') or '', -rid)
+        )
+
+    # ---- 変更通知による差分更新 ----
+
+    def _on_change(self, change: Dict[str, Any]):
+        table = change["table"]
+        if table not in LEADERBOARD_TABLES:
+            return
+        with self._lock:
+            if self._versions is None:
+                return
+            if change["version_before"] != self._versions.get(table):
+                # 他のプロセスの書き込みを取りこぼしている場合は次回の読み込みで作り直す
+                self._versions = None
+                return
+            try:
+                if not self._apply_ops(table, change["ops"]):
+                    self._versions = None
+                    return
+            except Exception:
+                self._versions = None
+                return
+            self._versions[table] = change["version_after"]
+
+    def _apply_ops(self, table: str, ops: List[tuple]) -> bool:
+        """操作を反映（差分で反映できない操作の場合はFalse）"""
+        refresh_submissions: Set[int] = set()
+        for op in ops:
+            kind = op[0]
+            if kind == "replace" or (kind == "delete" and op[1] != "id"):
+                return False
+            if table == "schools":
+                if kind == "insert":
+                    row = op[1]
+                    self._school_names[row['id']] = row.get('name')
+                else:
+                    # 参加校名の変更・削除は、該当する結果が多くなり得るため作り直す
+                    return False
+            elif table == "submissions":
+                if kind == "insert":
+                    row = dict(op[1])
+                    self._submissions[row['id']] = row
+                elif kind == "update":
+                    submission = self._store.get("submissions", op[1])
+                    if submission is None:
+                        return False
+                    self._submissions[op[1]] = submission
+                    refresh_submissions.add(op[1])
+                else:
+                    return False
+            else:
+                if kind == "insert":
+                    row_id = op[1].get('id')
+                elif kind == "update":
+                    row_id = op[1]
+                else:
+                    row_id = op[2]
+                self._remove(row_id)
+                row = self._store.get("evaluation_results", row_id)
+                if row is not None:
+                    self._add(row)
+
+        if refresh_submissions:
+            for result_id in [rid for rid, entry in self._entries.items()
+                              if entry.get('submission_id') in refresh_submissions]:
+                row = self._store.get("evaluation_results", result_id)
+                self._remove(result_id)
+                if row is not None:
+                    self._add(row)
+        return True
+
+    # ---- 参照 ----
+
+    def count(self) -> int:
+        """採点完了結果の件数"""
+        with self._lock:
+            self._ensure_fresh()
+            return len(self._keys)
+
+    def average_score(self) -> float:
+        """採点完了結果の平均スコア（結果がなければ0）"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._score_sum / len(self._keys) if self._keys else 0
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        順位表の一部を取得（表示する件数分だけコピーする）
+
+        Returns:
+            list: 採点結果に rank（順位）と awards（賞のリスト）を付けた dict
+        """
+        with self._lock:
+            self._ensure_fresh()
+            end = len(self._keys) if limit is None else min(len(self._keys), offset + limit)
+            rows = []
+            for index in range(max(0, offset), end):
+                result_id = self._keys[index][1]
+                entry = dict(self._entries[result_id])
+                entry['rank'] = index + 1
+                entry['awards'] = awards_for_rank(index + 1, result_id in self._special)
+                rows.append(entry)
+            return rows
+
+    def search(self, text: str = "", award_filter: str = "all", offset: int = 0,
+               limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        順位表を検索して一部を取得
+
+        Args:
+            text: 参加校名・テーマに含まれる文字列（空の場合は絞り込まない）
+            award_filter: "all"（すべて）/ "awarded"（受賞のみ）/ "special"（特別審査員賞のみ）
+            offset: 先頭から読み飛ばす件数
+            limit: 取得する最大件数（省略時はすべて）
+
+        Returns:
+            tuple: (page と同じ形式の行のリスト, 条件に一致した件数)
+        """
+        text = (text or "").strip().lower()
+        if not text and award_filter == "all":
+            return self.page(offset, limit), self.count()
+        with self._lock:
+            self._ensure_fresh()
+            if award_filter == "special":
+                indexes = sorted(self.rank_of(result_id) - 1 for result_id in self._special)
+            elif award_filter == "awarded":
+                indexes = sorted(set(range(min(AWARDED_RANKS, len(self._keys))))
+                                 | {self.rank_of(result_id) - 1 for result_id in self._special})
+            else:
+                indexes = range(len(self._keys))
+            if text:
+                indexes = [
+                    index for index in indexes
+                    if text in (self._entries[self._keys[index][1]].get('school_name') or '').lower()
+                    or text in (self._entries[self._keys[index][1]].get('theme_title') or '').lower()
+                ]
+            indexes = list(indexes)
+            end = len(indexes) if limit is None else min(len(indexes), offset + limit)
+            rows = []
+            for index in indexes[max(0, offset):end]:
+                result_id = self._keys[index][1]
+                entry = dict(self._entries[result_id])
+                entry['rank'] = index + 1
+                entry['awards'] = awards_for_rank(index + 1, result_id in self._special)
+                rows.append(entry)
+            return rows, len(indexes)
+
+    def get_entry(self, result_id: int) -> Optional[Dict[str, Any]]:
+        """採点完了結果を順位・賞つきで取得（採点完了でない場合はNone）"""
+        rank = self.rank_of(result_id)
+        if rank is None:
+            return None
+        with self._lock:
+            entry = dict(self._entries[result_id])
+            entry['rank'] = rank
+            entry['awards'] = awards_for_rank(rank, result_id in self._special)
+            return entry
+
+    def completed_results(self) -> List[Dict[str, Any]]:
+        """すべての採点完了結果（順位順）"""
+        return self.page()
+
+    def rank_of(self, result_id: int) -> Optional[int]:
+        """採点結果の順位（採点完了でない場合はNone）"""
+        with self._lock:
+            self._ensure_fresh()
+            entry = self._entries.get(result_id)
+            if entry is None:
+                return None
+            return bisect.bisect_left(self._keys, ranking_key(entry)) + 1
+
+    def awards(self) -> Dict[int, List[str]]:
+        """賞を獲得した採点結果（determine_awards と同じ形式）"""
+        with self._lock:
+            self._ensure_fresh()
+            winners = {key[1]: index + 1 for index, key in enumerate(self._keys[:AWARDED_RANKS])}
+            for result_id in self._special:
+                if result_id not in winners:
+                    winners[result_id] = self.rank_of(result_id)
+            return {
+                result_id: awards_for_rank(rank, result_id in self._special)
+                for result_id, rank in sorted(winners.items(), key=lambda item: item[1])
+            }
+
+    def get_awards(self, result_id: int) -> List[str]:
+        """採点結果に付与された賞"""
+        rank = self.rank_of(result_id)
+        if rank is None:
+            return []
+        with self._lock:
+            return awards_for_rank(rank, result_id in self._special)
+
+    def latest_by_school(self) -> Dict[Any, Dict[str, Any]]:
+        """参加校ID -> 最新の採点完了結果"""
+        with self._lock:
+            self._ensure_fresh()
+            return {school_id: dict(self._entries[result_id])
+                    for school_id, result_id in self._latest.items()}
+
+
+_leaderboard: Optional[Leaderboard] = None
+_leaderboard_lock = threading.Lock()
+
+
+def get_leaderboard() -> Leaderboard:
+    """プロセス内で共有するランキングを取得"""
+    global _leaderboard
+    with _leaderboard_lock:
+        if _leaderboard is None:
+            _leaderboard = Leaderboard()
+        return _leaderboard
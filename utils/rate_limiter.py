@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APIレート制限ユーティリティ
+プロバイダーごとのリクエスト数・トークン数・1日の上限をSQLiteで管理し、
+同じホスト上のすべてのセッション・ワーカープロセスで1つの枠を共有します。
+
+呼び出し前に送信時刻を予約し、その時刻まで待ってから送信するため、
+上限を超えて429エラーになってから待つ必要がありません。
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Callable, Dict, Any, Iterator
+
+# 予約の保存先（環境変数 RATE_LIMIT_PATH で変更可能）
+DEFAULT_RATE_LIMIT_PATH = Path("data") / "rate_limits.sqlite3"
+
+# プロバイダーごとの既定の上限（0の場合は制限しない）
+# 環境変数 {PROVIDER}_RPM / {PROVIDER}_TPM / {PROVIDER}_RPD で変更可能（例: GEMINI_RPM=5）
+DEFAULT_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 0, "rpd": 0},
+    "gemini": {"rpm": 15, "tpm": 1000000, "rpd": 1500},
+}
+
+# 予約した送信時刻までの待ち時間がこれを超える場合はエラーにする（秒、バックグラウンドの採点用）
+DEFAULT_MAX_WAIT = 600
+
+# 画面から採点する場合の待ち時間の上限（秒、環境変数 RATE_LIMIT_INTERACTIVE_MAX_WAIT で変更可能）
+DEFAULT_INTERACTIVE_MAX_WAIT = 60
+
+# 応答に使われるトークン数の見込み（採点理由は200文字程度）
+EXPECTED_OUTPUT_TOKENS = 500
+
+MINUTE = 60.0
+DAY = 86400.0
+
+
+class RateLimitExceeded(Exception):
+    """待っても上限内に収まらない（1日の上限に達した、待ち時間が長すぎる）"""
+
+
+def estimate_tokens(prompt: str) -> int:
+    """プロンプトのトークン数を見積もる（日本語は1文字1トークン程度のため、文字数で多めに見積もる）"""
+    return len(prompt) + EXPECTED_OUTPUT_TOKENS
+
+
+def get_limits(provider: str) -> Dict[str, int]:
+    """プロバイダーの上限（rpm, tpm, rpd）を取得"""
+    defaults = DEFAULT_LIMITS.get(provider, {"rpm": 0, "tpm": 0, "rpd": 0})
+    return {
+        name: max(0, int(os.getenv(f"{provider.upper()}_{name.upper()}", str(value))))
+        for name, value in defaults.items()
+    }
+
+
+def describe_limits(provider: str) -> str:
+    """プロバイダーの上限を表示用の文字列にする（例: 1分あたり15リクエスト・1,000,000トークン、1日あたり1,500リクエスト）"""
+    limits = get_limits(provider)
+
+    def fmt(value: int, unit: str) -> str:
+        return f"{value:,}{unit}" if value else "無制限"
+
+    return (f"1分あたり{fmt(limits['rpm'], 'リクエスト')}・{fmt(limits['tpm'], 'トークン')}、"
+            f"1日あたり{fmt(limits['rpd'], 'リクエスト')}")
+
+
+def get_interactive_max_wait() -> float:
+    """画面から採点する場合の待ち時間の上限（秒）を取得"""
+    return float(os.getenv("RATE_LIMIT_INTERACTIVE_MAX_WAIT", str(DEFAULT_INTERACTIVE_MAX_WAIT)))
+
+
+class RateLimiter:
+    """送信時刻を予約するレート制限（SQLite、プロセス間で共有）"""
+
+    def __init__(self, db_path: Path, max_wait: float = DEFAULT_MAX_WAIT):
+        self.db_path = Path(db_path)
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reservations ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, provider TEXT NOT NULL, "
+                "at REAL NOT NULL, tokens INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_reservations_provider_at ON reservations (provider, at)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def reserve(self, provider: str, tokens: int = 0, max_wait: Optional[float] = None) -> Dict[str, Any]:
+        """
+        上限内に収まる最も早い送信時刻を予約する（待たずに返る）
+
+        Args:
+            provider: プロバイダー名
+            tokens: 見込みのトークン数
+            max_wait: 待ち時間の上限（秒、省略時は self.max_wait）
+
+        Returns:
+            dict: id（予約ID）, at（送信時刻、UNIX時刻）, wait（待ち時間の秒数）
+
+        Raises:
+            RateLimitExceeded: 待ち時間が max_wait を超える場合
+        """
+        if max_wait is None:
+            max_wait = self.max_wait
+        limits = get_limits(provider)
+        rpm, tpm, rpd = limits["rpm"], limits["tpm"], limits["rpd"]
+        if tpm:
+            # 1回で上限を超える見込みの場合でも、枠が空けば送れるようにする
+            tokens = min(tokens, tpm)
+
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                conn.execute("DELETE FROM reservations WHERE provider = ? AND at <= ?",
+                             (provider, now - DAY))
+                booked = conn.execute(
+                    "SELECT at, tokens FROM reservations WHERE provider = ? ORDER BY at",
+                    (provider,)
+                ).fetchall()
+
+                # 予約は時刻順に積むため、既存の予約より前には入れない
+                at = max(now, booked[-1][0]) if booked else now
+                while True:
+                    candidate = at
+                    if rpm and len(booked) >= rpm:
+                        at = max(at, booked[-rpm][0] + MINUTE)
+                    if rpd and len(booked) >= rpd:
+                        at = max(at, booked[-rpd][0] + DAY)
+                    if tpm:
+                        window = [(t, k) for t, k in booked if t > at - MINUTE]
+                        used = sum(k for _, k in window)
+                        for t, k in window:
+                            if used + tokens <= tpm:
+                                break
+                            # 最も古い予約が1分の枠から外れる時刻まで遅らせる
+                            at = max(at, t + MINUTE)
+                            used -= k
+                    if at == candidate:
+                        break
+
+                wait = at - now
+                if wait > max_wait:
+                    conn.execute("ROLLBACK")
+                    raise RateLimitExceeded(
+                        f"{provider}のレート制限により、次に送信できるのは約{_format_wait(wait)}後です"
+                        f"（上限: {describe_limits(provider)}）"
+                    )
+                cursor = conn.execute(
+                    "INSERT INTO reservations (provider, at, tokens) VALUES (?, ?, ?)",
+                    (provider, at, tokens)
+                )
+                conn.execute("COMMIT")
+            except RateLimitExceeded:
+                raise
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return {"id": cursor.lastrowid, "at": at, "wait": max(0.0, wait)}
+
+    def acquire(self, provider: str, tokens: int = 0, max_wait: Optional[float] = None,
+                on_wait: Optional[Callable[[float], None]] = None,
+                release_while_waiting=None) -> Dict[str, Any]:
+        """
+        送信時刻を予約し、その時刻まで待つ
+
+        Args:
+            provider: プロバイダー名
+            tokens: 見込みのトークン数
+            max_wait: 待ち時間の上限（秒、省略時は self.max_wait）
+            on_wait: 待つ場合に待ち時間（秒）で呼ばれる（進捗の表示用）
+            release_while_waiting: 待っている間だけ解放するロック・セマフォ
+                （同時実行数の枠を、すぐに送信できる他の呼び出しに譲る）
+        """
+        reservation = self.reserve(provider, tokens, max_wait)
+        wait = reservation["wait"]
+        if wait > 0:
+            if on_wait:
+                on_wait(wait)
+            if release_while_waiting is not None:
+                release_while_waiting.release()
+            try:
+                time.sleep(wait)
+            finally:
+                if release_while_waiting is not None:
+                    release_while_waiting.acquire()
+        return reservation
+
+    def settle(self, reservation_id: int, tokens: int):
+        """実際に使われたトークン数で予約を更新する"""
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE reservations SET tokens = ? WHERE id = ?", (tokens, reservation_id))
+
+    def usage(self, provider: str) -> Dict[str, Any]:
+        """直近1分・24時間の利用状況を取得（予約済みの分を含む）"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            minute_requests, minute_tokens = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM reservations "
+                "WHERE provider = ? AND at > ?", (provider, now - MINUTE)
+            ).fetchone()
+            day_requests = conn.execute(
+                "SELECT COUNT(*) FROM reservations WHERE provider = ? AND at > ?",
+                (provider, now - DAY)
+            ).fetchone()[0]
+        return {
+            "minute_requests": minute_requests,
+            "minute_tokens": minute_tokens,
+            "day_requests": day_requests,
+            **get_limits(provider),
+        }
+
+
+def _format_wait(seconds: float) -> str:
+    """待ち時間を表示用の文字列にする"""
+    if seconds < MINUTE:
+        return f"{int(seconds) + 1}秒"
+    return f"{int(seconds // MINUTE)}分"
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """プロセス内で共有するレート制限を取得"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            db_path = Path(os.getenv("RATE_LIMIT_PATH", str(DEFAULT_RATE_LIMIT_PATH)))
+            max_wait = float(os.getenv("RATE_LIMIT_MAX_WAIT", str(DEFAULT_MAX_WAIT)))
+            _limiter = RateLimiter(db_path, max_wait)
+        return _limiter
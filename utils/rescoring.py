@@ -5,27 +5,116 @@
 既存の提出資料を使って再採点を実行します。
 """
 
-from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional
 from utils.data_manager import (
     get_submission, get_files_by_submission, create_evaluation_result,
     create_evaluation_detail, update_evaluation_result, get_all_criteria,
-    get_all_evaluation_results, delete_evaluation_details
+    get_all_evaluation_results, delete_evaluation_details, get_evaluation_result, transaction
 )
-from utils.file_processor import extract_text_from_file
-from utils.ai_scoring import evaluate_criterion, is_api_configured
+from utils.file_processor import extract_submission_text
+from utils.ai_scoring import iter_evaluate_criteria, is_api_configured, get_client, AIClient
+from utils.telemetry import telemetry_context
 
 
-def rescore_submission(submission_id: int) -> dict:
+class ScoringError(Exception):
+    """採点に失敗した評価項目がある（採点結果は保存していない）"""
+
+    def __init__(self, failed: List[Dict[str, Any]]):
+        self.failed = failed
+        names = "、".join(result['criterion_name'] for result in failed)
+        super().__init__(f"{len(failed)}項目の採点に失敗しました（{names}）: {failed[0].get('error')}")
+
+
+def score_and_save(result_id: int, content: str, replace_existing: bool = False,
+                   on_criterion_done: Optional[Callable[[Dict[str, Any], int, int], None]] = None,
+                   use_cache: bool = True, client: Optional[AIClient] = None,
+                   max_wait: Optional[float] = None,
+                   on_rate_limit_wait: Optional[Callable[[float], None]] = None,
+                   mode: Optional[str] = None) -> int:
+    """
+    すべての評価項目を並列に採点し、採点結果を保存する
+    
+    採点は評価項目ごとに並列で実行し、すべて揃ってから詳細の作成と結果の更新を
+    1つのトランザクションで書き込みます。
+    1項目でも採点に失敗した場合は何も書き込まずに ScoringError を送出します
+    （採点済みの結果はそのまま残し、新規の採点結果は "failed" にします）。
+    
+    Args:
+        result_id: 採点結果ID
+        content: 提出資料のテキスト
+        replace_existing: 既存の評価詳細を削除してから保存するか（再採点時）
+        on_criterion_done: 評価項目の採点が終わるたびに (結果, 完了数, 全項目数) で呼ばれる
+        use_cache: Falseの場合は応答キャッシュを使わずに採点し直す
+        client: 採点に使うクライアント（省略時はこのセッションで設定したAPIキー、または環境変数）
+        max_wait: レート制限の送信枠の待ち時間の上限（秒、省略時は RATE_LIMIT_MAX_WAIT）
+        on_rate_limit_wait: レート制限の送信枠を待つ場合に待ち時間（秒）で呼ばれる
+        mode: 採点モード（省略時はこのセッションで選んだモード、または環境変数 SCORING_MODE）
+    
+    Returns:
+        int: 総合スコア
+    
+    Raises:
+        ScoringError: 採点に失敗した評価項目がある場合
+    """
+    criteria = get_all_criteria()
+    evaluation = get_evaluation_result(result_id)
+    scored = {}
+    # API呼び出しのテレメトリに提出資料・採点結果を記録する
+    with telemetry_context(result_id=result_id,
+                           submission_id=evaluation.get('submission_id') if evaluation else None):
+        for completed, result in enumerate(
+                iter_evaluate_criteria(content, [c['id'] for c in criteria], use_cache=use_cache,
+                                       client=client, max_wait=max_wait,
+                                       on_wait=on_rate_limit_wait, mode=mode), 1):
+            scored[result['criterion_id']] = result
+            if on_criterion_done:
+                on_criterion_done(result, completed, len(criteria))
+    
+    failed = [result for result in scored.values() if "error" in result]
+    if failed:
+        if evaluation and evaluation.get('evaluation_status') != "completed":
+            update_evaluation_result(result_id, 0, "failed")
+        raise ScoringError(failed)
+    
+    total_score = 0
+    with transaction():
+        if replace_existing:
+            # 既存の評価詳細を削除
+            delete_evaluation_details(result_id)
+        
+        # 評価項目の表示順で詳細を作成
+        for criterion in criteria:
+            result = scored[criterion['id']]
+            score = result.get('score', 0)
+            create_evaluation_detail(result_id, criterion['id'],
+                                   score, result.get('reason', ''))
+            total_score += score
+        
+        # 採点結果を更新
+        update_evaluation_result(result_id, total_score, "completed")
+    
+    return total_score
+
+
+def rescore_submission(submission_id: int, use_cache: bool = True,
+                       on_criterion_done: Optional[Callable[[Dict[str, Any], int, int], None]] = None,
+                       client: Optional[AIClient] = None,
+                       mode: Optional[str] = None) -> dict:
     """
     提出資料を再採点する（既存の採点結果を上書き）
     
     Args:
         submission_id: 提出資料ID
+        use_cache: Falseの場合は応答キャッシュを使わずに採点し直す（強制再採点）
+        on_criterion_done: 評価項目の採点が終わるたびに (結果, 完了数, 全項目数) で呼ばれる
+        client: 採点に使うクライアント（省略時はこのセッションで設定したAPIキー、または環境変数）
+        mode: 採点モード（省略時はこのセッションで選んだモード、または環境変数 SCORING_MODE）
     
     Returns:
         dict: 採点結果（result_id, total_score, success, error）
     """
-    if not is_api_configured():
+    client = get_client(client)
+    if not is_api_configured(client):
         return {
             "success": False,
             "error": "APIキーが設定されていません"
@@ -48,17 +137,8 @@ def rescore_submission(submission_id: int) -> dict:
         }
     
     try:
-        # ファイルからテキストを抽出
-        all_text = ""
-        for file_info in files:
-            file_path = Path(file_info['file_path'])
-            if file_path.exists():
-                try:
-                    text = extract_text_from_file(file_path)
-                    all_text += f"\n\n=== {file_info['file_name']} ===\n\n{text}"
-                except Exception as e:
-                    # テキスト抽出に失敗しても続行
-                    pass
+        # ファイルからテキストを抽出（同じ内容のファイルは保存済みのテキストを再利用）
+        all_text = extract_submission_text(files)
         
         if not all_text.strip():
             return {
@@ -82,35 +162,25 @@ def rescore_submission(submission_id: int) -> dict:
                 key=lambda x: x.get('evaluated_at', '') or ''
             )
             result_id = latest_result.get('id')
-            
-            # 既存の評価詳細を削除
-            delete_evaluation_details(result_id)
         else:
-            # 既存の結果がない場合は新規作成
-            result_id = create_evaluation_result(submission_id,
-                                                evaluated_by=None,
-                                                ai_model="gpt-4")
+            # 前回失敗した採点結果があれば使い直し、なければ新規作成
+            failed_results = [
+                r for r in all_results
+                if r.get('submission_id') == submission_id
+                and r.get('evaluation_status') == 'failed'
+            ]
+            if failed_results:
+                result_id = max(failed_results, key=lambda x: x.get('id', 0)).get('id')
+            else:
+                result_id = create_evaluation_result(submission_id,
+                                                    evaluated_by=None,
+                                                    ai_model="gpt-4")
         
-        # 各評価項目について採点
-        criteria = get_all_criteria()
-        total_score = 0
-        
-        for criterion in criteria:
-            try:
-                result = evaluate_criterion(all_text, criterion['id'])
-                score = result.get('score', 0)
-                reason = result.get('reason', '')
-                
-                create_evaluation_detail(result_id, criterion['id'],
-                                       score, reason)
-                total_score += score
-            except Exception as e:
-                # エラーが発生した場合は0点を記録
-                create_evaluation_detail(result_id, criterion['id'], 0,
-                                       f"採点エラー: {str(e)}")
-        
-        # 採点結果を更新
-        update_evaluation_result(result_id, total_score, "completed")
+        # 各評価項目について採点（並列実行）して保存
+        total_score = score_and_save(result_id, all_text,
+                                     replace_existing=True,
+                                     on_criterion_done=on_criterion_done,
+                                     use_cache=use_cache, client=client, mode=mode)
         
         return {
             "success": True,
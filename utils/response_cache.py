@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+採点応答キャッシュ
+同じ提出資料・プロンプト・モデルでの採点結果をSQLiteに保存し、再採点時に再利用します。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator
+
+# キャッシュファイルの保存先（環境変数 RESPONSE_CACHE_PATH で変更可能）
+DEFAULT_CACHE_PATH = Path("data") / "response_cache.sqlite3"
+
+# 保持する最大件数（超えた分は最後に使われた日時が古い順に削除）
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def text_sha256(text: str) -> str:
+    """テキストのSHA-256ハッシュを返す"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(content_hash: str, criterion_id: int, prompt_hash: str,
+                   provider: str, model: str, temperature: float) -> str:
+    """キャッシュキーを作成（いずれかが変わると別のキーになる）"""
+    parts = [content_hash, str(criterion_id), prompt_hash, provider, model, repr(float(temperature))]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """採点結果のLRUキャッシュ（SQLite、プロセス間で共有）"""
+
+    def __init__(self, db_path: Path, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, criterion_id INTEGER, result TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO stats (name, value) VALUES ('hits', 0), ('misses', 0)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, conn: sqlite3.Connection, name: str):
+        conn.execute("UPDATE stats SET value = value + 1 WHERE name = ?", (name,))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """キャッシュ済みの採点結果を取得（見つからない場合はNone）"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT result FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._count(conn, "hits")
+            return json.loads(row[0])
+
+    def put(self, key: str, criterion_id: int, result: Dict[str, Any]):
+        """採点結果を保存し、上限を超えた分を古い順に削除"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, criterion_id, result, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, criterion_id, json.dumps(result, ensure_ascii=False), now, now)
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (overflow,)
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット数・ミス数・保存件数を取得"""
+        with self._lock, self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "path": str(self.db_path),
+        }
+
+    def clear(self):
+        """キャッシュとカウンターをすべて削除"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("UPDATE stats SET value = 0")
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """プロセス内で共有する応答キャッシュを取得"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            db_path = Path(os.getenv("RESPONSE_CACHE_PATH", str(DEFAULT_CACHE_PATH)))
+            max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES)))
+            _cache = ResponseCache(db_path, max_entries)
+        return _cache
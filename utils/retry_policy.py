@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API呼び出しのリトライポリシー
+OpenAI・Geminiの両方で共通のリトライ処理を行います。
+
+- エラーの種類は例外の型・ステータスコードから判定します（エラー文の照合は最後の手段）
+- Retry-After ヘッダーやGeminiの retry_delay に従って待ち時間を決めます
+- 指数バックオフ（ジッターつき）で待ち、全体の締め切りを超える場合は待たずに失敗します
+- プロバイダーが停止している間は、サーキットブレーカーで呼び出しをすぐに失敗させます
+"""
+
+import os
+import re
+import time
+import random
+import threading
+from collections import deque
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any, List, Callable, TypeVar
+
+from utils.rate_limiter import RateLimitExceeded
+
+T = TypeVar("T")
+
+# 1回の呼び出しあたりの最大試行回数（環境変数 RETRY_MAX_ATTEMPTS で変更可能）
+DEFAULT_MAX_ATTEMPTS = 4
+# 指数バックオフの初期値と上限（秒）
+DEFAULT_BASE_DELAY = 2.0
+DEFAULT_MAX_DELAY = 30.0
+# 最初の試行からリトライを打ち切るまでの時間（秒、環境変数 RETRY_DEADLINE で変更可能）
+DEFAULT_DEADLINE = 60.0
+
+# 連続でこの回数だけ障害（5xx・タイムアウト・接続エラー）が起きたら呼び出しを止める
+# （環境変数 CIRCUIT_FAILURE_THRESHOLD で変更可能）
+DEFAULT_FAILURE_THRESHOLD = 5
+# 止めてから試しに1回だけ呼び出すまでの時間（秒、環境変数 CIRCUIT_RESET_TIMEOUT で変更可能）
+DEFAULT_RESET_TIMEOUT = 60.0
+
+# エラーの種類
+RATE_LIMITED = "rate_limited"   # 429・クォータ超過（待てば成功する見込み）
+UNAVAILABLE = "unavailable"     # 5xx・タイムアウト・接続エラー（プロバイダー側の障害）
+FATAL = "fatal"                 # 認証エラー・不正なリクエストなど（リトライしても成功しない）
+
+# 記録しておく直近の試行の件数
+RECENT_ATTEMPTS = 200
+
+_RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+_UNAVAILABLE_NAMES = ("Timeout", "Connection", "ServiceUnavailable", "InternalServerError",
+                      "DeadlineExceeded", "BadGateway", "GatewayTimeout")
+
+
+class CircuitOpenError(Exception):
+    """プロバイダーの障害が続いているため、呼び出しを止めている"""
+
+
+# ==================== エラーの判定 ====================
+
+def get_status_code(error: BaseException) -> Optional[int]:
+    """例外からHTTPステータスコードを取得（OpenAIは status_code、google.api_core は code）"""
+    for attr in ("status_code", "code", "http_status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    if isinstance(value, int):
+        return value
+    return None
+
+def _parse_duration(value: str) -> Optional[float]:
+    """'1.5'、'20ms'、'6m0s' のような時間の表記を秒に変換"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(n) * scale[u] for n, u in parts)
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """
+    プロバイダーが指定した待ち時間（秒）を取得
+
+    OpenAIは Retry-After / retry-after-ms ヘッダー、
+    Geminiはエラー詳細の retry_delay（"Please retry in 12.3s" など）で返します。
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return float(retry_after_ms) / 1000.0
+            except ValueError:
+                pass
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            seconds = _parse_duration(retry_after)
+            if seconds is not None:
+                return seconds
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+        for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+            if headers.get(name):
+                seconds = _parse_duration(headers[name])
+                if seconds is not None:
+                    return seconds
+
+    # Gemini（google.api_core）はRetryInfoをエラー詳細に含める
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+
+    message = str(error)
+    match = re.search(r'retry in (\d+(?:\.\d+)?)\s*(ms|s)\b', message, re.IGNORECASE)
+    if match:
+        return float(match.group(1)) / (1000.0 if match.group(2).lower() == "ms" else 1.0)
+    match = re.search(r'retry_delay\s*\{\s*seconds:\s*(\d+)', message)
+    if match:
+        return float(match.group(1))
+    return None
+
+def classify_error(error: BaseException) -> str:
+    """例外をリトライの可否で分類（RATE_LIMITED / UNAVAILABLE / FATAL）"""
+    # 自前のレート制限で待ち時間が長すぎると判断した場合は、リトライしても同じ結果になる
+    if isinstance(error, (CircuitOpenError, RateLimitExceeded)):
+        return FATAL
+
+    status = get_status_code(error)
+    if status is not None:
+        if status == 429:
+            return RATE_LIMITED
+        if status in _RETRYABLE_STATUS:
+            return UNAVAILABLE
+        return FATAL
+
+    name = type(error).__name__
+    if name in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        return RATE_LIMITED
+    if isinstance(error, (TimeoutError, ConnectionError)) or any(n in name for n in _UNAVAILABLE_NAMES):
+        return UNAVAILABLE
+
+    # ステータスコードを持たない例外のみ、エラー文から判定する
+    message = str(error)
+    if "RESOURCE_EXHAUSTED" in message or re.search(r'\b429\b', message):
+        return RATE_LIMITED
+    if "UNAVAILABLE" in message or re.search(r'\b50[0234]\b', message):
+        return UNAVAILABLE
+    return FATAL
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """レート制限（429・クォータ超過）によるエラーか"""
+    return classify_error(error) == RATE_LIMITED
+
+
+# ==================== サーキットブレーカー ====================
+
+class CircuitBreaker:
+    """
+    プロバイダーごとのサーキットブレーカー
+
+    障害が連続したら一定時間呼び出しを止め（open）、その後1回だけ試して（half-open）
+    成功すれば再開、失敗すれば再び止めます。
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """状態（closed / open / half_open）"""
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """呼び出し前に確認し、止めている間は CircuitOpenError を送出"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            remaining = max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)))
+            raise CircuitOpenError(
+                f"{self.provider}のAPIで障害が続いているため、呼び出しを一時停止しています"
+                f"（約{remaining}秒後に再開を試みます）。"
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """障害を記録し、このとき止めた場合はTrueを返す"""
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._probing = False
+                return True
+            return False
+
+    def release_probe(self):
+        """試しの呼び出しが障害以外の理由で終わった場合に、次の呼び出しで再度試せるようにする"""
+        with self._lock:
+            self._probing = False
+
+    def reset(self):
+        self.record_success()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """プロセス内で共有するプロバイダーのサーキットブレーカーを取得"""
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(
+                provider,
+                failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", str(DEFAULT_FAILURE_THRESHOLD))),
+                reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", str(DEFAULT_RESET_TIMEOUT))),
+            )
+        return _breakers[provider]
+
+
+# ==================== 試行の記録 ====================
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, Any]] = {}
+_recent_attempts: deque = deque(maxlen=RECENT_ATTEMPTS)
+_attempt_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+def add_attempt_listener(listener: Callable[[Dict[str, Any]], None]):
+    """試行ごとに呼ばれる関数を登録（引数は record_attempt で記録した内容）"""
+    _attempt_listeners.append(listener)
+
+def record_attempt(provider: str, attempt: int, outcome: str, elapsed: float,
+                   error: Optional[BaseException] = None, kind: Optional[str] = None,
+                   delay: float = 0.0):
+    """
+    1回の試行を記録
+
+    Args:
+        provider: プロバイダー名
+        attempt: 何回目の試行か（1から）
+        outcome: success / retry / failed / rejected（サーキットブレーカーで止めた）
+        elapsed: 試行にかかった時間（秒）
+        error: 失敗した場合の例外
+        kind: エラーの種類
+        delay: 次の試行までの待ち時間（秒）
+    """
+    entry = {
+        "provider": provider,
+        "attempt": attempt,
+        "outcome": outcome,
+        "elapsed": round(elapsed, 3),
+        "kind": kind,
+        "status": get_status_code(error) if error is not None else None,
+        "delay": round(delay, 3),
+        "error": str(error)[:200] if error is not None else None,
+        "at": datetime.now().isoformat(),
+    }
+    with _metrics_lock:
+        stats = _metrics.setdefault(provider, {
+            "attempts": 0, "success": 0, "retry": 0, "failed": 0, "rejected": 0,
+            "rate_limited": 0, "unavailable": 0, "circuit_opened": 0, "wait_seconds": 0.0,
+        })
+        if outcome != "rejected":
+            stats["attempts"] += 1
+        stats[outcome] = stats.get(outcome, 0) + 1
+        if kind in (RATE_LIMITED, UNAVAILABLE):
+            stats[kind] += 1
+        stats["wait_seconds"] += delay
+        _recent_attempts.append(entry)
+    for listener in list(_attempt_listeners):
+        try:
+            listener(entry)
+        except Exception:
+            pass
+
+def _record_circuit_opened(provider: str):
+    with _metrics_lock:
+        if provider in _metrics:
+            _metrics[provider]["circuit_opened"] += 1
+
+def get_retry_metrics() -> Dict[str, Any]:
+    """プロバイダーごとの試行回数と、サーキットブレーカーの状態を取得"""
+    with _metrics_lock:
+        providers = {name: dict(stats) for name, stats in _metrics.items()}
+        recent = list(_recent_attempts)
+    for name in providers:
+        providers[name]["circuit_state"] = get_circuit_breaker(name).state
+    return {"providers": providers, "recent": recent}
+
+def reset_retry_metrics():
+    """記録をクリア"""
+    with _metrics_lock:
+        _metrics.clear()
+        _recent_attempts.clear()
+
+
+# ==================== リトライ ====================
+
+class RetryPolicy:
+    """ジッターつき指数バックオフのリトライポリシー（全体の締め切りつき）"""
+
+    def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS, base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY, deadline: float = DEFAULT_DEADLINE):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=int(os.getenv("RETRY_MAX_ATTEMPTS", str(DEFAULT_MAX_ATTEMPTS))),
+            deadline=float(os.getenv("RETRY_DEADLINE", str(DEFAULT_DEADLINE))),
+        )
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """attempt 回目の失敗後の待ち時間（フルジッター、指定があればそれ以上待つ）"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        if retry_after is not None:
+            # 指定時刻に全員が一斉に再送しないよう、少しだけずらす
+            delay = max(delay, retry_after + random.uniform(0, 1))
+        return delay
+
+    def call(self, provider: str, func: Callable[[], T]) -> T:
+        """
+        func() を実行し、リトライ可能なエラーの場合は待ってから再実行
+
+        Args:
+            provider: プロバイダー名（サーキットブレーカーと記録に使用）
+            func: API呼び出し（引数なし）
+
+        Returns:
+            func() の戻り値
+
+        Raises:
+            CircuitOpenError: プロバイダーの障害が続いて呼び出しを止めている場合
+            Exception: 最後の試行で発生した例外（リトライしない種類のエラーはすぐに送出）
+        """
+        breaker = get_circuit_breaker(provider)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                breaker.before_call()
+            except CircuitOpenError as e:
+                record_attempt(provider, attempt, "rejected", 0.0, e)
+                raise
+
+            attempt_started = time.monotonic()
+            try:
+                result = func()
+            except Exception as e:
+                elapsed = time.monotonic() - attempt_started
+                kind = classify_error(e)
+                if kind == UNAVAILABLE:
+                    if breaker.record_failure():
+                        _record_circuit_opened(provider)
+                else:
+                    breaker.release_probe()
+
+                delay = self.backoff(attempt, get_retry_after(e)) if kind != FATAL else 0.0
+                remaining = self.deadline - (time.monotonic() - started)
+                if (kind == FATAL or attempt >= self.max_attempts or delay > remaining
+                        or breaker.state == "open"):
+                    record_attempt(provider, attempt, "failed", elapsed, e, kind)
+                    raise
+                record_attempt(provider, attempt, "retry", elapsed, e, kind, delay)
+                time.sleep(delay)
+                continue
+
+            breaker.record_success()
+            record_attempt(provider, attempt, "success", time.monotonic() - attempt_started)
+            return result
+
+
+_policy: Optional[RetryPolicy] = None
+
+def get_retry_policy() -> RetryPolicy:
+    """プロセス内で共有するリトライポリシーを取得"""
+    global _policy
+    if _policy is None:
+        _policy = RetryPolicy.from_env()
+    return _policy
+
+def call_with_retry(provider: str, func: Callable[[], T]) -> T:
+    """共通のリトライポリシーで func() を実行"""
+    return get_retry_policy().call(provider, func)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streamlit用のキャッシュ
+Streamlitのスクリプト実行中だけ st.cache_data / st.cache_resource を使い、
+CLI・バックグラウンドのワーカーなどでは通常の関数呼び出し（またはプロセス内の辞書）に切り替えます。
+
+データの読み込み関数は、参照するテーブルの版（storage の version）をキーに含めてキャッシュします。
+テーブルに書き込むと版が変わるため、そのテーブルを参照するキャッシュだけが使われなくなります。
+"""
+
+import sys
+import functools
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# 読み込み関数のキャッシュに保持する最大件数（古いものから削除）
+DATA_CACHE_MAX_ENTRIES = 256
+
+_readers: Dict[str, Callable] = {}
+_data_cache: Optional[Callable] = None
+_resource_factories: Dict[str, Callable] = {}
+_resource_cache: Optional[Callable] = None
+_local_resources: Dict[tuple, Any] = {}
+# 作成中のリソースが別のリソースを取得する（入れ子になる）場合があるため再入可能なロックにする
+_lock = threading.RLock()
+
+
+def is_streamlit_running() -> bool:
+    """Streamlitのスクリプト実行中か（ワーカースレッド・CLIではFalse）"""
+    # CLIなどStreamlitを使わない実行ではstreamlitを読み込まない
+    if "streamlit" not in sys.modules:
+        return False
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return False
+    try:
+        return get_script_run_ctx(suppress_warning=True) is not None
+    except TypeError:
+        return get_script_run_ctx() is not None
+
+
+def _call_reader(key: str, versions: tuple, args: tuple, kwargs: tuple):
+    # versions は引数としてキャッシュキーに含めるためだけに受け取る
+    return _readers[key](*args, **dict(kwargs))
+
+
+def _get_data_cache() -> Callable:
+    global _data_cache
+    with _lock:
+        if _data_cache is None:
+            import streamlit as st
+            _data_cache = st.cache_data(show_spinner=False, max_entries=DATA_CACHE_MAX_ENTRIES)(_call_reader)
+        return _data_cache
+
+
+def cache_by_version(tables: Iterable[str], version: Callable[[str], Any],
+                     bypass: Optional[Callable[[], bool]] = None):
+    """
+    テーブルの版ごとに結果をキャッシュするデコレーター
+
+    Args:
+        tables: 関数が読み込むテーブル名
+        version: テーブル名から版を返す関数
+        bypass: Trueを返す間はキャッシュを使わない（トランザクション中など）
+
+    キャッシュした結果はコピーして返されるため、呼び出し側で書き換えても構いません。
+    元の関数は wrapper.uncached で呼び出せます。
+    """
+    tables = tuple(tables)
+
+    def decorator(func: Callable) -> Callable:
+        key = f"{func.__module__}.{func.__qualname__}"
+        _readers[key] = func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_streamlit_running() or (bypass is not None and bypass()):
+                return func(*args, **kwargs)
+            versions = tuple(version(table) for table in tables)
+            return _get_data_cache()(key, versions, args, tuple(sorted(kwargs.items())))
+
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
+
+
+def _create_resource(key: str, args: tuple):
+    return _resource_factories[key](*args)
+
+
+def _get_resource_cache() -> Callable:
+    global _resource_cache
+    with _lock:
+        if _resource_cache is None:
+            import streamlit as st
+            _resource_cache = st.cache_resource(show_spinner=False)(_create_resource)
+        return _resource_cache
+
+
+def cached_resource(func: Callable) -> Callable:
+    """
+    引数ごとに1つだけ作成して使い回すオブジェクト（APIクライアントなど）のデコレーター
+
+    Streamlitの実行中は st.cache_resource で全セッションと共有し、
+    それ以外ではプロセス内の辞書に保持します。
+    """
+    key = f"{func.__module__}.{func.__qualname__}"
+    _resource_factories[key] = func
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        if is_streamlit_running():
+            return _get_resource_cache()(key, args)
+        with _lock:
+            if (key, args) not in _local_resources:
+                _local_resources[(key, args)] = func(*args)
+            return _local_resources[(key, args)]
+
+    return wrapper
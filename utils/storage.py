@@ -0,0 +1,1065 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+データストアユーティリティ
+data_managerのテーブルを保存するバックエンド（JSONファイル / SQLite）を提供します。
+
+- JSONバックエンド: テーブルをメモリ上に保持し、主キー・外部キーのインデックスで検索します。
+  ファイルの更新（mtime/サイズの変化）を検知すると自動的に読み込み直します。
+- SQLiteバックエンド: WALモードのSQLiteに1行1レコードで保存し、外部キー列にインデックスを張ります。
+
+書き込みは transaction() でまとめられ、コミット時にテーブルごと1回で反映されます。
+IDは insert() の時点で他のスレッド・プロセスと重ならないように採番するため、コミット時に振り直しません。
+JSONバックエンドのコミットはロックファイル（fcntl）で他のプロセスと排他し、ジャーナルに記録してから
+テーブルのファイルを置き換えます。途中で中断した場合は次の読み書きの前にジャーナルから続きを反映するため、
+複数テーブルにまたがるトランザクションも一部だけが反映された状態では残りません。
+fcntl が使えない環境（Windows）ではプロセス間の排他がないため、複数のプロセスから書き込む場合は
+SQLiteバックエンドを使ってください。
+各テーブルの版（version）は書き込みのたびに変わるため、読み込み結果のキャッシュや
+集計結果の差分更新に使えます。
+
+バックエンドは環境変数 DATA_BACKEND（"json" または "sqlite"）で選択します。
+
+JSONバックエンドでは、環境変数 DATA_JSON_FORMAT=compact で採点結果・採点詳細を
+列ごとの配列（カラムナ形式）で保存できます。キー名を行ごとに繰り返さず、整形もしないため、
+ファイルが小さくなり読み込みも速くなります。読み込み時は形式を自動判別するため、いつでも切り替えられます。
+orjson がインストールされていれば読み書きに使用します。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Callable
+
+# テーブル名 -> インデックスを張る列（主キー"id"は常にインデックス化）
+TABLE_INDEXES = {
+    "schools": (),
+    "submissions": ("school_id",),
+    "evaluation_results": ("submission_id",),
+    "evaluation_details": ("evaluation_result_id",),
+    "files": ("submission_id",),
+    "scoring_jobs": ("submission_id",),
+}
+
+# SQLiteデータベースのデフォルトファイル名（DATA_DIR配下）
+DEFAULT_SQLITE_FILENAME = "pitch_contest.sqlite3"
+
+# DATA_JSON_FORMAT=compact のときにカラムナ形式で保存するテーブル（行数が多いもの）
+COMPACT_TABLES = ("evaluation_results", "evaluation_details")
+
+# カラムナ形式の識別子
+COLUMNAR_FORMAT = "columnar-v1"
+
+# 値の種類がこの割合未満の文字列の列は、読み込み時に同じ値の文字列を共有する（日時・モデル名など）
+INTERN_MAX_UNIQUE_RATIO = 0.5
+
+# JSONバックエンドのロックファイル・コミットのジャーナル・ID採番の記録（データディレクトリ内）
+JSON_LOCK_FILENAME = ".store.lock"
+JSON_JOURNAL_FILENAME = ".store_journal.json"
+JSON_ID_COUNTERS_FILENAME = ".store_ids.json"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _file_signature(file_path: Path) -> Optional[Tuple[int, int]]:
+    """ファイルの変更検知用シグネチャ（mtime_ns, サイズ）を取得"""
+    try:
+        stat = file_path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _encode_columnar(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """行のリストをカラムナ形式に変換（行にないキーは absent に行番号を記録）"""
+    columns: List[str] = []
+    seen = set()
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    absent: Dict[str, List[int]] = {}
+    for index, row in enumerate(rows):
+        if len(row) != len(columns):
+            for column in columns:
+                if column not in row:
+                    absent.setdefault(column, []).append(index)
+    document = {
+        "format": COLUMNAR_FORMAT,
+        "columns": columns,
+        "data": [[row.get(column) for row in rows] for column in columns],
+    }
+    if absent:
+        document["absent"] = absent
+    return document
+
+
+def _decode_columnar(document: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """カラムナ形式を行のリストに戻す"""
+    if document.get("format") != COLUMNAR_FORMAT:
+        raise ValueError(f"サポートされていない形式です: {document.get('format')}")
+    columns = document["columns"]
+    data = []
+    for values in document["data"]:
+        strings = [value for value in values if isinstance(value, str)]
+        if strings and len(set(strings)) < len(values) * INTERN_MAX_UNIQUE_RATIO:
+            memo: Dict[str, str] = {}
+            values = [memo.setdefault(value, value) if isinstance(value, str) else value
+                      for value in values]
+        data.append(values)
+    rows = [dict(zip(columns, values)) for values in zip(*data)]
+    for column, indexes in document.get("absent", {}).items():
+        for index in indexes:
+            rows[index].pop(column, None)
+    return rows
+
+
+def _use_orjson(use_orjson: Optional[bool]) -> bool:
+    """orjson を使うか（None の場合はインストールされていれば使う）"""
+    if use_orjson is None:
+        return orjson is not None
+    if use_orjson and orjson is None:
+        raise ImportError("orjson がインストールされていません")
+    return use_orjson
+
+
+def load_table_file(file_path: Path, use_orjson: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """テーブルのJSONファイルを読み込む（通常の形式・カラムナ形式を自動判別）"""
+    # 変換前のファイルの内容はパースした時点で解放する
+    with open(file_path, 'rb') as f:
+        if _use_orjson(use_orjson):
+            document = orjson.loads(f.read())
+        else:
+            document = json.loads(f.read().decode('utf-8'))
+    if isinstance(document, dict):
+        return _decode_columnar(document)
+    return document
+
+
+def dump_table_file(file_path: Path, rows: List[Dict[str, Any]], compact: bool = False,
+                    use_orjson: Optional[bool] = None):
+    """テーブルをJSONファイルに書き込む（compact=True の場合はカラムナ形式・整形なし）"""
+    if compact:
+        document = _encode_columnar(rows)
+        if _use_orjson(use_orjson):
+            with open(file_path, 'wb') as f:
+                f.write(orjson.dumps(document))
+        else:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(document, f, ensure_ascii=False, separators=(',', ':'))
+    else:
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+def _fsync_file(file_path: Path):
+    """ファイルの内容をディスクに書き出す"""
+    with open(file_path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+class IntegrityError(ValueError):
+    """主キーの重複などでコミットできない"""
+
+
+class IndexedTable:
+    """JSONファイル1つ分のテーブル（主キー・外部キーのインデックス付き）"""
+
+    def __init__(self, file_path: Path, index_columns: Iterable[str] = (),
+                 use_orjson: Optional[bool] = None):
+        self.file_path = file_path
+        self.index_columns = tuple(index_columns)
+        self.use_orjson = use_orjson
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._signature = None
+        self._rows: List[Dict[str, Any]] = []
+        self._by_id: Dict[Any, Dict[str, Any]] = {}
+        self._by_column: Dict[str, Dict[Any, List[Dict[str, Any]]]] = {}
+
+    def _build(self, rows: List[Dict[str, Any]]):
+        """行データからインデックスを構築"""
+        self._rows = rows
+        self._by_id = {row.get('id'): row for row in rows}
+        self._by_column = {column: {} for column in self.index_columns}
+        for column, index in self._by_column.items():
+            for row in rows:
+                index.setdefault(row.get(column), []).append(row)
+
+    def _refresh(self):
+        """ファイルが変更されていれば読み込み直す"""
+        signature = _file_signature(self.file_path)
+        if self._loaded and signature == self._signature:
+            return
+        rows = []
+        if signature is not None:
+            rows = load_table_file(self.file_path, self.use_orjson)
+        self._build(rows)
+        self._signature = signature
+        self._loaded = True
+
+    def replace(self, rows: List[Dict[str, Any]]):
+        """保存直後のデータでキャッシュを置き換える（再パース不要にする）"""
+        with self._lock:
+            self._build([dict(row) for row in rows])
+            self._signature = _file_signature(self.file_path)
+            self._loaded = True
+
+    def invalidate(self):
+        """キャッシュを破棄（次回アクセス時に再読み込み）"""
+        with self._lock:
+            self._loaded = False
+
+    # 呼び出し側で辞書を書き換えてもキャッシュが壊れないよう、常にコピーを返す
+
+    def all(self) -> List[Dict[str, Any]]:
+        """すべての行を取得"""
+        with self._lock:
+            self._refresh()
+            return [dict(row) for row in self._rows]
+
+    def get(self, row_id: Any) -> Optional[Dict[str, Any]]:
+        """主キーで1行を取得"""
+        with self._lock:
+            self._refresh()
+            row = self._by_id.get(row_id)
+            return dict(row) if row is not None else None
+
+    def find(self, column: str, value: Any) -> List[Dict[str, Any]]:
+        """列の値で行を検索（インデックスがない列は全件走査）"""
+        with self._lock:
+            self._refresh()
+            if column in self._by_column:
+                rows = self._by_column[column].get(value, [])
+            else:
+                rows = [row for row in self._rows if row.get(column) == value]
+            return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        """行数を取得"""
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    def max_id(self) -> int:
+        """最大のIDを取得（行がなければ0）"""
+        with self._lock:
+            self._refresh()
+            return max((key or 0 for key in self._by_id), default=0)
+
+
+def _apply_ops(rows: List[Dict[str, Any]], ops: List[tuple]) -> List[Dict[str, Any]]:
+    """バッファされた操作を行リストに適用した結果を返す
+
+    追加する行のIDが既存の行と重複する場合は IntegrityError を送出します
+    （IDは insert() の時点で採番済みのため、明示的にIDを指定した場合にのみ起こります）。
+    """
+    rows = [dict(row) for row in rows]
+    existing_ids = {row.get('id') for row in rows}
+    for op in ops:
+        kind = op[0]
+        if kind == "insert":
+            row = dict(op[1])
+            if row.get('id') in existing_ids:
+                raise IntegrityError(f"IDが重複しています: {row.get('id')}")
+            rows.append(row)
+            existing_ids.add(row['id'])
+        elif kind == "update":
+            _, row_id, fields = op
+            for row in rows:
+                if row.get('id') == row_id:
+                    row.update(fields)
+                    break
+        elif kind == "delete":
+            _, column, value = op
+            rows = [row for row in rows if row.get(column) != value]
+            existing_ids = {row.get('id') for row in rows}
+        elif kind == "replace":
+            rows = [dict(row) for row in op[1]]
+            existing_ids = {row.get('id') for row in rows}
+    return rows
+
+
+class Transaction:
+    """書き込みをまとめて1回でコミットするための作業単位
+
+    テーブルごとに操作をバッファし、コミット時にテーブルあたり1回の
+    アトミックな書き込みで反映します。
+    """
+
+    def __init__(self):
+        self.ops: Dict[str, List[tuple]] = {}
+        self._after_commit: List[Callable[[], None]] = []
+
+    def add(self, table: str, op: tuple):
+        self.ops.setdefault(table, []).append(op)
+
+    def pending(self, table: str) -> List[tuple]:
+        return self.ops.get(table, [])
+
+    def after_commit(self, callback: Callable[[], None]):
+        """コミットの後に呼ぶ処理を登録（ロールバックした場合は呼ばない）"""
+        self._after_commit.append(callback)
+
+    def max_pending_id(self, table: str) -> int:
+        """バッファした追加・置き換えの行のうち最大のID"""
+        max_id = 0
+        for op in self.pending(table):
+            if op[0] == "insert":
+                max_id = max(max_id, op[1].get('id') or 0)
+            elif op[0] == "replace":
+                max_id = max([max_id] + [row.get('id') or 0 for row in op[1]])
+        return max_id
+
+
+class BaseStore:
+    """ストアの共通処理（トランザクション・書き込み通知）
+
+    書き込みはすべてトランザクションにバッファされます。transaction() の外で
+    呼ばれた書き込みは、その場で1操作だけのトランザクションとしてコミットされます。
+    トランザクション内の読み込みは、未コミットの書き込みを反映した結果を返します。
+    """
+
+    backend_name = ""
+
+    def __init__(self, table_indexes: Dict[str, Tuple[str, ...]] = None):
+        self.table_indexes = dict(table_indexes if table_indexes is not None else TABLE_INDEXES)
+        self._write_listeners: List[Callable[[str], None]] = []
+        self._change_listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._tx_local = threading.local()
+        self._local_versions: Dict[str, int] = {}
+
+    def add_write_listener(self, listener: Callable[[str], None]):
+        """テーブルへの書き込み後に呼ばれるコールバックを登録"""
+        self._write_listeners.append(listener)
+
+    def add_change_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """コミット後にテーブルごとの変更内容で呼ばれるコールバックを登録
+
+        変更内容は dict（table, ops, version_before, version_after）です。
+        ops は ("insert", 行) / ("update", ID, 列) / ("delete", 列, 値) / ("replace", 行のリスト)
+        のリストです。version_before が手元の版と異なる場合は、
+        他のプロセスの書き込みを取りこぼしているため読み込み直してください。
+        差分更新する集計（ランキングなど）に使います。
+        """
+        self._change_listeners.append(listener)
+
+    def remove_change_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """登録したコールバックを解除"""
+        if listener in self._change_listeners:
+            self._change_listeners.remove(listener)
+
+    def _notify_write(self, table: str):
+        for listener in self._write_listeners:
+            listener(table)
+
+    def version(self, name: str) -> Any:
+        """テーブルの版を取得（書き込みのたびに変わる値。比較にのみ使う）"""
+        self._check_table(name)
+        return self._local_versions.get(name, 0)
+
+    # ---- トランザクション ----
+
+    def _current_tx(self) -> Optional[Transaction]:
+        return getattr(self._tx_local, "tx", None)
+
+    def in_transaction(self) -> bool:
+        """このスレッドでトランザクションが進行中か"""
+        return self._current_tx() is not None
+
+    @contextmanager
+    def transaction(self):
+        """書き込みをまとめる作業単位（ネストした場合は外側に合流）
+
+        例外で抜けた場合はバッファした書き込みをすべて破棄します。
+        コミットの後に tx.after_commit() で登録した処理を呼びます。
+        """
+        current = self._current_tx()
+        if current is not None:
+            yield current
+            return
+        tx = Transaction()
+        self._tx_local.tx = tx
+        try:
+            yield tx
+        finally:
+            self._tx_local.tx = None
+        self._commit(tx)
+        for callback in tx._after_commit:
+            callback()
+
+    def _commit(self, tx: Transaction):
+        tables = [name for name, ops in tx.ops.items() if ops]
+        if not tables:
+            return
+        listeners = list(self._change_listeners)
+        before = {name: self.version(name) for name in tables} if listeners else {}
+        self._apply_batch(tx)
+        for name in tables:
+            self._local_versions[name] = self._local_versions.get(name, 0) + 1
+        for name in tables:
+            if listeners:
+                change = {
+                    "table": name,
+                    "ops": tx.pending(name),
+                    "version_before": before[name],
+                    "version_after": self.version(name),
+                }
+                for listener in listeners:
+                    listener(change)
+            self._notify_write(name)
+
+    def _apply_batch(self, tx: Transaction):
+        """バッファされた操作を保存先に反映（バックエンドごとに実装）"""
+        raise NotImplementedError
+
+    def _allocate_id(self, name: str, minimum: int = 0) -> int:
+        """他のスレッド・プロセスと重ならない新しいIDを採番（バックエンドごとに実装）"""
+        raise NotImplementedError
+
+    # ---- 読み込み（トランザクション中は未コミットの書き込みを反映） ----
+
+    def _overlaid(self, name: str) -> Optional[List[Dict[str, Any]]]:
+        tx = self._current_tx()
+        if tx is None or not tx.pending(name):
+            return None
+        return _apply_ops(self._all(name), tx.pending(name))
+
+    def all(self, name: str) -> List[Dict[str, Any]]:
+        """すべての行を取得"""
+        rows = self._overlaid(name)
+        return rows if rows is not None else self._all(name)
+
+    def get(self, name: str, row_id: Any) -> Optional[Dict[str, Any]]:
+        """主キーで1行を取得"""
+        rows = self._overlaid(name)
+        if rows is None:
+            return self._get(name, row_id)
+        return next((row for row in rows if row.get('id') == row_id), None)
+
+    def find(self, name: str, column: str, value: Any) -> List[Dict[str, Any]]:
+        """列の値で行を検索"""
+        rows = self._overlaid(name)
+        if rows is None:
+            return self._find(name, column, value)
+        return [row for row in rows if row.get(column) == value]
+
+    def count(self, name: str) -> int:
+        """行数を取得"""
+        rows = self._overlaid(name)
+        return len(rows) if rows is not None else self._count(name)
+
+    # ---- 書き込み ----
+
+    def insert(self, name: str, row: Dict[str, Any]) -> int:
+        """行を追加（idがなければ採番）してIDを返す
+
+        IDはこの時点で採番し、他のトランザクション（別スレッド・別プロセスを含む）とは重なりません。
+        transaction() 内で返るIDもそのまま確定し、同じトランザクションの他の行から参照できます。
+        ロールバックした場合、採番したIDは欠番になります。
+        """
+        self._check_table(name)
+        with self.transaction() as tx:
+            if row.get('id') is None:
+                row = {"id": self._allocate_id(name, tx.max_pending_id(name)), **row}
+            tx.add(name, ("insert", dict(row)))
+        return row['id']
+
+    def update(self, name: str, row_id: Any, fields: Dict[str, Any]) -> bool:
+        """主キーで指定した行の列を更新"""
+        self._check_table(name)
+        if self.get(name, row_id) is None:
+            return False
+        with self.transaction() as tx:
+            tx.add(name, ("update", row_id, dict(fields)))
+        return True
+
+    def delete_where(self, name: str, column: str, value: Any) -> int:
+        """列の値が一致する行を削除して削除件数を返す"""
+        self._check_table(name)
+        matched = len(self.find(name, column, value))
+        if matched:
+            with self.transaction() as tx:
+                tx.add(name, ("delete", column, value))
+        return matched
+
+    def replace_all(self, name: str, rows: List[Dict[str, Any]]):
+        """テーブル全体を置き換える"""
+        self._check_table(name)
+        with self.transaction() as tx:
+            tx.add(name, ("replace", [dict(row) for row in rows]))
+
+    def _check_table(self, name: str):
+        if name not in self.table_indexes:
+            raise KeyError(f"未定義のテーブルです: {name}")
+
+
+class JsonStore(BaseStore):
+    """データディレクトリ内のJSONファイルをテーブルとして扱うストア
+
+    コミットとIDの採番は、スレッド間は RLock、プロセス間はロックファイル（fcntl）で排他します。
+    コミットは変更のあったテーブルをすべて一時ファイルに書き出してからジャーナルに記録し、
+    その後で置き換えます。置き換えの途中で中断した場合は、ジャーナルから続きを反映します。
+    """
+
+    backend_name = "json"
+
+    def __init__(self, data_dir: Path, table_indexes: Dict[str, Tuple[str, ...]] = None,
+                 json_format: Optional[str] = None):
+        super().__init__(table_indexes)
+        self.data_dir = data_dir
+        self.json_format = (json_format or os.getenv("DATA_JSON_FORMAT") or "pretty").strip().lower()
+        if self.json_format not in ("pretty", "compact"):
+            raise ValueError(f"サポートされていないJSONの保存形式: {self.json_format}")
+        self._write_lock = threading.RLock()
+        self._lock_depth = 0
+        self._recovered = False
+        self._tables = {
+            name: IndexedTable(data_dir / f"{name}.json", columns)
+            for name, columns in self.table_indexes.items()
+        }
+
+    def table(self, name: str) -> IndexedTable:
+        """テーブル名からテーブルを取得"""
+        return self._tables[name]
+
+    def is_compact(self, name: str) -> bool:
+        """テーブルをカラムナ形式で保存するか"""
+        return self.json_format == "compact" and name in COMPACT_TABLES
+
+    # ---- 排他・ジャーナル ----
+
+    @contextmanager
+    def _locked(self):
+        """書き込みを他のスレッド・プロセスと排他（同じスレッドからは再入可）"""
+        with self._write_lock:
+            if self._lock_depth > 0:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            lock_file = None
+            if fcntl is not None:
+                self.data_dir.mkdir(parents=True, exist_ok=True)
+                lock_file = open(self.data_dir / JSON_LOCK_FILENAME, "a")
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                self._recover()
+                yield
+            finally:
+                self._lock_depth -= 1
+                if lock_file is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def _recover(self):
+        """中断されたコミットがあればジャーナルから続きを反映（ロック中に呼ぶ）"""
+        journal_path = self.data_dir / JSON_JOURNAL_FILENAME
+        if journal_path.exists():
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+            for temp_name, target_name in journal["files"]:
+                temp_file = self.data_dir / temp_name
+                if temp_file.exists():
+                    temp_file.replace(self.data_dir / target_name)
+            journal_path.unlink()
+            for table in self._tables.values():
+                table.invalidate()
+        else:
+            # ジャーナルに記録される前に中断されたコミットの一時ファイル（反映しない）
+            for table in self._tables.values():
+                table.file_path.with_suffix('.json.tmp').unlink(missing_ok=True)
+        self._recovered = True
+
+    def _ensure_recovered(self):
+        """このプロセスで最初に読み込む前に、中断されたコミットを反映"""
+        if not self._recovered and (self.data_dir / JSON_JOURNAL_FILENAME).exists():
+            with self._locked():
+                pass
+        self._recovered = True
+
+    def _allocate_id(self, name: str, minimum: int = 0) -> int:
+        """IDを採番（採番済みの最大IDをファイルに記録し、コミット前の他のプロセスとも重ならないようにする）"""
+        with self._locked():
+            counters_path = self.data_dir / JSON_ID_COUNTERS_FILENAME
+            counters = {}
+            if counters_path.exists():
+                with open(counters_path, 'r', encoding='utf-8') as f:
+                    counters = json.load(f)
+            next_id = max(counters.get(name, 0), self._tables[name].max_id(), minimum) + 1
+            counters[name] = next_id
+            temp_path = counters_path.with_suffix('.json.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(counters, f)
+            temp_path.replace(counters_path)
+            return next_id
+
+    def _apply_batch(self, tx: Transaction):
+        """変更のあったテーブルを一時ファイルに書き出し、ジャーナルに記録してからまとめてリネーム"""
+        with self._locked():
+            staged = []
+            try:
+                for name, ops in tx.ops.items():
+                    if not ops:
+                        continue
+                    table = self._tables[name]
+                    # ロック中に読み込み直すため、他のプロセスがコミットした内容に操作を重ねる
+                    rows = _apply_ops(table.all(), ops)
+                    table.file_path.parent.mkdir(parents=True, exist_ok=True)
+                    temp_file = table.file_path.with_suffix('.json.tmp')
+                    dump_table_file(temp_file, rows, self.is_compact(name))
+                    _fsync_file(temp_file)
+                    staged.append((table, temp_file, rows))
+            except Exception:
+                for _, temp_file, _ in staged:
+                    temp_file.unlink(missing_ok=True)
+                raise
+
+            # ジャーナルを書き込んだ時点でコミット確定（以降に中断しても _recover で反映される）
+            journal_path = self.data_dir / JSON_JOURNAL_FILENAME
+            journal_temp = journal_path.with_suffix('.json.tmp')
+            with open(journal_temp, 'w', encoding='utf-8') as f:
+                json.dump({"files": [[temp_file.name, table.file_path.name]
+                                     for table, temp_file, _ in staged]}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            journal_temp.replace(journal_path)
+
+            for table, temp_file, rows in staged:
+                temp_file.replace(table.file_path)
+                if not table.file_path.exists():
+                    raise IOError(f"ファイルの保存に失敗しました: {table.file_path}")
+                # 書き込んだ内容でキャッシュを更新（次回の読み込みで再パースしない）
+                table.replace(rows)
+            journal_path.unlink()
+
+    def _all(self, name: str) -> List[Dict[str, Any]]:
+        self._ensure_recovered()
+        return self._tables[name].all()
+
+    def _get(self, name: str, row_id: Any) -> Optional[Dict[str, Any]]:
+        self._ensure_recovered()
+        return self._tables[name].get(row_id)
+
+    def _find(self, name: str, column: str, value: Any) -> List[Dict[str, Any]]:
+        self._ensure_recovered()
+        return self._tables[name].find(column, value)
+
+    def _count(self, name: str) -> int:
+        self._ensure_recovered()
+        return self._tables[name].count()
+
+    def _max_id(self, name: str) -> int:
+        self._ensure_recovered()
+        return self._tables[name].max_id()
+
+    def version(self, name: str) -> Any:
+        """テーブルの版（このプロセスでの書き込み回数とファイルの更新日時・サイズ）"""
+        return (super().version(name), _file_signature(self._tables[name].file_path))
+
+    def describe(self, name: str) -> Dict[str, Any]:
+        """保存先の状態（存在有無・サイズ・パス）を取得"""
+        file_path = self._tables[name].file_path
+        exists = file_path.exists()
+        return {
+            "exists": exists,
+            "size": file_path.stat().st_size if exists else 0,
+            "path": str(file_path),
+        }
+
+    def ensure_tables(self):
+        """存在しないテーブルファイルを空で作成"""
+        with self._locked():
+            missing = [name for name, table in self._tables.items()
+                       if not table.file_path.exists()]
+            with self.transaction():
+                for name in missing:
+                    self.replace_all(name, [])
+
+
+class SQLiteStore(BaseStore):
+    """WALモードのSQLiteにテーブルを保存するストア
+
+    各テーブルは (id, インデックス列..., data) の形で保存し、行全体はJSONとして
+    data列に格納します（列の追加があってもスキーマ変更が不要）。
+    """
+
+    backend_name = "sqlite"
+
+    def __init__(self, db_path: Path, table_indexes: Dict[str, Tuple[str, ...]] = None):
+        super().__init__(table_indexes)
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得（初回はスキーマを作成）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self._create_schema(conn)
+                    self._schema_ready = True
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        # テーブルの版（書き込みのたびに加算、他プロセスの書き込みも検知できる）
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS table_versions "
+            "(name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+        )
+        # 採番済みの最大ID（コミット前のトランザクションとIDが重ならないようにする）
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS id_counters "
+            "(name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)"
+        )
+        for name, columns in self.table_indexes.items():
+            column_defs = "".join(f", {column} INTEGER" for column in columns)
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} "
+                f"(id INTEGER PRIMARY KEY{column_defs}, data TEXT NOT NULL)"
+            )
+            for column in columns:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{name}_{column} ON {name} ({column})"
+                )
+
+    def _row_values(self, name: str, row: Dict[str, Any]) -> tuple:
+        columns = self.table_indexes[name]
+        return (
+            (row.get('id'),)
+            + tuple(row.get(column) for column in columns)
+            + (json.dumps(row, ensure_ascii=False),)
+        )
+
+    def _insert_sql(self, name: str, replace: bool = True) -> str:
+        columns = ("id",) + self.table_indexes[name] + ("data",)
+        placeholders = ", ".join("?" for _ in columns)
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        return f"{verb} INTO {name} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    def _is_indexed(self, name: str, column: str) -> bool:
+        return column == "id" or column in self.table_indexes[name]
+
+    def _apply_batch(self, tx: Transaction):
+        """バッファされた操作を1つのSQLトランザクションで反映"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for name, ops in tx.ops.items():
+                if not ops:
+                    continue
+                for op in ops:
+                    self._apply_op(conn, name, op)
+                conn.execute(
+                    "INSERT INTO table_versions (name, version) VALUES (?, 1) "
+                    "ON CONFLICT(name) DO UPDATE SET version = version + 1", (name,)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _allocate_id(self, name: str, minimum: int = 0) -> int:
+        """IDを採番（id_counters を更新するため、他の接続・プロセスと重ならない）"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT MAX(COALESCE((SELECT last_id FROM id_counters WHERE name = ?), 0), "
+                f"(SELECT COALESCE(MAX(id), 0) FROM {name}), ?) + 1", (name, minimum)
+            ).fetchone()
+            next_id = row[0]
+            conn.execute(
+                "INSERT INTO id_counters (name, last_id) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id", (name, next_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return next_id
+
+    def _apply_op(self, conn: sqlite3.Connection, name: str, op: tuple):
+        kind = op[0]
+        if kind == "insert":
+            row = op[1]
+            try:
+                conn.execute(self._insert_sql(name, replace=False), self._row_values(name, row))
+            except sqlite3.IntegrityError as e:
+                raise IntegrityError(f"IDが重複しています: {row.get('id')}") from e
+        elif kind == "update":
+            _, row_id, fields = op
+            found = conn.execute(
+                f"SELECT data FROM {name} WHERE id = ?", (row_id,)
+            ).fetchone()
+            if found is not None:
+                row = json.loads(found[0])
+                row.update(fields)
+                conn.execute(self._insert_sql(name), self._row_values(name, row))
+        elif kind == "delete":
+            _, column, value = op
+            if self._is_indexed(name, column):
+                conn.execute(f"DELETE FROM {name} WHERE {column} IS ?", (value,))
+            else:
+                ids = [row['id'] for row in self._find(name, column, value, conn)]
+                conn.executemany(f"DELETE FROM {name} WHERE id = ?", [(i,) for i in ids])
+        elif kind == "replace":
+            conn.execute(f"DELETE FROM {name}")
+            conn.executemany(
+                self._insert_sql(name),
+                (self._row_values(name, row) for row in op[1])
+            )
+
+    def _all(self, name: str, conn: sqlite3.Connection = None) -> List[Dict[str, Any]]:
+        conn = conn or self._connect()
+        cursor = conn.execute(f"SELECT data FROM {name} ORDER BY id")
+        return [json.loads(data) for (data,) in cursor]
+
+    def _get(self, name: str, row_id: Any) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            f"SELECT data FROM {name} WHERE id = ?", (row_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _find(self, name: str, column: str, value: Any,
+              conn: sqlite3.Connection = None) -> List[Dict[str, Any]]:
+        conn = conn or self._connect()
+        if self._is_indexed(name, column):
+            cursor = conn.execute(
+                f"SELECT data FROM {name} WHERE {column} IS ? ORDER BY id", (value,)
+            )
+            return [json.loads(data) for (data,) in cursor]
+        return [row for row in self._all(name, conn) if row.get(column) == value]
+
+    def _count(self, name: str) -> int:
+        return self._connect().execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+
+    def _max_id(self, name: str) -> int:
+        return self._connect().execute(
+            f"SELECT COALESCE(MAX(id), 0) FROM {name}"
+        ).fetchone()[0]
+
+    def version(self, name: str) -> Any:
+        """テーブルの版（データベースに保存された書き込み回数）"""
+        self._check_table(name)
+        row = self._connect().execute(
+            "SELECT version FROM table_versions WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def describe(self, name: str) -> Dict[str, Any]:
+        """保存先の状態（存在有無・サイズ・パス）を取得"""
+        self._check_table(name)
+        size = self._connect().execute(
+            f"SELECT COALESCE(SUM(LENGTH(CAST(data AS BLOB))), 0) FROM {name}"
+        ).fetchone()[0]
+        return {
+            "exists": True,
+            "size": size,
+            "path": f"{self.db_path}#{name}",
+        }
+
+    def ensure_tables(self):
+        """テーブルとインデックスを作成"""
+        self._connect()
+
+
+def create_store(data_dir: Path, backend: Optional[str] = None):
+    """設定に応じたストアを作成
+
+    Args:
+        data_dir: データディレクトリ
+        backend: "json" または "sqlite"（省略時は環境変数 DATA_BACKEND、既定は"json"）
+    """
+    backend = (backend or os.getenv("DATA_BACKEND") or "json").strip().lower()
+    if backend == "json":
+        return JsonStore(data_dir)
+    if backend == "sqlite":
+        db_path = os.getenv("DATA_SQLITE_PATH") or str(data_dir / DEFAULT_SQLITE_FILENAME)
+        return SQLiteStore(Path(db_path))
+    raise ValueError(f"サポートされていないデータバックエンド: {backend}")
+
+
+def migrate_json_to_sqlite(data_dir: Path, db_path: Optional[Path] = None,
+                           overwrite: bool = False) -> Dict[str, int]:
+    """data/*.json の内容をSQLiteデータベースへ一括移行
+
+    Args:
+        data_dir: JSONファイルのあるデータディレクトリ
+        db_path: 移行先のSQLiteファイル（省略時は DATA_DIR/pitch_contest.sqlite3）
+        overwrite: 移行先にデータがある場合も上書きするか
+
+    Returns:
+        dict: {テーブル名: 移行した行数}
+    """
+    data_dir = Path(data_dir)
+    db_path = Path(db_path) if db_path else data_dir / DEFAULT_SQLITE_FILENAME
+    source = JsonStore(data_dir)
+    target = SQLiteStore(db_path)
+    target.ensure_tables()
+
+    if not overwrite:
+        non_empty = [name for name in TABLE_INDEXES if target.count(name) > 0]
+        if non_empty:
+            raise ValueError(
+                f"移行先のデータベースにデータが存在します: {', '.join(non_empty)}"
+                f"（上書きする場合は overwrite=True を指定してください）"
+            )
+
+    migrated = {}
+    for name in TABLE_INDEXES:
+        rows = source.all(name)
+        target.replace_all(name, rows)
+        migrated[name] = len(rows)
+    return migrated
+
+
+def rewrite_json_tables(store: "JsonStore") -> List[str]:
+    """JSONファイルを現在の保存形式（DATA_JSON_FORMAT）で書き直す"""
+    names = [name for name in COMPACT_TABLES if name in store.table_indexes]
+    with store.transaction():
+        for name in names:
+            store.replace_all(name, store.all(name))
+    return names
+
+
+# ==================== 保存形式のベンチマーク ====================
+
+def _resident_bytes() -> Optional[int]:
+    """現在の常駐メモリ（RSS、バイト。取得できない環境ではNone）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _measure_load(file_path: str, use_orjson: bool) -> Dict[str, Any]:
+    """
+    新しいプロセスでテーブルを読み込み、所要時間・RSSの増加量・読み込み後に保持しているメモリを計測
+    """
+    import gc
+    import time
+    import tracemalloc
+    gc.collect()
+    rss_before = _resident_bytes()
+    started = time.perf_counter()
+    table = IndexedTable(Path(file_path), TABLE_INDEXES["evaluation_details"], use_orjson)
+    count = table.count()
+    seconds = time.perf_counter() - started
+    gc.collect()
+    rss_after = _resident_bytes()
+
+    # 保持しているメモリ（パース中の一時的な確保を除く）は tracemalloc で計測
+    del table
+    gc.collect()
+    tracemalloc.start()
+    table = IndexedTable(Path(file_path), TABLE_INDEXES["evaluation_details"], use_orjson)
+    table.count()
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "rows": count,
+        "load_seconds": seconds,
+        "rss_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        "retained_bytes": retained,
+        "peak_bytes": peak,
+    }
+
+
+def benchmark_json_formats(rows: int = 100000, work_dir: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """
+    採点詳細を通常の形式とカラムナ形式で保存し、ファイルサイズ・読み込み時間・メモリを比較
+
+    読み込みは形式ごとに新しいプロセスで行い、RSSの増加量を計測します。
+
+    Returns:
+        list: 形式ごとの結果（format, file_bytes, write_seconds, load_seconds, rss_bytes,
+              retained_bytes（読み込み後に保持しているメモリ）, peak_bytes（読み込み中の最大））
+    """
+    import random
+    import tempfile
+    import time
+    import multiprocessing
+    from datetime import datetime, timedelta
+
+    rng = random.Random(0)
+    phrases = ["独自の視点で課題を設定しており", "データの扱いが適切で", "分析の根拠が明確で",
+               "実践に向けた提案が具体的で", "発表の構成が分かりやすく", "改善の余地があるものの"]
+    started_at = datetime(2024, 1, 1)
+    details = []
+    for index in range(rows):
+        result_id = index // 6 + 1
+        timestamp = (started_at + timedelta(seconds=result_id * 30)).isoformat()
+        details.append({
+            "evaluation_result_id": result_id,
+            "criterion_id": index % 6 + 1,
+            "score": rng.randint(3, 10),
+            "evaluation_reason": "、".join(rng.sample(phrases, 3)) + f"高く評価できます（{index}）。",
+            "created_at": timestamp,
+            "updated_at": timestamp,
+            "id": index + 1,
+        })
+
+    variants = [("pretty", False, False), ("compact", True, False)]
+    if orjson is not None:
+        variants.append(("compact+orjson", True, True))
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        for label, compact, use_orjson in variants:
+            file_path = Path(temp_dir) / f"evaluation_details.{label}.json"
+            started = time.perf_counter()
+            dump_table_file(file_path, details, compact, use_orjson)
+            write_seconds = time.perf_counter() - started
+            with context.Pool(1) as pool:
+                measured = pool.apply(_measure_load, (str(file_path), use_orjson))
+            results.append({
+                "format": label,
+                "file_bytes": file_path.stat().st_size,
+                "write_seconds": write_seconds,
+                **measured,
+            })
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="data/*.json をSQLiteへ移行します")
+    parser.add_argument("--data-dir", default="data", help="JSONファイルのあるディレクトリ")
+    parser.add_argument("--db", default=None, help="移行先のSQLiteファイル")
+    parser.add_argument("--overwrite", action="store_true", help="既存データを上書きする")
+    args = parser.parse_args()
+
+    counts = migrate_json_to_sqlite(Path(args.data_dir), args.db and Path(args.db),
+                                    overwrite=args.overwrite)
+    for table_name, row_count in counts.items():
+        print(f"{table_name}: {row_count}件")
+    print("移行が完了しました。DATA_BACKEND=sqlite を設定してアプリを起動してください。")
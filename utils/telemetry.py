@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+採点テレメトリ
+AIプロバイダーへの呼び出しごとに、所要時間・トークン数・リトライ回数・モデル・結果を
+SQLiteに記録し、レイテンシのパーセンタイルや推定コストを集計します。
+
+どの提出資料・評価項目の呼び出しかは contextvars で受け渡すため、
+採点処理の関数に引数を追加する必要はありません。
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterator
+
+# 記録の保存先（環境変数 TELEMETRY_PATH で変更可能）
+DEFAULT_TELEMETRY_PATH = Path("data") / "telemetry.sqlite3"
+
+# ダッシュボードで集計する期間（日数、環境変数 TELEMETRY_SUMMARY_DAYS で変更可能、0 は全期間）
+DEFAULT_SUMMARY_DAYS = 30
+
+# モデルごとの料金（米ドル / 100万トークン、入力・出力）。推定コストの計算に使用
+# 実際の請求額はプランや為替によって異なるため、目安として扱ってください
+MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.0-pro": (0.50, 1.50),
+    "gemini-pro": (0.50, 1.50),
+}
+
+# 呼び出し元（提出資料・採点結果・評価項目・採点方法）の情報
+_call_context: contextvars.ContextVar = contextvars.ContextVar("telemetry_call_context", default={})
+
+
+def is_telemetry_enabled() -> bool:
+    """記録が有効か（環境変数 TELEMETRY_ENABLED=0 で無効）"""
+    return os.getenv("TELEMETRY_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+
+
+def get_summary_days() -> int:
+    """ダッシュボードで集計する期間（日数）を取得"""
+    return int(os.getenv("TELEMETRY_SUMMARY_DAYS", str(DEFAULT_SUMMARY_DAYS)))
+
+
+def get_summary_since(days: Optional[int] = None) -> Optional[str]:
+    """集計の開始日時（ISO形式、期間を限定しない場合はNone）"""
+    days = get_summary_days() if days is None else days
+    if days <= 0:
+        return None
+    return (datetime.now() - timedelta(days=days)).isoformat()
+
+
+@contextmanager
+def telemetry_context(**fields):
+    """
+    このブロック内の呼び出しに付ける情報を設定（入れ子にすると上書き・追加される）
+
+    例: with telemetry_context(submission_id=1, result_id=3): ...
+    """
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_context() -> Dict[str, Any]:
+    """現在の呼び出し元の情報を取得"""
+    return dict(_call_context.get())
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """推定コスト（米ドル）を計算（料金が不明なモデルはNone）"""
+    if not model:
+        return None
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        # gemini-1.5-flash-002 のようなバージョンつきの名前は、前方一致で料金を探す
+        matches = [name for name in MODEL_PRICES if model.startswith(name)]
+        if not matches:
+            return None
+        prices = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """パーセンタイル（線形補間）を計算"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class CallRecord:
+    """1回の採点呼び出し（リトライを含む）の記録"""
+
+    def __init__(self, provider: str, model: Optional[str] = None):
+        self.provider = provider
+        self.model = model
+        self.attempts = 0
+        self.latency = None  # 最後の試行でAPIの応答を待った時間（秒）
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._attempt_started = None
+
+    def start_attempt(self):
+        """試行の開始（レート制限の待ち時間を含めないよう、送信直前に呼ぶ）"""
+        self.attempts += 1
+        self._attempt_started = time.monotonic()
+
+    def finish_attempt(self, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None):
+        """試行の終了（成功時はトークン数も記録）"""
+        if self._attempt_started is not None:
+            self.latency = time.monotonic() - self._attempt_started
+            self._attempt_started = None
+        if prompt_tokens is not None:
+            self.prompt_tokens = prompt_tokens
+        if completion_tokens is not None:
+            self.completion_tokens = completion_tokens
+
+
+class TelemetryStore:
+    """呼び出しの記録（SQLite、プロセス間で共有）"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS api_calls ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, called_at TEXT NOT NULL, "
+                "provider TEXT NOT NULL, model TEXT, operation TEXT, criterion_id INTEGER, "
+                "submission_id INTEGER, result_id INTEGER, latency_ms REAL, elapsed_ms REAL, "
+                "prompt_tokens INTEGER, completion_tokens INTEGER, attempts INTEGER, "
+                "outcome TEXT NOT NULL, error TEXT, cost_usd REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_api_calls_called_at ON api_calls (called_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_api_calls_submission ON api_calls (submission_id)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, call: Dict[str, Any]) -> int:
+        """呼び出しを1件記録"""
+        columns = ("called_at", "provider", "model", "operation", "criterion_id", "submission_id",
+                   "result_id", "latency_ms", "elapsed_ms", "prompt_tokens", "completion_tokens",
+                   "attempts", "outcome", "error", "cost_usd")
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO api_calls ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                tuple(call.get(column) for column in columns)
+            )
+            return cursor.lastrowid
+
+    def get_calls(self, since: Optional[str] = None, provider: Optional[str] = None) -> List[Dict[str, Any]]:
+        """記録を取得（since はISO形式の日時）"""
+        query = "SELECT * FROM api_calls WHERE 1 = 1"
+        params = []
+        if since:
+            query += " AND called_at >= ?"
+            params.append(since)
+        if provider:
+            query += " AND provider = ?"
+            params.append(provider)
+        with self._lock, self._connect() as conn:
+            return [dict(row) for row in conn.execute(query + " ORDER BY id", params)]
+
+    def summary(self, since: Optional[str] = None) -> Dict[str, Any]:
+        """
+        全体と評価項目ごとの集計（件数・合計はSQLで集計し、パーセンタイルのみ応答時間の列から計算）
+
+        Args:
+            since: この日時（ISO形式）以降の呼び出しだけを集計（Noneの場合は全期間）
+
+        Returns:
+            dict: calls, errors, retries, p50_ms, p95_ms, prompt_tokens, completion_tokens,
+                  cost_usd, submissions, tokens_per_submission, by_criterion（評価項目ごとの集計）,
+                  by_submission（提出資料IDごとのトークン数・推定コスト）
+        """
+        where, params = "WHERE 1 = 1", []
+        if since:
+            where += " AND called_at >= ?"
+            params.append(since)
+        tokens = "COALESCE(prompt_tokens, 0) + COALESCE(completion_tokens, 0)"
+        criterion_key = ("CASE WHEN operation = 'combined' THEN 'combined' "
+                         "ELSE CAST(criterion_id AS TEXT) END")
+        success = f"{where} AND outcome = 'success'"
+
+        with self._lock, self._connect() as conn:
+            totals = conn.execute(
+                "SELECT COUNT(*) AS calls, "
+                "COALESCE(SUM(outcome != 'success'), 0) AS errors, "
+                "COALESCE(SUM(MAX(COALESCE(attempts, 1) - 1, 0)), 0) AS retries, "
+                "COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens, "
+                "COALESCE(SUM(completion_tokens), 0) AS completion_tokens, "
+                "COALESCE(SUM(cost_usd), 0.0) AS cost_usd "
+                f"FROM api_calls {where}", params
+            ).fetchone()
+            by_submission = {
+                row["submission_id"]: {"calls": row["calls"], "tokens": row["tokens"], "cost_usd": row["cost_usd"]}
+                for row in conn.execute(
+                    f"SELECT submission_id, COUNT(*) AS calls, SUM({tokens}) AS tokens, "
+                    "COALESCE(SUM(cost_usd), 0.0) AS cost_usd FROM api_calls "
+                    f"{where} AND submission_id IS NOT NULL "
+                    "GROUP BY submission_id", params
+                )
+            }
+            criterion_rows = conn.execute(
+                f"SELECT {criterion_key} AS criterion_key, COUNT(*) AS calls, AVG({tokens}) AS avg_tokens "
+                f"FROM api_calls {success} GROUP BY criterion_key", params
+            ).fetchall()
+            # パーセンタイルはSQLiteで計算できないため、成功した呼び出しの応答時間だけを取得する
+            latencies: Dict[str, List[float]] = {}
+            for row in conn.execute(
+                f"SELECT {criterion_key} AS criterion_key, latency_ms FROM api_calls "
+                f"{success} AND latency_ms IS NOT NULL", params
+            ):
+                latencies.setdefault(str(row["criterion_key"]), []).append(row["latency_ms"])
+
+        criterion_stats = {}
+        for row in criterion_rows:
+            key = str(row["criterion_key"])
+            values = latencies.get(key, [])
+            criterion_stats[key] = {
+                "calls": row["calls"],
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "avg_tokens": row["avg_tokens"],
+            }
+        all_latencies = [value for values in latencies.values() for value in values]
+        scored_tokens = sum(entry["tokens"] for entry in by_submission.values())
+        return {
+            "calls": totals["calls"],
+            "errors": totals["errors"],
+            "retries": totals["retries"],
+            "p50_ms": percentile(all_latencies, 50),
+            "p95_ms": percentile(all_latencies, 95),
+            "prompt_tokens": totals["prompt_tokens"],
+            "completion_tokens": totals["completion_tokens"],
+            "cost_usd": totals["cost_usd"],
+            "submissions": len(by_submission),
+            "tokens_per_submission": scored_tokens / len(by_submission) if by_submission else None,
+            "by_criterion": criterion_stats,
+            "by_submission": by_submission,
+        }
+
+    def clear(self):
+        """記録をすべて削除"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM api_calls")
+
+
+_store: Optional[TelemetryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_telemetry() -> TelemetryStore:
+    """プロセス内で共有するテレメトリの保存先を取得"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TelemetryStore(Path(os.getenv("TELEMETRY_PATH", str(DEFAULT_TELEMETRY_PATH))))
+        return _store
+
+
+@contextmanager
+def track_call(provider: str, model: Optional[str] = None) -> Iterator[CallRecord]:
+    """
+    プロバイダーへの呼び出し（リトライを含む）を計測して記録
+
+    ブロック内で CallRecord.start_attempt / finish_attempt を試行ごとに呼びます。
+    例外が発生した場合もエラーとして記録し、例外はそのまま送出します。
+    """
+    record = CallRecord(provider, model)
+    started = time.monotonic()
+    outcome, error = "success", None
+    try:
+        yield record
+    except Exception as e:
+        outcome, error = "error", str(e)[:500]
+        raise
+    finally:
+        if is_telemetry_enabled():
+            context = current_context()
+            try:
+                get_telemetry().record({
+                    "called_at": datetime.now().isoformat(),
+                    "provider": provider,
+                    "model": record.model,
+                    "operation": context.get("operation", "criterion"),
+                    "criterion_id": context.get("criterion_id"),
+                    "submission_id": context.get("submission_id"),
+                    "result_id": context.get("result_id"),
+                    "latency_ms": record.latency * 1000 if record.latency is not None else None,
+                    "elapsed_ms": (time.monotonic() - started) * 1000,
+                    "prompt_tokens": record.prompt_tokens,
+                    "completion_tokens": record.completion_tokens,
+                    "attempts": record.attempts,
+                    "outcome": outcome,
+                    "error": error,
+                    "cost_usd": estimate_cost(record.model, record.prompt_tokens, record.completion_tokens),
+                })
+            except Exception:
+                # 記録に失敗しても採点は止めない
+                pass
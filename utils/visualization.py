@@ -70,6 +70,31 @@ def create_comparison_chart(results_list: List[List[Dict[str, Any]]],
     
     return fig
 
+def create_correlation_heatmap(correlations) -> go.Figure:
+    """評価項目間の相関係数のヒートマップを作成（correlations は評価項目 × 評価項目の DataFrame）"""
+    labels = [str(label) for label in correlations.columns]
+    values = correlations.to_numpy(dtype=float)
+    
+    fig = go.Figure(data=go.Heatmap(
+        z=values,
+        x=labels,
+        y=labels,
+        zmin=-1,
+        zmax=1,
+        colorscale='RdBu',
+        reversescale=True,
+        text=[[f"{v:.2f}" if v == v else "" for v in row] for row in values],
+        texttemplate="%{text}",
+        hovertemplate="%{y} × %{x}: %{z:.2f}<extra></extra>"
+    ))
+    
+    fig.update_layout(
+        title="評価項目間の相関",
+        font=dict(size=12)
+    )
+    
+    return fig
+
 
 
 